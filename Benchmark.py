@@ -0,0 +1,714 @@
+"""Benchmarks del tracker y de los nodos.
+
+Uso:
+    python Benchmark.py swarm [--segments N] [--leechers N] ...
+    python Benchmark.py load [--connections N] [--duration S] [--servers werkzeug asyncio] [--prefork 2 4]
+    python Benchmark.py plan [--swarms 100 1000 10000] [--numwant N]
+    python Benchmark.py codec [--peers N] [--segments N] [--numwant N]
+    python Benchmark.py pieces [--size MB] [--piece-sizes 10240 65536 ...] [--block-size N] [--pool-size N]
+    python Benchmark.py recover [--progress N] [--peers N] [--log N]
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+
+import Tracker
+import TrackerAsync
+import Wire
+from Bitfield import Bitfield
+from PieceStore import PieceStore
+from TrackerStore import TrackerStore
+
+FILE_NAME = "benchmark.bin"
+
+
+def resetTracker():
+    """Deja el estado global del tracker vacío entre corridas"""
+    Tracker.resetState()
+
+
+def rangePlan(holders, missing, hasProgress):
+    """Planificador original del tracker, reproducido como línea base.
+
+    Sin progreso previo reparte range(numSegments) en rangos contiguos con el
+    algoritmo basado en Counter; con progreso reparte los faltantes en
+    round-robin. Sólo considera peers con al menos el 20% del archivo y asume
+    que tienen cualquier segmento de su rango.
+    """
+    available = sorted(
+        [{"IP": ip, "currentSegments": current, "numSegments": total}
+         for ip, (current, total) in holders.items() if current / total >= 0.2],
+        key=lambda peer: peer["currentSegments"])
+    if not available:
+        return {}
+    if hasProgress:
+        plan = {peer["IP"]: [] for peer in available}
+        for idx, segment in enumerate(missing):
+            plan[available[idx % len(available)]["IP"]].append(segment)
+        return plan
+
+    count = Counter(peer["numSegments"] for peer in available)
+    ranges = []
+    start = -1
+    for num in sorted(count):
+        rangeSize = num - start
+        base_size = rangeSize // count[num]
+        extra = rangeSize % count[num]
+        for i in range(count[num]):
+            end = start + base_size + (1 if i < extra else 0)
+            ranges.append((start + 1, end))
+            start = end
+    # El nodo original recorría range(StartingFile, LastFile)
+    return {peer["IP"]: list(range(first, last)) for peer, (first, last) in zip(available, ranges)}
+
+
+def simulateSwarm(planner, segments, seeders, leechers, upload, download, replan, seed, numwant=None):
+    """Simula un enjambre por rondas y devuelve sus métricas.
+
+    En cada ronda cada seeder/leecher sube como máximo `upload` segmentos y
+    cada leecher tiene a lo sumo `download` solicitudes en curso. Un leecher
+    vuelve a pedir plan al tracker cuando agota sus colas o cada `replan`
+    rondas. Pedir un segmento que la fuente no tiene cuesta la ronda (404).
+
+    "rarest" planifica cada descarga por separado; "balanced" además registra
+    los planes como /downloadFile y descuenta lo entregado como los reportes
+    de progreso, así el tracker conoce la cola de cada fuente.
+    """
+    resetTracker()
+    rng = random.Random(seed)
+    have = {}
+    for i in range(seeders):
+        ip = f"seed-{i}"
+        have[ip] = Bitfield(segments)
+        have[ip].update(range(segments))
+        Tracker.peers[ip] = {"IP": ip, "Files": []}
+        Tracker.indexFile(ip, {"fileName": FILE_NAME, "numSegments": segments, "currentSegments": segments})
+    downloaders = [f"leech-{i}" for i in range(leechers)]
+    for ip in downloaders:
+        have[ip] = Bitfield(segments)
+        Tracker.peers[ip] = {"IP": ip, "Files": []}
+
+    queues = {ip: {} for ip in downloaders}
+    lastPlan = {ip: None for ip in downloaders}
+    finished = {}
+    requests = wasted = 0
+    planningTime = 0.0
+    tick = 0
+
+    while len(finished) < leechers:
+        tick += 1
+        # Planificación
+        for ip in downloaders:
+            if ip in finished:
+                continue
+            if any(queues[ip].values()) and tick - lastPlan[ip] < replan:
+                continue
+            missing = have[ip].missing(segments)
+            started = time.perf_counter()
+            if planner == "range":
+                # El tracker original sólo conocía a los seeders iniciales
+                holders = {source: (segments, segments) for source in have if source.startswith("seed-")}
+                plan = rangePlan(holders, missing, len(have[ip]) > 0)
+            else:
+                plan, _ = Tracker.assignSegments(FILE_NAME, missing, exclude=ip, rng=random.Random(rng.random()),
+                                                 numwant=numwant)
+                if planner == "balanced":
+                    with Tracker.registryLock:
+                        Tracker.setPending((ip, FILE_NAME), {"peersAndLeechers": [
+                            {"IP": source, "segments_to_download": assigned} for source, assigned in plan.items()]})
+            planningTime += time.perf_counter() - started
+            queues[ip] = {source: [s for s in assigned if s not in have[ip]] for source, assigned in plan.items()}
+            lastPlan[ip] = tick
+
+        # Solicitudes de esta ronda
+        incoming = {}
+        for ip in downloaders:
+            if ip in finished:
+                continue
+            sources = [source for source, queue in queues[ip].items() if queue]
+            rng.shuffle(sources)
+            for source in sources[:download]:
+                incoming.setdefault(source, []).append((ip, queues[ip][source][0]))
+
+        # Cada fuente atiende hasta `upload` solicitudes
+        delivered = []
+        for source, pending in incoming.items():
+            rng.shuffle(pending)
+            for ip, segment in pending[:upload]:
+                requests += 1
+                queues[ip][source].pop(0)
+                if segment in have[source]:
+                    delivered.append((ip, segment))
+                else:
+                    wasted += 1
+
+        for ip, segment in delivered:
+            if have[ip].set(segment) and planner != "range":
+                Tracker.announceSegments(ip, FILE_NAME, segments, [segment])
+        if planner == "balanced":
+            for ip in {ip for ip, _ in delivered}:
+                Tracker.releaseDelivered((ip, FILE_NAME), have[ip])
+        for ip in downloaders:
+            if ip not in finished and len(have[ip]) == segments:
+                finished[ip] = tick
+
+        if tick > segments * leechers:
+            break
+
+    times = list(finished.values())
+    return {
+        "completion": max(times) if times else None,
+        "mean": sum(times) / len(times) if times else None,
+        "finished": len(finished),
+        "requests": requests,
+        "wasted": wasted,
+        "planning": planningTime,
+    }
+
+
+def benchSwarm(args):
+    print(f"Enjambre: {args.segments} segmentos, {args.seeders} seeder(s), {args.leechers} leechers, "
+          f"subida {args.upload}/ronda, descarga {args.download}/ronda")
+    print(f"{'planificador':<14}{'ronda final':>12}{'media':>10}{'completos':>11}{'solicitudes':>13}{'404':>8}{'plan (s)':>10}")
+    for planner in ("range", "rarest", "balanced"):
+        result = simulateSwarm(planner, args.segments, args.seeders, args.leechers,
+                               args.upload, args.download, args.replan, args.seed, args.numwant or None)
+        mean = f"{result['mean']:.1f}" if result["mean"] is not None else "-"
+        print(f"{planner:<14}{str(result['completion']):>12}{mean:>10}{result['finished']:>11}"
+              f"{result['requests']:>13}{result['wasted']:>8}{result['planning']:>10.3f}")
+
+
+def seedSwarm(size, segments, seeders, rng, half=False):
+    """Enjambre de `size` peers con el archivo de prueba: `seeders` completos y
+    el resto con una fracción al azar de los segmentos (con `half`, todos con
+    la primera mitad: la otra sólo la tienen los seeders)"""
+    resetTracker()
+    for i in range(size):
+        ip = f"peer-{i}"
+        Tracker.peers[ip] = {"IP": ip, "Files": []}
+        Tracker.peerLastSeen[ip] = time.time()
+        bitfield = Bitfield(segments)
+        if i < seeders:
+            bitfield.update(range(segments))
+        elif half:
+            bitfield.update(range(segments // 2))
+        else:
+            bitfield.update(rng.sample(range(segments), rng.randint(1, segments - 1)))
+        Tracker.indexFile(ip, {"fileName": FILE_NAME, "numSegments": segments, "currentSegments": len(bitfield),
+                               "bitfield": bitfield.encode()})
+
+
+def benchPlan(args):
+    """Tamaño del plan de descarga y tiempo de planificación según el tamaño
+    del enjambre, con todos los peers o con numwant"""
+    rng = random.Random(args.seed)
+    print(f"Plan de descarga: {args.segments} segmentos, {args.seeders} seeder(s), {args.requests} solicitudes")
+    print(f"{'peers':>8}{'numwant':>9}{'peers/plan':>12}{'respuesta (KB)':>16}{'ms/plan':>10}{'sin fuente':>12}")
+    for size in args.swarms:
+        seedSwarm(size, args.segments, args.seeders, rng, args.half)
+        for numwant in (None, args.numwant):
+            planned = sizes = unavailable = 0
+            elapsed = 0.0
+            for request in range(args.requests):
+                started = time.perf_counter()
+                plan, missing = Tracker.assignSegments(FILE_NAME, range(args.segments), exclude=f"leech-{request}",
+                                                       rng=random.Random(rng.random()), numwant=numwant)
+                elapsed += time.perf_counter() - started
+                # Lo mismo que /downloadFile pone en "peersAndLeechers"
+                peers = [{"IP": ip, "currentSegments": args.segments, "numSegments": args.segments,
+                          "segments_to_download": assigned} for ip, assigned in plan.items() if assigned]
+                planned += len(peers)
+                sizes += len(json.dumps(peers))
+                unavailable += len(missing)
+            label = "todos" if numwant is None else str(numwant)
+            print(f"{size:>8}{label:>9}{planned / args.requests:>12.1f}{sizes / args.requests / 1024:>16.1f}"
+                  f"{elapsed / args.requests * 1000:>10.1f}{unavailable / args.requests:>12.1f}")
+    resetTracker()
+
+
+def timeCall(function, value, repeat):
+    """Microsegundos por llamada"""
+    started = time.perf_counter()
+    for _ in range(repeat):
+        function(value)
+    return (time.perf_counter() - started) / repeat * 1e6
+
+
+def benchCodec(args):
+    """Bytes en la red y CPU de codificación/decodificación de las llamadas más
+    frecuentes al tracker: JSON vs la codificación compacta (ver Wire)"""
+    rng = random.Random(args.seed)
+    resetTracker()
+    ips = [f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}" for i in range(1, args.peers + 1)]
+    for i, ip in enumerate(ips):
+        Tracker.peers[ip] = {"IP": ip, "Files": []}
+        Tracker.peerLastSeen[ip] = time.time()
+        bitfield = Bitfield(args.segments)
+        if i < args.seeders:
+            bitfield.update(range(args.segments))
+        else:
+            bitfield.update(rng.sample(range(args.segments), rng.randint(1, args.segments - 1)))
+        Tracker.indexFile(ip, {"fileName": FILE_NAME, "numSegments": args.segments, "currentSegments": len(bitfield),
+                               "bitfield": bitfield.encode()})
+    leecher = ips[-1]
+    client = Tracker.app.test_client()
+
+    def response(method, path, payload):
+        """Cuerpo de la misma respuesta del tracker en JSON y en la codificación compacta"""
+        bodies = []
+        for accept in (Wire.JSON_TYPE, Wire.CONTENT_TYPE):
+            random.seed(args.seed)
+            bodies.append(client.open(path, method=method, json=payload, headers={"Accept": accept}).data)
+        return bodies
+
+    # Lo que envía un nodo: el mismo cuerpo en los dos formatos
+    received = Bitfield(args.segments)
+    received.update(rng.sample(range(args.segments), args.segments // 2))
+    ranges = []
+    for segment in received.present():
+        if ranges and ranges[-1][1] == segment:
+            ranges[-1][1] = segment + 1
+        else:
+            ranges.append([segment, segment + 1])
+    progress = {"IP": leecher, "fileName": FILE_NAME, "total_segments": args.segments, "ranges": ranges}
+    announce = {"IP": leecher, "fileName": FILE_NAME, "numSegments": args.segments}
+
+    messages = [
+        ("downloadFile (resp.)", *response("POST", "/downloadFile",
+                                           {"fileName": FILE_NAME, "IP": leecher, "numwant": args.numwant})),
+        ("addFile (resp.)", *response("PUT", f"/addFile/{leecher}", {"addedFiles": []})),
+        ("heartbeat (resp.)", *response("POST", "/heartbeat", {"IP": leecher})),
+        ("progressBatch (pet.)", json.dumps(progress).encode(), Wire.packb(progress)),
+        ("updatePeers (pet.)", json.dumps(dict(announce, bitfield=received.encode())).encode(),
+         Wire.packb(dict(announce, bitfield=received.toBytes()))),
+    ]
+    resetTracker()
+
+    implementation = "msgpack (extensión C)" if Wire.msgpack is not None else "Wire (Python puro)"
+    print(f"{args.peers} peers, {args.segments} segmentos, numwant {args.numwant}; compacta = {implementation}")
+    print(f"{'mensaje':<22}{'JSON (B)':>10}{'compacta (B)':>14}{'ahorro':>8}"
+          f"{'cod. JSON/comp. (µs)':>24}{'dec. JSON/comp. (µs)':>24}")
+    for label, jsonBody, compactBody in messages:
+        jsonValue = json.loads(jsonBody)
+        compactValue = Wire.unpackb(compactBody)
+        encode = (timeCall(lambda value: json.dumps(value).encode(), jsonValue, args.repeat),
+                  timeCall(Wire.packb, compactValue, args.repeat))
+        decode = (timeCall(json.loads, jsonBody, args.repeat), timeCall(Wire.unpackb, compactBody, args.repeat))
+        saved = 1 - len(compactBody) / len(jsonBody)
+        print(f"{label:<22}{len(jsonBody):>10}{len(compactBody):>14}{saved:>8.0%}"
+              f"{f'{encode[0]:.1f} / {encode[1]:.1f}':>24}{f'{decode[0]:.1f} / {decode[1]:.1f}':>24}")
+
+
+# Mezcla de peticiones de la prueba de carga: sobre todo anuncios de progreso,
+# algunos heartbeats y de vez en cuando un plan de descarga
+LOAD_MIX = (("announce", 0.80), ("heartbeat", 0.15), ("plan", 0.05))
+
+
+def parseMix(text):
+    """"announce=0.9,heartbeat=0.1" -> (("announce", 0.9), ("heartbeat", 0.1))"""
+    mix = []
+    for item in text.split(","):
+        kind, _, weight = item.partition("=")
+        if kind not in ("announce", "heartbeat", "plan"):
+            raise argparse.ArgumentTypeError(f"tipo de petición desconocido: {kind}")
+        mix.append((kind, float(weight or 1)))
+    return tuple(mix)
+
+
+def seedTracker(segments, seeders):
+    """Tracker vacío con `seeders` peers que tienen completo el archivo de prueba"""
+    resetTracker()
+    for i in range(seeders):
+        ip = f"seed-{i}"
+        Tracker.peers[ip] = {"IP": ip, "Files": []}
+        Tracker.indexFile(ip, {"fileName": FILE_NAME, "numSegments": segments, "currentSegments": segments})
+        Tracker.persistPeer(ip)
+        Tracker.persistHolder(ip, FILE_NAME)
+
+
+def benchServe(args):
+    """Servidor de prueba que lanza `load` en otro proceso"""
+    # El registro por petición de werkzeug no es parte del modelo de servidor
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    if args.prefork:
+        # Los procesos del modo prefork parten del estado sembrado en una base temporal
+        Tracker.STATE_DB = os.path.join(tempfile.mkdtemp(prefix="tracker-bench-"), "state.db")
+        Tracker.store = TrackerStore(Tracker.STATE_DB)
+        seedTracker(args.segments, args.seeders)
+        Tracker.store.conn.close()
+        Tracker.store = None
+        resetTracker()
+        Tracker.runPrefork("127.0.0.1", args.port, args.prefork, server=args.server, workers=args.workers)
+        return
+    seedTracker(args.segments, args.seeders)
+    if args.server == "asyncio":
+        TrackerAsync.serve(Tracker.app, "127.0.0.1", args.port, workers=args.workers)
+    else:
+        from werkzeug.serving import run_simple
+        run_simple("127.0.0.1", args.port, Tracker.app, threaded=True)
+
+
+async def httpRequest(reader, writer, path, payload):
+    """POST con JSON sobre una conexión keep-alive. Devuelve (estado, el servidor la cierra)"""
+    body = json.dumps(payload).encode()
+    writer.write(f"POST {path} HTTP/1.1\r\nHost: tracker\r\nContent-Type: application/json\r\n"
+                 f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+    await writer.drain()
+    head = await reader.readuntil(b"\r\n\r\n")
+    lines = head.split(b"\r\n")
+    status = int(lines[0].split(b" ", 2)[1])
+    length = 0
+    close = False
+    for line in lines[1:]:
+        name, _, value = line.partition(b":")
+        name = name.strip().lower()
+        if name == b"content-length":
+            length = int(value)
+        elif name == b"connection":
+            close = b"close" in value.lower()
+    await reader.readexactly(length)
+    return status, close
+
+
+async def openConnection(port, limiter):
+    # Abrir miles de conexiones a la vez desborda la cola de listen del servidor
+    async with limiter:
+        for _ in range(100):
+            try:
+                return await asyncio.open_connection("127.0.0.1", port)
+            except OSError:
+                await asyncio.sleep(0.1)
+    raise ConnectionError(f"no se pudo conectar al puerto {port}")
+
+
+async def loadClient(index, port, args, limiter, connected, start, results):
+    ip = f"load-{index}"
+    rng = random.Random(index)
+    kinds = [kind for kind, _ in args.mix]
+    weights = [weight for _, weight in args.mix]
+    reader, writer = await openConnection(port, limiter)
+    _, close = await httpRequest(reader, writer, "/enterNetwork", {"IP": ip, "Files": []})
+    if close:
+        writer.close()
+        reader, writer = await openConnection(port, limiter)
+    connected.append(index)
+    await start.wait()
+    if args.think:
+        # Cada peer anuncia a su ritmo; si todos arrancan juntos sólo se mide la ráfaga inicial
+        await asyncio.sleep(rng.uniform(0, args.think))
+
+    while time.perf_counter() < results["deadline"]:
+        kind = rng.choices(kinds, weights)[0]
+        if kind == "announce":
+            request = ("/updateDownloadProgress", {"IP": ip, "fileName": FILE_NAME,
+                                                   "segment": rng.randrange(args.segments),
+                                                   "total_segments": args.segments})
+        elif kind == "heartbeat":
+            request = ("/heartbeat", {"IP": ip})
+        else:
+            request = ("/downloadFile", {"IP": ip, "fileName": FILE_NAME})
+        started = time.perf_counter()
+        try:
+            status, close = await httpRequest(reader, writer, *request)
+        except (OSError, asyncio.IncompleteReadError):
+            results["errors"] += 1
+            close = True
+        else:
+            results["latencies"].append(time.perf_counter() - started)
+            if status != 200:
+                results["errors"] += 1
+        if close:
+            writer.close()
+            results["reconnects"] += 1
+            reader, writer = await openConnection(port, limiter)
+        if args.think:
+            await asyncio.sleep(rng.expovariate(1 / args.think))
+    writer.close()
+
+
+async def loadTest(port, args):
+    limiter = asyncio.Semaphore(64)
+    connected = []
+    start = asyncio.Event()
+    results = {"latencies": [], "errors": 0, "reconnects": 0, "deadline": 0.0}
+    clients = [asyncio.ensure_future(loadClient(index, port, args, limiter, connected, start, results))
+               for index in range(args.connections)]
+    # Se mide sólo con todas las conexiones abiertas
+    while len(connected) < args.connections:
+        failed = [client for client in clients if client.done() and client.exception()]
+        if failed:
+            raise failed[0].exception()
+        await asyncio.sleep(0.05)
+    results["deadline"] = time.perf_counter() + args.duration
+    start.set()
+    await asyncio.gather(*clients)
+    return results
+
+
+def freePort():
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def runLoad(server, args, prefork=0):
+    port = freePort()
+    command = [sys.executable, os.path.abspath(__file__), "serve", "--server", server, "--port", str(port),
+               "--segments", str(args.segments), "--seeders", str(args.seeders), "--workers", str(args.workers),
+               "--prefork", str(prefork)]
+    # Nuevo grupo de procesos, para terminar también a los hijos del modo prefork
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                               start_new_session=True)
+    try:
+        for _ in range(300):
+            if process.poll() is not None:
+                raise RuntimeError(f"el servidor {server} terminó al arrancar")
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=1).close()
+                break
+            except OSError:
+                time.sleep(0.1)
+        return asyncio.run(loadTest(port, args))
+    finally:
+        try:
+            os.killpg(process.pid, 15)
+        except (AttributeError, OSError):
+            process.terminate()
+        process.wait()
+
+
+def benchSeed(args):
+    """Nodo de prueba que lanza `pieces` en otro proceso: comparte el mismo
+    archivo con cada tamaño de fragmento, como bench-<tamaño>"""
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    import Node
+    for size in args.piece_sizes:
+        Node.piece_stores[f"bench-{size}"] = PieceStore.seed(args.file, size)
+    from werkzeug.serving import run_simple
+    run_simple("127.0.0.1", args.port, Node.app, threaded=True)
+
+
+def benchPieces(args):
+    """Throughput de descarga por loopback según el tamaño de fragmento, con
+    los fragmentos grandes pedidos en bloques"""
+    import Node
+    Node.BLOCK_SIZE = args.block_size
+    Node.POOL_SIZE = args.pool_size
+    workdir = tempfile.mkdtemp(prefix="pieces-bench-")
+    source = os.path.join(workdir, "source.bin")
+    fileSize = args.size * 1024 * 1024
+    with open(source, "wb") as f:
+        f.write(random.Random(args.seed).randbytes(fileSize))
+    with open(source, "rb") as f:
+        expected = hashlib.blake2b(f.read()).hexdigest()
+
+    port = freePort()
+    command = [sys.executable, os.path.abspath(__file__), "seed", "--port", str(port), "--file", source,
+               "--piece-sizes", *map(str, args.piece_sizes)]
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    Node.PEER_PORT = port
+    try:
+        for _ in range(300):
+            if process.poll() is not None:
+                raise RuntimeError("el nodo de prueba terminó al arrancar")
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=1).close()
+                break
+            except OSError:
+                time.sleep(0.1)
+
+        print(f"Archivo de {args.size} MB por loopback; bloques de {args.block_size // 1024} KB, "
+              f"{Node.PIPELINE_DEPTH} en vuelo; tamaño adaptativo: {Node.segment_size_for(fileSize) // 1024} KB; "
+              f"conexiones: {f'{args.pool_size} keep-alive' if args.pool_size > 0 else 'una por petición'}")
+        print(f"{'fragmento':>10}{'fragmentos':>12}{'peticiones':>12}{'segundos':>10}{'MB/s':>8}"
+              f"{'ms/petición':>13}{'ok':>4}")
+        for size in args.piece_sizes:
+            target = os.path.join(workdir, f"download-{size}")
+            store = PieceStore.create(target + ".pieces", (fileSize + size - 1) // size, size, fileSize)
+            requests = sum(-(-store.pieceLength(index) // args.block_size) if size > args.block_size else 1
+                           for index in range(store.numPieces))
+            started = time.perf_counter()
+            for index in range(store.numPieces):
+                Node.fetch_segment("127.0.0.1", f"bench-{size}", index, store)
+            elapsed = time.perf_counter() - started
+            store.finish(target).close()
+            with open(target, "rb") as f:
+                ok = hashlib.blake2b(f.read()).hexdigest() == expected
+            os.remove(target)
+            print(f"{size // 1024:>8} K{store.numPieces:>12}{requests:>12}{elapsed:>10.2f}"
+                  f"{args.size / elapsed:>8.1f}{elapsed / requests * 1000:>13.2f}{'sí' if ok else 'NO':>4}")
+    finally:
+        process.terminate()
+        process.wait()
+        os.remove(source)
+        os.rmdir(workdir)
+
+
+def benchLoad(args):
+    print(f"Carga: {args.connections} conexiones keep-alive durante {args.duration}s, "
+          f"mezcla {', '.join(f'{kind} {weight:g}' for kind, weight in args.mix)}")
+    if args.think:
+        print(f"Pausa media entre peticiones de cada conexión: {args.think}s "
+              f"(~{args.connections / args.think:.0f} req/s ofrecidas)")
+    else:
+        print("Sin pausas entre peticiones: mide el rendimiento máximo")
+    print(f"{'servidor':<14}{'req/s':>8}{'p50 (ms)':>11}{'p99 (ms)':>11}{'errores':>9}{'reconexiones':>14}")
+    runs = [(server, 0) for server in args.servers]
+    runs += [(server, processes) for server in args.servers for processes in args.prefork]
+    for server, processes in runs:
+        results = runLoad(server, args, processes)
+        label = f"{server} x{processes}" if processes else server
+        latencies = sorted(results["latencies"])
+        if latencies:
+            p50 = latencies[len(latencies) // 2] * 1000
+            p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000
+        else:
+            p50 = p99 = float("nan")
+        print(f"{label:<14}{len(latencies) / args.duration:>8.0f}{p50:>11.1f}{p99:>11.1f}"
+              f"{results['errors']:>9}{results['reconnects']:>14}")
+
+
+def benchRecover(args):
+    """Tiempo de arranque del tracker (recoverState) con `--progress` descargas
+    en curso y `--peers` peers en la instantánea, más `--log` cambios sin compactar"""
+    rng = random.Random(args.seed)
+    now = time.time()
+    ips = [f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}" for i in range(args.peers)]
+    length = (args.segments + 7) // 8
+    with tempfile.TemporaryDirectory(prefix="tracker-bench-") as directory:
+        path = os.path.join(directory, "state.db")
+        store = TrackerStore(path)
+        with store.transaction():
+            for ip in ips:
+                store.put("peer", ip, "", {"peer": {"IP": ip}, "lastSeen": now})
+            for i in range(args.progress):
+                store.put("progress", ips[i % len(ips)], f"file-{i}",
+                          {"total_segments": args.segments, "last_update": now}, rng.randbytes(length))
+        store.compact()
+        with store.transaction():
+            for i in rng.sample(range(args.progress), min(args.log, args.progress)):
+                store.put("progress", ips[i % len(ips)], f"file-{i}",
+                          {"total_segments": args.segments, "last_update": now}, rng.randbytes(length))
+        store.conn.close()
+        
+        print(f"Recuperación: {args.peers} peers, {args.progress} progresos de {args.segments} segmentos, "
+              f"{args.log} entradas en el log")
+        print(f"{'corrida':>8}{'arranque (s)':>14}{'1ª lectura (µs)':>17}")
+        Tracker.store = TrackerStore(path)
+        keys = [(ips[i % len(ips)], f"file-{i}") for i in rng.sample(range(args.progress), min(1000, args.progress))]
+        for run in range(args.repeat):
+            resetTracker()
+            started = time.perf_counter()
+            Tracker.recoverState()
+            elapsed = time.perf_counter() - started
+            # Los progresos quedan crudos hasta que se leen (ver ProgressTable)
+            started = time.perf_counter()
+            for key in keys:
+                Tracker.progressSnapshot(key)
+            first = (time.perf_counter() - started) / len(keys) * 1e6 if keys else 0.0
+            print(f"{run + 1:>8}{elapsed:>14.3f}{first:>17.1f}")
+        Tracker.store.conn.close()
+        Tracker.store = None
+        resetTracker()
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Benchmarks del sistema P2P")
+    sub = parser.add_subparsers(dest="benchmark", required=True)
+
+    swarm = sub.add_parser("swarm", help="tiempo de completado del enjambre: rangos vs rarest-first vs con carga")
+    swarm.add_argument("--segments", type=int, default=400)
+    swarm.add_argument("--seeders", type=int, default=1)
+    swarm.add_argument("--leechers", type=int, default=20)
+    swarm.add_argument("--upload", type=int, default=4)
+    swarm.add_argument("--download", type=int, default=8)
+    swarm.add_argument("--replan", type=int, default=10)
+    swarm.add_argument("--seed", type=int, default=1)
+    swarm.add_argument("--numwant", type=int, default=0, help="peers por plan; 0 = todos")
+    swarm.set_defaults(run=benchSwarm)
+
+    load = sub.add_parser("load", help="req/s y latencia p99 del tracker: werkzeug vs asyncio")
+    load.add_argument("--connections", type=int, default=500)
+    load.add_argument("--duration", type=float, default=10.0)
+    load.add_argument("--servers", nargs="+", choices=("werkzeug", "asyncio"), default=["werkzeug", "asyncio"])
+    load.add_argument("--mix", type=parseMix, default=LOAD_MIX,
+                      help="pesos por tipo de petición, p. ej. announce=0.9,heartbeat=0.1")
+    load.add_argument("--think", type=float, default=0.0,
+                      help="pausa media (s) entre peticiones de una conexión; 0 = sin pausa")
+    load.add_argument("--segments", type=int, default=1000)
+    load.add_argument("--seeders", type=int, default=20)
+    load.add_argument("--workers", type=int, default=Tracker.WORKERS)
+    load.add_argument("--prefork", type=int, nargs="*", default=[],
+                      help="además, medir el modo prefork con estos números de procesos")
+    load.set_defaults(run=benchLoad)
+
+    plan = sub.add_parser("plan", help="tamaño y costo del plan de descarga según el enjambre: todos vs numwant")
+    plan.add_argument("--swarms", type=int, nargs="+", default=[100, 1000, 10000])
+    plan.add_argument("--numwant", type=int, default=Tracker.DEFAULT_NUMWANT)
+    plan.add_argument("--segments", type=int, default=400)
+    plan.add_argument("--seeders", type=int, default=2)
+    plan.add_argument("--requests", type=int, default=20)
+    plan.add_argument("--seed", type=int, default=1)
+    plan.add_argument("--half", action="store_true",
+                      help="los peers incompletos tienen todos la primera mitad del archivo")
+    plan.set_defaults(run=benchPlan)
+
+    codec = sub.add_parser("codec", help="bytes en la red y CPU por mensaje: JSON vs codificación compacta")
+    codec.add_argument("--peers", type=int, default=500)
+    codec.add_argument("--segments", type=int, default=2000)
+    codec.add_argument("--seeders", type=int, default=5)
+    codec.add_argument("--numwant", type=int, default=Tracker.DEFAULT_NUMWANT)
+    codec.add_argument("--repeat", type=int, default=200)
+    codec.add_argument("--seed", type=int, default=1)
+    codec.set_defaults(run=benchCodec)
+
+    pieces = sub.add_parser("pieces", help="throughput de descarga por loopback según el tamaño de fragmento")
+    pieces.add_argument("--size", type=int, default=32, help="tamaño del archivo en MB")
+    pieces.add_argument("--piece-sizes", type=int, nargs="+",
+                        default=[10240, 64 * 1024, 256 * 1024, 1024 * 1024, 4 * 1024 * 1024])
+    pieces.add_argument("--block-size", type=int, default=256 * 1024)
+    pieces.add_argument("--pool-size", type=int, default=8,
+                        help="conexiones keep-alive por host (0 = una conexión por petición)")
+    pieces.add_argument("--seed", type=int, default=1)
+    pieces.set_defaults(run=benchPieces)
+
+    seed = sub.add_parser("seed", help="nodo de prueba usado por `pieces`")
+    seed.add_argument("--port", type=int, required=True)
+    seed.add_argument("--file", required=True)
+    seed.add_argument("--piece-sizes", type=int, nargs="+", required=True)
+    seed.set_defaults(run=benchSeed)
+
+    recover = sub.add_parser("recover", help="tiempo de arranque del tracker según el estado guardado")
+    recover.add_argument("--progress", type=int, default=100000)
+    recover.add_argument("--peers", type=int, default=1000)
+    recover.add_argument("--segments", type=int, default=500)
+    recover.add_argument("--log", type=int, default=1000)
+    recover.add_argument("--repeat", type=int, default=3)
+    recover.add_argument("--seed", type=int, default=1)
+    recover.set_defaults(run=benchRecover)
+
+    serve = sub.add_parser("serve", help="servidor de prueba usado por `load`")
+    serve.add_argument("--server", choices=("werkzeug", "asyncio"), default="asyncio")
+    serve.add_argument("--port", type=int, required=True)
+    serve.add_argument("--segments", type=int, default=1000)
+    serve.add_argument("--seeders", type=int, default=20)
+    serve.add_argument("--workers", type=int, default=Tracker.WORKERS)
+    serve.add_argument("--prefork", type=int, default=0)
+    serve.set_defaults(run=benchServe)
+
+    args = parser.parse_args(argv)
+    args.run(args)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,126 @@
+import base64
+
+
+class Bitfield:
+    """Conjunto compacto de segmentos: el bit i indica si el segmento i está presente.
+
+    Los bits se guardan con el más significativo primero dentro de cada byte,
+    igual que el mensaje 'bitfield' de BitTorrent.
+    """
+
+    __slots__ = ("size", "bits", "count")
+
+    def __init__(self, size=0, data=None):
+        self.size = size = int(size) if size and size > 0 else 0
+        length = (size + 7) >> 3
+        self.count = 0
+        if not data:
+            self.bits = bytearray(length)
+        elif len(data) == length:
+            # Caso común (bitfield recibido del mismo tamaño): copia directa
+            self.bits = bytearray(data)
+            padding = (length << 3) - size
+            if padding:
+                self.bits[-1] &= (0xFF << padding) & 0xFF
+            self.count = int.from_bytes(self.bits, "big").bit_count()
+        else:
+            self.bits = bytearray(length)
+            self.merge(data)
+
+    def _grow(self, size):
+        if size > self.size:
+            self.size = size
+            needed = (size + 7) // 8
+            if needed > len(self.bits):
+                self.bits.extend(bytes(needed - len(self.bits)))
+
+    def __contains__(self, index):
+        if index < 0 or index >= self.size:
+            return False
+        return bool(self.bits[index >> 3] & (0x80 >> (index & 7)))
+
+    def __len__(self):
+        return self.count
+
+    def set(self, index):
+        """Marca un segmento. Devuelve True si no estaba marcado."""
+        if index < 0:
+            return False
+        self._grow(index + 1)
+        mask = 0x80 >> (index & 7)
+        if self.bits[index >> 3] & mask:
+            return False
+        self.bits[index >> 3] |= mask
+        self.count += 1
+        return True
+
+    def update(self, segments):
+        """Marca varios segmentos. Devuelve cuántos eran nuevos."""
+        return sum(1 for segment in segments if self.set(segment))
+
+    def merge(self, other):
+        """OR bit a bit con otro Bitfield o con sus bytes crudos"""
+        if isinstance(other, Bitfield):
+            data = other.bits
+            self._grow(other.size)
+        else:
+            data = bytes(other)
+            if len(data) > len(self.bits):
+                self._grow(len(data) * 8)
+        if not data:
+            return
+        length = len(self.bits)
+        merged = int.from_bytes(self.bits, "big") | (int.from_bytes(data, "big") << (8 * (length - len(data))))
+        # Los bits de relleno del último byte no cuentan como segmentos
+        padding = length * 8 - self.size
+        if padding:
+            merged &= ~((1 << padding) - 1)
+        self.bits[:] = merged.to_bytes(length, "big")
+        self.count = merged.bit_count()
+
+    def present(self):
+        """Lista ordenada de segmentos presentes"""
+        result = []
+        for byteIndex, byte in enumerate(self.bits):
+            if byte:
+                base = byteIndex << 3
+                for bit in range(8):
+                    if byte & (0x80 >> bit):
+                        result.append(base + bit)
+        return result
+
+    def missing(self, size=None):
+        """Lista ordenada de segmentos ausentes en [0, size)"""
+        size = self.size if size is None else size
+        result = []
+        bits = self.bits
+        for byteIndex in range((size + 7) // 8):
+            byte = bits[byteIndex] if byteIndex < len(bits) else 0
+            if byte == 0xFF:
+                continue
+            base = byteIndex << 3
+            for bit in range(min(8, size - base)):
+                if not byte & (0x80 >> bit):
+                    result.append(base + bit)
+        return result
+
+    def isComplete(self, size=None):
+        size = self.size if size is None else size
+        return size > 0 and self.count >= size and not self.missing(size)
+
+    def copy(self):
+        return Bitfield(self.size, self.bits)
+
+    def toBytes(self):
+        return bytes(self.bits)
+
+    def encode(self):
+        """Representación base64 para enviar en JSON"""
+        return base64.b64encode(self.bits).decode("ascii")
+
+    @classmethod
+    def decode(cls, size, encoded):
+        """Bitfield a partir de su base64 (JSON) o de sus bytes crudos (codificación compacta)"""
+        if isinstance(encoded, (bytes, bytearray)):
+            return cls(size, encoded)
+        return cls(size, base64.b64decode(encoded) if encoded else None)
@@ -0,0 +1,58 @@
+import bisect
+import hashlib
+
+
+class HashRing:
+    """Anillo de hashing consistente: asigna cada clave (nombre de archivo) a un nodo.
+
+    Cada nodo ocupa `replicas` puntos virtuales del anillo y una clave le
+    pertenece al primer punto que le sigue. Al agregar un nodo sólo cambian de
+    dueño las claves que caen en sus puntos, más o menos 1/N del total, y todas
+    pasan al nodo nuevo.
+    """
+
+    def __init__(self, nodes=(), replicas=128):
+        self.replicas = replicas
+        self.points = []
+        self.owners = []
+        self.nodes = set()
+        for node in nodes:
+            self.add(node)
+
+    @staticmethod
+    def hash(key):
+        return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big")
+
+    def add(self, node):
+        if node in self.nodes:
+            return
+        self.nodes.add(node)
+        for replica in range(self.replicas):
+            point = self.hash(f"{node}#{replica}")
+            index = bisect.bisect(self.points, point)
+            self.points.insert(index, point)
+            self.owners.insert(index, node)
+
+    def remove(self, node):
+        if node not in self.nodes:
+            return
+        self.nodes.discard(node)
+        kept = [(point, owner) for point, owner in zip(self.points, self.owners) if owner != node]
+        self.points = [point for point, _ in kept]
+        self.owners = [owner for _, owner in kept]
+
+    def owner(self, key):
+        """Nodo dueño de la clave, o None si el anillo está vacío"""
+        if not self.points:
+            return None
+        index = bisect.bisect(self.points, self.hash(key))
+        return self.owners[index % len(self.points)]
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def __contains__(self, node):
+        return node in self.nodes
+
+    def __iter__(self):
+        return iter(sorted(self.nodes))
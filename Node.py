@@ -1,12 +1,20 @@
+import bisect
+import heapq
 import json
-from flask import Flask, jsonify, send_file, request
+from flask import Flask, jsonify, request
 import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 import requests
 import os
 import sys
 import signal
 from pathlib import Path
+from urllib.parse import quote
+from Bitfield import Bitfield
+from HashRing import HashRing
+from PieceStore import PieceStore
+import Wire
 
 def listar_archivos_locales():
     print("\n" + "="*50)
@@ -17,10 +25,10 @@ def listar_archivos_locales():
     segmentos = []
     
     for item in os.listdir('.'):
-        if os.path.isfile(item) and not item.endswith('.py') and not item.endswith('.json'):
+        if item.endswith('.pieces') and PieceStore.exists(item):
+            segmentos.append(item[:-len('.pieces')])
+        elif os.path.isfile(item) and not item.endswith(('.py', '.json', '.pieces', '.bitfield')):
             archivos.append(item)
-        elif os.path.isdir(item) and item.endswith("Segment"):
-            segmentos.append(item)
     
     if not archivos and not segmentos:
         print("No hay archivos en este peer.")
@@ -34,16 +42,10 @@ def listar_archivos_locales():
     
     if segmentos:
         print("\nArchivos fragmentados:")
-        for i, s in enumerate(segmentos, 1):
-            if os.path.exists(s):
-                files_in_dir = [f for f in os.listdir(s) if f.startswith('fragment_')]
-                file_name = s.replace('Segment', '')
-                total_size = 0
-                for f in files_in_dir:
-                    f_path = os.path.join(s, f)
-                    if os.path.exists(f_path):
-                        total_size += os.path.getsize(f_path)
-                print(f"  {i}) {file_name} - {len(files_in_dir)} fragmentos ({total_size} bytes)")
+        for i, file_name in enumerate(segmentos, 1):
+            store = open_store(file_name)
+            if store is not None:
+                print(f"  {i}) {file_name} - {len(store.bitfield)}/{store.numPieces} fragmentos ({store.size()} bytes)")
     
     print("="*50)
     return archivos, segmentos
@@ -54,6 +56,265 @@ print(f"\n[Node] Iniciando nodo en IP: 192.168.1.64:5001")
 # Variable global para controlar descargas activas
 active_downloads = {}
 
+# Archivos anunciados al tracker, para volver a anunciarlos si nos expulsa
+shared_files = {}
+
+# Trackers del cluster ("host:puerto"). Cada archivo lo atiende el tracker que
+# le asigna el anillo de hashing consistente; los trackers responden con la
+# lista vigente cuando cambia
+tracker_ring = HashRing(os.environ.get("TRACKER_SHARDS", "192.168.1.68:5000").split(","))
+
+def tracker_url(fileName=None):
+    """URL del tracker dueño del archivo (sin archivo, la del primero del cluster)"""
+    shard = tracker_ring.owner(fileName) if fileName is not None else next(iter(tracker_ring))
+    return f"http://{shard}"
+
+def tracker_urls():
+    return [f"http://{shard}" for shard in tracker_ring]
+
+def update_shards(shards):
+    """Adopta la lista de trackers que informó el cluster"""
+    global tracker_ring
+    if shards and set(shards) != tracker_ring.nodes:
+        tracker_ring = HashRing(shards)
+        print(f"[Node] Trackers del cluster: {list(tracker_ring)}")
+
+# Conexiones HTTP reutilizables: una Session por host remoto ("host:puerto")
+# que mantiene hasta NODE_POOL_SIZE conexiones keep-alive abiertas hacia él,
+# compartida por las descargas, el reporte de progreso y las llamadas al
+# tracker. Con NODE_POOL_SIZE=0 cada petición abre su propia conexión
+POOL_SIZE = int(os.environ.get("NODE_POOL_SIZE", 8))
+sessions = {}
+sessions_lock = threading.Lock()
+
+def session_for(url):
+    """Session compartida hacia el host de `url`"""
+    host = url.split("/", 3)[2]
+    with sessions_lock:
+        session = sessions.get(host)
+        if session is None:
+            session = sessions[host] = requests.Session()
+            # pool_block=False: si se agotan, se abren conexiones extra que no se guardan
+            adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+        return session
+
+def http_request(method, url, **kwargs):
+    """requests.request sobre la conexión reutilizable del host"""
+    if POOL_SIZE <= 0:
+        return requests.request(method, url, **kwargs)
+    return session_for(url).request(method, url, **kwargs)
+
+# Codificación de las llamadas al tracker: "msgpack" la pide en cada petición
+# y, una vez que el tracker respondió en ese formato, le envía también los
+# cuerpos así; "json" usa siempre JSON (trackers antiguos sólo hablan JSON).
+# Por omisión sólo se usa msgpack si está instalada su extensión en C: la
+# versión en Python de Wire es más lenta que el JSON de la biblioteca estándar
+TRACKER_ENCODING = os.environ.get("NODE_TRACKER_ENCODING", "msgpack" if Wire.msgpack is not None else "json")
+compact_trackers = set()
+
+def compact_body(payload):
+    """Cuerpo para la codificación compacta: bitfields en bytes crudos, no en base64"""
+    payload = dict(payload)
+    for field in ("Files", "addedFiles"):
+        if field in payload:
+            payload[field] = [dict(file, bitfield=Bitfield.decode(file["numSegments"], file["bitfield"]).toBytes())
+                              if isinstance(file.get("bitfield"), str) else file
+                              for file in payload[field]]
+    return payload
+
+def tracker_call(method, url, **kwargs):
+    """Petición a un tracker negociando la codificación (ver TRACKER_ENCODING)"""
+    base = url.split("/", 3)[2]
+    if TRACKER_ENCODING == "msgpack":
+        headers = dict(kwargs.pop("headers", None) or {})
+        headers["Accept"] = f"{Wire.CONTENT_TYPE}, {Wire.JSON_TYPE};q=0.9"
+        if base in compact_trackers and kwargs.get("json") is not None:
+            kwargs["data"] = Wire.packb(compact_body(kwargs.pop("json")))
+            headers["Content-Type"] = Wire.CONTENT_TYPE
+        kwargs["headers"] = headers
+    response = http_request(method, url, **kwargs)
+    if response.headers.get("Content-Type", "").startswith(Wire.CONTENT_TYPE):
+        compact_trackers.add(base)
+    return response
+
+# Listas de peers que el tracker envía con las IPs compactas (ver compactPeers)
+PEER_FIELDS = ("peers", "peersAndLeechers")
+
+def expand_peer(entry):
+    """IP en texto de un peer compacto (la IP sola o un dict con su "IP")"""
+    if isinstance(entry, dict) and "IP" in entry:
+        return dict(entry, IP=Wire.unpackPeer(entry["IP"])[0])
+    return Wire.unpackPeer(entry)[0]
+
+def expand_peers(value):
+    """Vuelve a texto las IPs compactas (6 bytes) de las listas de peers de una
+    respuesta del tracker. Los demás bytes (bitfields) quedan como están"""
+    if isinstance(value, dict):
+        return {key: [expand_peer(entry) for entry in item]
+                if key in PEER_FIELDS and isinstance(item, list) else expand_peers(item)
+                for key, item in value.items()}
+    if isinstance(value, list):
+        return [expand_peers(item) for item in value]
+    return value
+
+def tracker_payload(response):
+    """Cuerpo de una respuesta del tracker, en JSON o en la codificación compacta"""
+    if response.headers.get("Content-Type", "").startswith(Wire.CONTENT_TYPE):
+        return expand_peers(Wire.unpackb(response.content))
+    return response.json()
+
+def tracker_request(method, path, fileName=None, **kwargs):
+    """Petición al tracker dueño del archivo.
+
+    Si responde 421 el cluster cambió desde la última vez: se actualiza la
+    lista de trackers y se reintenta una vez con el nuevo dueño.
+    """
+    response = tracker_call(method, f"{tracker_url(fileName)}{path}", **kwargs)
+    if response.status_code == 421:
+        update_shards(tracker_payload(response).get("shards"))
+        response = tracker_call(method, f"{tracker_url(fileName)}{path}", **kwargs)
+    return response
+
+def enter_network(deviceIp, files):
+    """Se anuncia en cada tracker del cluster con los archivos que le tocan a ese tracker"""
+    responses = {}
+    for url in tracker_urls():
+        owned = [file for file in files if tracker_url(file["fileName"]) == url]
+        try:
+            response = tracker_call("POST", f"{url}/enterNetwork", json={"IP": deviceIp, "Files": owned}, timeout=10)
+            update_shards(tracker_payload(response).get("shards"))
+            responses[url] = response
+        except Exception as e:
+            print(f"[Node] ✗ No se pudo entrar a la red en {url}: {e}")
+    return responses
+
+# Copia local del catálogo de cada tracker. Se actualiza pidiendo sólo lo
+# que cambió desde la última versión vista (?since=); si no cambió nada el
+# tracker responde 304 sin cuerpo
+catalog_cache = {}
+catalog_lock = threading.Lock()
+
+def sync_catalog(url, kind):
+    """Devuelve el catálogo "files" (conjunto de nombres) o "peers" ({IP: peer})
+    de un tracker, al día"""
+    path, field = ("/allFiles", "Files") if kind == "files" else ("/peers", "peers")
+    with catalog_lock:
+        cached = catalog_cache.get((url, kind))
+    response = http_request("GET", f"{url}{path}", params={"since": cached["version"] if cached else ""}, timeout=5)
+    if response.status_code == 304 and cached:
+        return cached["items"]
+    response.raise_for_status()
+    data = response.json()
+    
+    full = data["full"] or not cached
+    if kind == "files":
+        items = set() if full else set(cached["items"])
+        items.difference_update(data["removed"])
+        items.update(data[field])
+    else:
+        items = {} if full else dict(cached["items"])
+        for ip in data["removed"]:
+            items.pop(ip, None)
+        items.update((peer["IP"], peer) for peer in data[field])
+    with catalog_lock:
+        catalog_cache[(url, kind)] = {"version": data["version"], "items": items}
+    return items
+
+def file_info(filename):
+    """Metadatos de un archivo según su tracker (segmentos, tamaño, peers que lo
+    tienen, disponibilidad), o None si nadie lo tiene"""
+    # El nombre va escapado completo: puede traer "?", "#", "%" o espacios
+    response = tracker_request("GET", f"/file/{quote(filename, safe='')}", filename, timeout=5)
+    if response.status_code == 404:
+        return None
+    response.raise_for_status()
+    return tracker_payload(response)
+
+def all_files():
+    """Archivos disponibles en todo el cluster"""
+    files = set()
+    for url in tracker_urls():
+        files.update(sync_catalog(url, "files"))
+    return sorted(files)
+
+def search_files(prefix="", q=None, cursor=None, limit=20):
+    """Una página del catálogo de todo el cluster: hasta `limit` nombres en orden
+    alfabético posteriores a `cursor`. Devuelve (nombres, cursor de la página
+    siguiente o None, total de archivos en la red)"""
+    if not prefix and not q:
+        # Sin búsqueda se pagina la copia local del catálogo: volver a listar
+        # sólo trae lo que cambió (o un 304)
+        files = all_files()
+        start = bisect.bisect_right(files, cursor) if cursor is not None else 0
+        names = files[start:start + limit]
+        more = start + limit < len(files)
+        return names, (names[-1] if more else None), len(files)
+    params = {"prefix": prefix, "limit": limit}
+    if q:
+        params["q"] = q
+    if cursor is not None:
+        params["cursor"] = cursor
+    pages = []
+    more = False
+    total = 0
+    for url in tracker_urls():
+        data = http_request("GET", f"{url}/allFiles", params=params, timeout=5).json()
+        pages.append(data["Files"])
+        more = more or data["next"] is not None
+        # Cada archivo le pertenece a un solo tracker: los totales se suman
+        total += data.get("total", 0)
+    # Cada tracker devuelve su página ordenada: se mezclan y se corta en `limit`
+    names = list(heapq.merge(*pages))
+    if len(names) > limit:
+        names, more = names[:limit], True
+    return names, (names[-1] if more and names else None), total
+
+def browse_files(choose=False, page_size=20):
+    """Muestra el catálogo por páginas, con búsqueda opcional ("texto" busca
+    dentro del nombre, "texto*" por prefijo). Con `choose` devuelve el archivo
+    elegido por número, o None"""
+    term = input("Buscar (Enter = todos): ").strip()
+    if term.endswith("*"):
+        prefix, q = term[:-1], None
+    else:
+        prefix, q = "", term or None
+    
+    shown = []
+    cursor = None
+    while True:
+        names, cursor, total = search_files(prefix, q, cursor, page_size)
+        if not shown:
+            print(f"[Node] Archivos en la red: {total}")
+        if not shown and not names:
+            print("[Node] ✗ No hay archivos que coincidan")
+            return None
+        for name in names:
+            shown.append(name)
+            print(f"  {len(shown)}) {name}")
+        
+        options = ["número = elegir"] if choose else []
+        if cursor is not None:
+            options.append("s = siguiente página")
+        options.append("Enter = volver")
+        answer = input(f"\n[{', '.join(options)}]: ").strip().lower()
+        if answer == "s" and cursor is not None:
+            continue
+        if choose and answer.isdigit() and 1 <= int(answer) <= len(shown):
+            return shown[int(answer) - 1]
+        if answer:
+            print("[Node] ✗ Opción inválida")
+        return None
+
+# Cada cuánto se avisa al tracker que el nodo sigue vivo (segundos) mientras
+# no diga otra cosa: cada respuesta de heartbeat trae su "interval"
+HEARTBEAT_INTERVAL = 30
+MIN_HEARTBEAT_INTERVAL = 1
+
+# Máximo de peers que el tracker debe incluir en cada plan de descarga
+NUMWANT = 30
+
 def signal_handler(signum, frame):
     print(f"\n[Node] Señal recibida: {signum}. Guardando estado de descargas...")
     save_download_state()
@@ -83,36 +344,248 @@ def load_download_state():
         print(f"[Node] Error al cargar estado: {e}")
     return {}
 
+def encode_ranges(segments):
+    """Codifica segmentos como rangos [inicio, fin) por longitud de corrida"""
+    ranges = []
+    for segment in sorted(segments):
+        if ranges and ranges[-1][1] == segment:
+            ranges[-1][1] = segment + 1
+        else:
+            ranges.append([segment, segment + 1])
+    return ranges
+
+class ProgressReporter:
+    """Agrupa los segmentos guardados y los reporta al tracker en lote.
+
+    En lugar de un POST por segmento, acumula los segmentos de cada archivo y
+    los envía a /updateDownloadProgressBatch como rangos cuando se juntan
+    `max_pending` segmentos o pasan `interval` segundos desde el último envío.
+    También acumula los bytes y segundos medidos por peer de origen y los
+    reporta a /reportThroughput en cada envío periódico.
+
+    Cada lote va al tracker dueño del archivo; el rendimiento, a todos.
+    """
+
+    def __init__(self, ip, max_pending=256, interval=2.0):
+        self.ip = ip
+        self.max_pending = max_pending
+        self.interval = interval
+        self.pending = {}
+        self.transfers = {}
+        self.lock = threading.Lock()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def add(self, filename, segment, total_segments):
+        with self.lock:
+            entry = self.pending.setdefault(filename, {"segments": set(), "total_segments": total_segments})
+            entry["segments"].add(segment)
+            entry["total_segments"] = total_segments
+            full = len(entry["segments"]) >= self.max_pending
+        if full:
+            self.flush(filename)
+
+    def record_transfer(self, peer_ip, nbytes, seconds):
+        """Registra cuánto tardó un peer en entregarnos un segmento"""
+        with self.lock:
+            totals = self.transfers.setdefault(peer_ip, [0, 0.0])
+            totals[0] += nbytes
+            totals[1] += seconds
+
+    def flush_throughput(self):
+        with self.lock:
+            transfers, self.transfers = self.transfers, {}
+        if not transfers:
+            return
+        payload = {
+            "IP": self.ip,
+            "measurements": [{"IP": peer_ip, "bytes": nbytes, "seconds": seconds}
+                             for peer_ip, (nbytes, seconds) in transfers.items()]
+        }
+        for url in tracker_urls():
+            try:
+                tracker_call("POST", f"{url}/reportThroughput", json=payload, timeout=5)
+            except:
+                pass
+
+    def discard(self, filename):
+        """Olvida los segmentos pendientes de una descarga ya completada"""
+        with self.lock:
+            self.pending.pop(filename, None)
+
+    def flush(self, filename=None):
+        """Envía los segmentos pendientes (de un archivo o de todos)"""
+        with self.lock:
+            names = [filename] if filename is not None else list(self.pending)
+            batches = {name: self.pending.pop(name) for name in names if name in self.pending}
+        
+        for name, entry in batches.items():
+            payload = {
+                "IP": self.ip,
+                "fileName": name,
+                "total_segments": entry["total_segments"],
+                "ranges": encode_ranges(entry["segments"])
+            }
+            try:
+                tracker_request("POST", "/updateDownloadProgressBatch", name,
+                                json=payload, timeout=5)
+            except:
+                # Reintentar en el próximo envío sin perder los segmentos
+                with self.lock:
+                    entry_now = self.pending.setdefault(name, {"segments": set(), "total_segments": entry["total_segments"]})
+                    entry_now["segments"] |= entry["segments"]
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self.flush()
+            self.flush_throughput()
+
+progress_reporter = ProgressReporter("192.168.1.64")
+
+def heartbeat_loop(deviceIp):
+    """Avisa periódicamente al tracker que el nodo sigue vivo, con el intervalo
+    que pide el tracker (el menor, si hay varios en el cluster)"""
+    interval = HEARTBEAT_INTERVAL
+    while True:
+        time.sleep(interval)
+        expired = False
+        intervals = []
+        for url in tracker_urls():
+            try:
+                response = tracker_call("POST", f"{url}/heartbeat", json={"IP": deviceIp}, timeout=5)
+                if response.status_code == 404:
+                    expired = True
+                else:
+                    payload = tracker_payload(response)
+                    update_shards(payload.get("shards"))
+                    if payload.get("interval"):
+                        intervals.append(float(payload["interval"]))
+            except:
+                pass
+        if intervals:
+            interval = max(min(intervals), MIN_HEARTBEAT_INTERVAL)
+        if expired:
+            # Algún tracker nos expulsó por inactividad (o es nuevo): volver a
+            # unirse; los que aún nos conocen no cambian nada
+            enter_network(deviceIp, list(shared_files.values()))
+            print("[Node] Reingreso a la red tras expiración en el tracker")
+
+# Tamaño de los fragmentos (piezas) con que se comparten los archivos: la
+# potencia de dos que deja unos TARGET_SEGMENTS fragmentos, entre
+# MIN_SEGMENT_SIZE y MAX_SEGMENT_SIZE. NODE_SEGMENT_SIZE fija uno para todos.
+# SEGMENT_SIZE es el que usaban los peers que no anuncian "segmentSize"
+SEGMENT_SIZE = 10240
+MIN_SEGMENT_SIZE = 64 * 1024
+MAX_SEGMENT_SIZE = 4 * 1024 * 1024
+TARGET_SEGMENTS = 512
+FIXED_SEGMENT_SIZE = int(os.environ.get("NODE_SEGMENT_SIZE", 0))
+
+# Los fragmentos más grandes que BLOCK_SIZE se piden por bloques, hasta
+# PIPELINE_DEPTH bloques en vuelo a la vez, y cada uno se escribe en su lugar
+BLOCK_SIZE = int(os.environ.get("NODE_BLOCK_SIZE", 256 * 1024))
+PIPELINE_DEPTH = int(os.environ.get("NODE_PIPELINE_DEPTH", 4))
+block_pool = ThreadPoolExecutor(max_workers=PIPELINE_DEPTH, thread_name_prefix="block")
+
+# Puerto en el que los peers sirven sus fragmentos
+PEER_PORT = int(os.environ.get("NODE_PEER_PORT", 5001))
+
+def segment_size_for(file_size):
+    """Tamaño de fragmento para un archivo de `file_size` bytes"""
+    if FIXED_SEGMENT_SIZE:
+        return FIXED_SEGMENT_SIZE
+    size = MIN_SEGMENT_SIZE
+    while size < MAX_SEGMENT_SIZE and file_size > size * TARGET_SEGMENTS:
+        size *= 2
+    return size
+
+# Fragmentos de cada archivo compartido o en descarga. Viven en un único archivo
+# de datos "<archivo>.pieces" junto a un bitfield de los presentes (ver PieceStore)
+piece_stores = {}
+stores_lock = threading.Lock()
+
+def store_path(filename):
+    return filename + ".pieces"
+
+def open_store(filename, total_segments=None, segment_size=None, file_size=None):
+    """PieceStore de un archivo: el ya abierto o el que quedó en disco. Si no hay
+    ninguno y se indica `total_segments`, crea uno con el tamaño de fragmento
+    del plan de descarga (o, si no viene, el que anunció el tracker); si no,
+    devuelve None"""
+    with stores_lock:
+        store = piece_stores.get(filename)
+        if store is None and PieceStore.exists(store_path(filename)):
+            store = piece_stores[filename] = PieceStore.open(store_path(filename))
+    if store is not None or not total_segments:
+        return store
+    
+    info = {"segmentSize": segment_size, "fileSize": file_size} if segment_size else file_info(filename) or {}
+    with stores_lock:
+        if filename not in piece_stores:
+            piece_stores[filename] = PieceStore.create(store_path(filename), total_segments,
+                                                       info.get("segmentSize") or SEGMENT_SIZE, info.get("fileSize"))
+        return piece_stores[filename]
+
+def drop_store(filename):
+    """Cierra y borra el almacén de un archivo, si existe"""
+    # Con stores_lock tomado nadie vuelve a abrir el almacén mientras se borra
+    with stores_lock:
+        store = piece_stores.pop(filename, None)
+        if store is None and PieceStore.exists(store_path(filename)):
+            store = PieceStore.open(store_path(filename))
+        if store is not None:
+            store.remove()
+
 # ✅ 3️⃣ AGREGA ESTA FUNCIÓN (DEBAJO DE load_download_state())
 def sync_local_fragments(filename):
     """Sincroniza fragmentos locales con el tracker"""
-    segment_dir = filename + "Segment"
-    if not os.path.exists(segment_dir):
+    store = open_store(filename)
+    if store is None:
         return
 
-    fragments = []
-    for f in os.listdir(segment_dir):
-        if f.startswith("fragment_") and f.endswith(".part"):
-            try:
-                fragments.append(int(f.split("_")[1].split(".")[0]))
-            except:
-                pass
+    fragments = store.present()
 
     if filename in active_downloads:
         payload = {
             "IP": "192.168.1.64",
             "fileName": filename,
-            "fragments": sorted(fragments),
+            "fragments": fragments,
             "total_segments": active_downloads[filename]["total_segments"]
         }
 
         try:
-            requests.post("http://192.168.1.68:5000/syncFragments",
-                          json=payload, timeout=5)
+            tracker_request("POST", "/syncFragments", filename,
+                            json=payload, timeout=5)
             print(f"[Node] Fragmentos sincronizados con tracker ({len(fragments)})")
         except:
             print("[Node] No se pudo sincronizar con tracker")
 
+def fetch_segment(peer_ip, filename, segment, store):
+    """Descarga un fragmento de un peer y lo escribe en su posición del almacén.
+    
+    Un fragmento más grande que BLOCK_SIZE se pide por bloques (offset y
+    length) en paralelo, así los fragmentos de varios MB no esperan una
+    única respuesta. Devuelve los bytes recibidos; lanza una excepción si
+    algún bloque falla, y entonces el fragmento no queda marcado.
+    """
+    url = f"http://{peer_ip}:{PEER_PORT}/downloadFile"
+    length = store.pieceLength(segment)
+    
+    def fetch(start):
+        payload = {"fileName": filename, "segmentNumber": segment}
+        if length > BLOCK_SIZE:
+            payload.update(offset=start, length=BLOCK_SIZE)
+        response = http_request("POST", url, json=payload, timeout=30)
+        response.raise_for_status()
+        store.writeBlock(segment, start, response.content)
+        return len(response.content)
+    
+    starts = range(0, max(length, 1), BLOCK_SIZE)
+    received = fetch(0) if len(starts) == 1 else sum(block_pool.map(fetch, starts))
+    if store.fileSize is not None and received != length:
+        raise ValueError(f"fragmento {segment} incompleto: {received} de {length} bytes")
+    store.mark(segment)
+    return received
+
 @app.route('/downloadFile', methods=['POST'])
 def download_file():
     try:
@@ -132,17 +605,31 @@ def download_file():
         if ".." in fileName or "/" in fileName:
             return jsonify({"error": "Nombre de archivo inválido"}), 400
         
-        segment_dir = fileName + "Segment"
+        # Bloque opcional dentro del fragmento
+        offset = data.get("offset", 0)
+        length = data.get("length")
+        if not isinstance(offset, int) or offset < 0 or (length is not None and (not isinstance(length, int) or length < 0)):
+            return jsonify({"error": "Campos 'offset'/'length' inválidos"}), 400
+        
+        store = open_store(fileName)
         
-        if not os.path.exists(segment_dir):
+        if store is None:
             return jsonify({"error": "El archivo no existe en este peer"}), 404
         
-        file_path = os.path.join(segment_dir, f"fragment_{segmentNumber}.part")
+        try:
+            fragment = store.read(segmentNumber, offset, length)
+        except ValueError:
+            if not store.closed:
+                raise
+            # Se cerró mientras tanto (la descarga terminó y se renombró): se
+            # lee del almacén que lo reemplazó
+            store = open_store(fileName)
+            fragment = store.read(segmentNumber, offset, length) if store is not None else None
         
-        if not os.path.exists(file_path):
+        if fragment is None:
             return jsonify({"error": "El fragmento no existe"}), 404
         
-        return send_file(file_path, as_attachment=True)
+        return app.response_class(fragment, mimetype="application/octet-stream")
         
     except Exception as e:
         return jsonify({"error": f"Error interno: {str(e)}"}), 500
@@ -157,98 +644,118 @@ def segmentFile(filesList):
             print(f"[Node] ERROR: El archivo {file} no existe")
             continue
         
-        segment_dir = file + "Segment"
-        
-        # Limpiar directorio si ya existe
-        if os.path.exists(segment_dir):
-            print(f"[Node] Directorio {segment_dir} ya existe, recreando...")
-            import shutil
-            shutil.rmtree(segment_dir)
+        # Un archivo completo se comparte en su lugar: los fragmentos se leen
+        # del original, sin copiarlo. Un almacén anterior ya no hace falta
+        if PieceStore.exists(store_path(file)):
+            print(f"[Node] Eliminando almacén anterior {store_path(file)}")
+        drop_store(file)
         
-        os.makedirs(segment_dir, exist_ok=True)
-        
-        fragments = 0
-        with open(file, 'rb') as archivo:
-            while True:
-                fragmento = archivo.read(10240)
-                if not fragmento:
-                    break
-                
-                ruta_fragmento = os.path.join(segment_dir, f"fragment_{fragments}.part")
-                
-                with open(ruta_fragmento, 'wb') as f:
-                    f.write(fragmento)
-                
-                fragments += 1
-        
-        print(f"[Node] Archivo {file} segmentado en {fragments} fragmentos")
-        
-        currentFragments.append({
-            "fileName": file,
-            "numSegments": fragments,
-            "currentSegments": fragments
-        })
+        announcement = seed_file(file, segment_size_for(os.path.getsize(file)))
+        print(f"[Node] Archivo {file} compartido en su lugar: {announcement['numSegments']} fragmentos")
+        currentFragments.append(announcement)
     
+    save_shared_manifest()
     return currentFragments
 
+# Archivos completos que este nodo comparte en su lugar (con la opción 1 o al
+# terminar una descarga): nombre -> tamaño de fragmento. Sólo viven en
+# piece_stores, así que se guardan aquí para reabrirlos y volver a
+# anunciarlos al reiniciar
+SHARED_MANIFEST = "shared_files.json"
+
+def seed_file(file, segment_size):
+    """Comparte un archivo completo en su lugar y devuelve su anuncio para el
+    tracker: exactamente qué segmentos tenemos (todos)"""
+    store = PieceStore.seed(file, segment_size)
+    with stores_lock:
+        previous = piece_stores.get(file)
+        piece_stores[file] = store
+    if previous is not None and previous is not store:
+        previous.close()
+    return seed_announcement(file, store)
+
+def seed_announcement(file, store):
+    return {
+        "fileName": file,
+        "numSegments": store.numPieces,
+        "currentSegments": store.numPieces,
+        "fileSize": store.fileSize or 0,
+        "segmentSize": store.pieceSize,
+        "bitfield": store.bitfield.encode()
+    }
+
+def save_shared_manifest():
+    """Guarda la lista de archivos compartidos en su lugar"""
+    with stores_lock:
+        manifest = {name: store.pieceSize for name, store in piece_stores.items() if store.inPlace}
+    try:
+        with open(SHARED_MANIFEST + ".tmp", 'w') as f:
+            json.dump(manifest, f)
+        os.replace(SHARED_MANIFEST + ".tmp", SHARED_MANIFEST)
+    except Exception as e:
+        print(f"[Node] Error al guardar archivos compartidos: {e}")
+
+def restore_shared_files():
+    """Reabre los archivos compartidos antes del reinicio y devuelve sus anuncios.
+    Los que ya no existen se olvidan"""
+    try:
+        with open(SHARED_MANIFEST, 'r') as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return []
+    except Exception as e:
+        print(f"[Node] Error al leer archivos compartidos: {e}")
+        return []
+    
+    announcements = []
+    for name, segment_size in manifest.items():
+        if not os.path.isfile(name):
+            print(f"[Node] {name} ya no existe, se deja de compartir")
+            continue
+        announcement = seed_file(name, segment_size)
+        shared_files[name] = announcement
+        announcements.append(announcement)
+    save_shared_manifest()
+    if announcements:
+        print(f"[Node] Archivos compartidos restaurados: {len(announcements)}")
+    return announcements
+
 def reconstruct_file(filename):
     """Reconstruye el archivo desde los fragmentos"""
     try:
-        segment_dir = filename + "Segment"
-        
-        if not os.path.exists(segment_dir):
-            print(f"[Node] ERROR: No existe directorio para {filename}")
-            return False
-        
-        # Obtener todos los fragmentos
-        fragments = []
-        for f in os.listdir(segment_dir):
-            if f.startswith('fragment_') and f.endswith('.part'):
-                try:
-                    segment_num = int(f.split('_')[1].split('.')[0])
-                    fragments.append((segment_num, os.path.join(segment_dir, f)))
-                except:
-                    pass
+        store = open_store(filename)
         
-        if not fragments:
+        if store is None:
             print(f"[Node] ERROR: No hay fragmentos para {filename}")
             return False
         
         # ✅ 5️⃣ BLOQUEA RECONSTRUCCIÓN INCOMPLETA
-        # Verificar que tenemos todos los fragmentos esperados
-        if filename in active_downloads:
-            total_segments = active_downloads[filename].get("total_segments", 0)
-            if total_segments > 0:
-                expected = set(range(total_segments))
-                actual = set([x[0] for x in fragments])
-                
-                if expected != actual:
-                    print(f"[Node] ❌ Archivo incompleto, no se puede reconstruir")
-                    print(f"[Node] Faltan fragmentos: {sorted(expected - actual)}")
-                    return False
-        
-        # Ordenar por número de fragmento
-        fragments.sort(key=lambda x: x[0])
-        
-        # Reconstruir archivo
-        print(f"[Node] Reconstruyendo {filename} con {len(fragments)} fragmentos...")
+        if not store.isComplete():
+            print(f"[Node] ❌ Archivo incompleto, no se puede reconstruir")
+            print(f"[Node] Faltan fragmentos: {store.missing()}")
+            return False
         
-        with open(filename, 'wb') as output_file:
-            for segment_num, fragment_path in fragments:
-                with open(fragment_path, 'rb') as f:
-                    output_file.write(f.read())
+        # Los fragmentos ya están en su posición: el almacén pasa a ser el
+        # archivo final con un rename y se sigue compartiendo desde ahí
+        print(f"[Node] Completando {filename} ({store.numPieces} fragmentos)...")
+        with stores_lock:
+            store = piece_stores[filename] = store.finish(filename)
+        # El archivo terminado se sigue compartiendo, también tras un reinicio
+        shared_files[filename] = seed_announcement(filename, store)
+        save_shared_manifest()
         
         file_size = os.path.getsize(filename)
         print(f"[Node] ✓ Archivo reconstruido: {filename} ({file_size} bytes)")
         
         # Notificar al tracker que la descarga está completa
+        progress_reporter.discard(filename)
         try:
             complete_data = {
                 "IP": "192.168.1.64",
                 "fileName": filename
             }
-            requests.post("http://192.168.1.68:5000/completeDownload", 
-                         json=complete_data, timeout=5)
+            tracker_request("POST", "/completeDownload", filename,
+                            json=complete_data, timeout=5)
         except:
             print("[Node] No se pudo notificar al tracker")
         
@@ -266,44 +773,9 @@ def reconstruct_file(filename):
 def check_download_complete(filename):
     """Verifica si todos los fragmentos están presentes para un archivo"""
     try:
-        segment_dir = filename + "Segment"
-        
-        if not os.path.exists(segment_dir):
-            return False
-        
-        # Buscar información del tracker sobre el archivo
-        try:
-            response = requests.get("http://192.168.1.68:5000/allFiles", timeout=5)
-            if response.status_code == 200:
-                # Obtener información de peers para conocer el total de segmentos
-                peers_response = requests.get("http://192.168.1.68:5000/peers", timeout=5)
-                if peers_response.status_code == 200:
-                    peers = peers_response.json()
-                    for peer in peers:
-                        for file_info in peer.get("Files", []):
-                            if file_info.get("fileName") == filename:
-                                total_segments = file_info.get("numSegments", 0)
-                                
-                                # Contar fragmentos locales
-                                local_fragments = []
-                                for f in os.listdir(segment_dir):
-                                    if f.startswith('fragment_') and f.endswith('.part'):
-                                        try:
-                                            num = int(f.split('_')[1].split('.')[0])
-                                            local_fragments.append(num)
-                                        except:
-                                            pass
-                                
-                                # Verificar si tenemos todos los fragmentos
-                                if total_segments > 0 and len(local_fragments) >= total_segments:
-                                    # Verificar que sean consecutivos desde 0
-                                    local_fragments.sort()
-                                    if local_fragments == list(range(total_segments)):
-                                        return True
-        except:
-            pass
-        
-        return False
+        # El bitfield del almacén dice qué fragmentos están escritos
+        store = open_store(filename)
+        return store is not None and store.isComplete()
         
     except Exception as e:
         print(f"[Node] Error en check_download_complete: {e}")
@@ -338,16 +810,24 @@ def resume_interrupted_downloads():
                 
                 # Solicitar reanudación al tracker
                 try:
+                    info = file_info(filename)
+                    if info is None or info["availability"]["max"] == 0:
+                        print(f"[Node] Ningún peer tiene {filename} por ahora, se reintentará después")
+                        continue
+                    if info["availability"]["unavailable"]:
+                        print(f"[Node] {info['availability']['unavailable']} segmentos de {filename} no tienen fuente")
+                    
                     resume_data = {
                         "IP": "192.168.1.64",
-                        "fileName": filename
+                        "fileName": filename,
+                        "numwant": NUMWANT
                     }
                     
-                    response = requests.post("http://192.168.1.68:5000/resumeDownload",
-                                           json=resume_data, timeout=10)
+                    response = tracker_request("POST", "/resumeDownload", filename,
+                                               json=resume_data, timeout=10)
                     
                     if response.status_code == 200:
-                        resume_info = response.json()
+                        resume_info = tracker_payload(response)
                         
                         if resume_info.get('status') == 'resume_available':
                             print(f"[Node] Reanudación disponible para {filename}")
@@ -374,10 +854,16 @@ def resume_interrupted_downloads():
     except Exception as e:
         print(f"[Node] Error en resume_interrupted_downloads: {e}")
 
+def report_unavailable(filename, plan):
+    """Avisa de los segmentos que ningún peer tiene: la descarga no podrá
+    completarse hasta que alguien los anuncie"""
+    unavailable = plan.get('unavailable_segments') or []
+    if unavailable:
+        print(f"[Node] ⚠ {len(unavailable)} segmentos de {filename} no tienen fuente por ahora")
+
 def download_missing_segments(filename, resume_info):
     """Descarga los segmentos faltantes de una descarga interrumpida"""
     try:
-        deviceIp = "192.168.1.64"
         missing_segments = resume_info.get('missing_segments', [])
         peers = resume_info.get('peers', [])
         
@@ -390,9 +876,10 @@ def download_missing_segments(filename, resume_info):
             return False
         
         print(f"[Node] Descargando {len(missing_segments)} segmentos faltantes...")
+        report_unavailable(filename, resume_info)
         
-        segment_dir = filename + "Segment"
-        os.makedirs(segment_dir, exist_ok=True)
+        store = open_store(filename, resume_info.get('total_segments', 0),
+                           peers[0].get('segmentSize'), peers[0].get('fileSize'))
         
         # Registrar descarga activa
         active_downloads[filename] = {
@@ -401,60 +888,45 @@ def download_missing_segments(filename, resume_info):
         }
         save_download_state()
         
+        # Peer asignado a cada segmento según el plan del tracker
+        source_for_segment = {}
+        for peer in peers:
+            for segment in peer.get('segments_to_download', []):
+                source_for_segment.setdefault(segment, peer)
+        
         # Descargar cada segmento faltante
         downloaded_count = 0
         for segment in missing_segments:
             # ✅ 6️⃣ EVITA REDESCARGAR FRAGMENTOS EXISTENTES
-            segment_path = os.path.join(segment_dir, f"fragment_{segment}.part")
-            if os.path.exists(segment_path):
+            if store.has(segment):
                 print(f"[Node] Segmento {segment} ya existe, saltando")
                 continue
             
-            # Encontrar un peer que pueda proveer este segmento
-            for peer in peers:
-                segments_to_download = peer.get('segments_to_download', [])
-                if segment in segments_to_download:
-                    try:
-                        segment_url = f"http://{peer['IP']}:5001/downloadFile"
-                        segment_data = {
-                            "fileName": filename,
-                            "segmentNumber": segment
-                        }
-                        
-                        print(f"[Node] Descargando segmento {segment} de {peer['IP']}...")
-                        response = requests.post(segment_url, json=segment_data, timeout=30)
-                        
-                        if response.status_code == 200:
-                            # Guardar segmento
-                            with open(segment_path, 'wb') as f:
-                                f.write(response.content)
-                            
-                            print(f"[Node] ✓ Segmento {segment} guardado")
-                            downloaded_count += 1
-                            
-                            # Actualizar progreso en tracker
-                            update_progress = {
-                                "IP": deviceIp,
-                                "fileName": filename,
-                                "segment": segment,
-                                "total_segments": resume_info.get('total_segments', 0)
-                            }
-                            
-                            try:
-                                requests.post("http://192.168.1.68:5000/updateDownloadProgress",
-                                            json=update_progress, timeout=5)
-                            except:
-                                pass
-                            
-                            break  # Segmento descargado, pasar al siguiente
-                        else:
-                            print(f"[Node] Error en segmento {segment}: {response.status_code}")
-                            
-                    except Exception as e:
-                        print(f"[Node] Error al descargar segmento {segment}: {e}")
-                        continue
+            # Encontrar el peer que puede proveer este segmento
+            peer = source_for_segment.get(segment)
+            if peer is None:
+                print(f"[Node] Ningún peer asignado para el segmento {segment}")
+                continue
+            
+            try:
+                print(f"[Node] Descargando segmento {segment} de {peer['IP']}...")
+                started = time.time()
+                # Se guarda directamente en su posición del almacén
+                received = fetch_segment(peer['IP'], filename, segment, store)
+                progress_reporter.record_transfer(peer['IP'], received, time.time() - started)
+                
+                print(f"[Node] ✓ Segmento {segment} guardado")
+                downloaded_count += 1
+                
+                # Actualizar progreso en tracker (en lote)
+                progress_reporter.add(filename, segment, resume_info.get('total_segments', 0))
+                    
+            except Exception as e:
+                print(f"[Node] Error al descargar segmento {segment}: {e}")
+                continue
         
         print(f"[Node] Descargados {downloaded_count}/{len(missing_segments)} segmentos faltantes")
+        progress_reporter.flush(filename)
         
         # Verificar si ahora está completo
         if check_download_complete(filename):
@@ -475,7 +947,6 @@ def download_missing_segments(filename, resume_info):
 def download_file_normal(filename, download_info):
     """Descarga un archivo desde cero"""
     try:
-        deviceIp = "192.168.1.64"
         peers_list = download_info.get('peersAndLeechers', [])
         
         if not peers_list:
@@ -483,9 +954,10 @@ def download_file_normal(filename, download_info):
             return False
         
         print(f"[Node] Descargando {filename} de {len(peers_list)} peer(s)")
+        report_unavailable(filename, download_info)
         
-        segment_dir = filename + "Segment"
-        os.makedirs(segment_dir, exist_ok=True)
+        store = open_store(filename, peers_list[0]['numSegments'],
+                           peers_list[0].get('segmentSize'), peers_list[0].get('fileSize'))
         
         # Registrar descarga activa
         active_downloads[filename] = {
@@ -496,54 +968,34 @@ def download_file_normal(filename, download_info):
         
         # Descargar todos los segmentos
         for peer in peers_list:
+            segments_to_download = peer.get('segments_to_download', [])
             print(f"[Node] Descargando de peer {peer['IP']}")
-            print(f"[Node] Rango: {peer['StartingFile']} a {peer['LastFile']}")
+            print(f"[Node] Segmentos asignados: {len(segments_to_download)}")
             
-            for segment in range(peer['StartingFile'], peer['LastFile']):
+            for segment in segments_to_download:
                 # Verificar si el segmento ya existe
-                segment_path = os.path.join(segment_dir, f"fragment_{segment}.part")
-                if os.path.exists(segment_path):
+                if store.has(segment):
                     print(f"[Node] Segmento {segment} ya existe, saltando")
                     continue
                 
                 try:
-                    segment_url = f"http://{peer['IP']}:5001/downloadFile"
-                    segment_data = {
-                        "fileName": filename,
-                        "segmentNumber": segment
-                    }
-                    
                     print(f"[Node] Descargando segmento {segment}...")
-                    response = requests.post(segment_url, json=segment_data, timeout=30)
+                    started = time.time()
+                    # Se guarda directamente en su posición del almacén
+                    received = fetch_segment(peer['IP'], filename, segment, store)
+                    progress_reporter.record_transfer(peer['IP'], received, time.time() - started)
                     
-                    if response.status_code == 200:
-                        # Guardar segmento
-                        with open(segment_path, 'wb') as f:
-                            f.write(response.content)
-                        
-                        print(f"[Node] ✓ Segmento {segment} guardado")
-                        
-                        # Actualizar progreso en tracker
-                        update_progress = {
-                            "IP": deviceIp,
-                            "fileName": filename,
-                            "segment": segment,
-                            "total_segments": peer['numSegments']
-                        }
-                        
-                        try:
-                            requests.post("http://192.168.1.68:5000/updateDownloadProgress",
-                                        json=update_progress, timeout=5)
-                        except:
-                            pass
-                        
-                    else:
-                        print(f"[Node] Error en segmento {segment}: {response.status_code}")
+                    print(f"[Node] ✓ Segmento {segment} guardado")
+                    
+                    # Actualizar progreso en tracker (en lote)
+                    progress_reporter.add(filename, segment, peer['numSegments'])
                         
                 except Exception as e:
                     print(f"[Node] Error al descargar segmento {segment}: {e}")
                     continue
         
+        progress_reporter.flush(filename)
+        
         # Verificar si la descarga está completa
         if check_download_complete(filename):
             print(f"[Node] ✓ Todos los fragmentos descargados para {filename}")
@@ -564,43 +1016,35 @@ def clientTask():
     global active_downloads
     
     exit_flag = False
-    currentFragments = []
     deviceIp = "192.168.1.64"
     
     print(f"\n[Node] IP del nodo: {deviceIp}")
-    print(f"[Node] Tracker en: 192.168.1.68:5000")
+    print(f"[Node] Trackers en: {', '.join(tracker_ring)}")
     
     # Configurar manejo de señales
     signal.signal(signal.SIGINT, signal_handler)
     signal.signal(signal.SIGTERM, signal_handler)
     
+    # Volver a compartir lo que ya se compartía antes de reiniciar
+    currentFragments = restore_shared_files()
+    
     # Reanudar descargas interrumpidas
     resume_interrupted_downloads()
     
     # Verificar conexión con tracker
     try:
         print("[Node] Probando conexión con tracker...")
-        response = requests.get("http://192.168.1.68:5000/peers", timeout=5)
-        if response.status_code == 200:
-            print(f"[Node] ✓ Conexión exitosa con tracker")
-        else:
-            print(f"[Node] ✗ Error del tracker: {response.status_code}")
+        known_peers = sync_catalog(tracker_url(), "peers")
+        print(f"[Node] ✓ Conexión exitosa con tracker ({len(known_peers)} peer(s) en la red)")
     except Exception as e:
         print(f"[Node] ✗ No se puede conectar al tracker: {e}")
     
-    # Unirse a la red
-    payload = {
-        "IP": deviceIp,
-        "Files": currentFragments
-    }
+    # Unirse a la red (en cada tracker del cluster)
+    responses = enter_network(deviceIp, currentFragments)
+    if responses and all(response.status_code == 201 for response in responses.values()):
+        print("[Node] ✓ Unido exitosamente a la red P2P")
     
-    try:
-        response = requests.post("http://192.168.1.68:5000/enterNetwork", 
-                               json=payload, timeout=10)
-        if response.status_code == 201:
-            print("[Node] ✓ Unido exitosamente a la red P2P")
-    except Exception as e:
-        print(f"[Node] ✗ Error al unirse a la red: {e}")
+    threading.Thread(target=heartbeat_loop, args=(deviceIp,), daemon=True).start()
     
     while not exit_flag:
         try:
@@ -655,16 +1099,22 @@ def clientTask():
                         print("[Node] ✗ No se pudo segmentar el archivo")
                         continue
                     
-                    # Enviar al tracker
-                    newFiles = {"addedFiles": currentFragments}
-                    
-                    response = requests.put(f"http://192.168.1.68:5000/addFile/{deviceIp}", 
-                                          json=newFiles, timeout=10)
+                    # Enviar cada archivo al tracker que es su dueño
+                    byTracker = {}
+                    for file in currentFragments:
+                        byTracker.setdefault(tracker_ring.owner(file["fileName"]), []).append(file)
                     
-                    if response.status_code == 200:
-                        print("[Node] ✓ Archivo agregado exitosamente a la red")
-                    else:
-                        print(f"[Node] ✗ Error del tracker: {response.status_code}")
+                    for files in byTracker.values():
+                        newFiles = {"addedFiles": files}
+                        response = tracker_request("PUT", f"/addFile/{deviceIp}", files[0]["fileName"],
+                                                   json=newFiles, timeout=10)
+                        
+                        if response.status_code == 200:
+                            for file in files:
+                                shared_files[file["fileName"]] = file
+                            print("[Node] ✓ Archivo agregado exitosamente a la red")
+                        else:
+                            print(f"[Node] ✗ Error del tracker: {response.status_code}")
                         
                 except Exception as e:
                     print(f"[Node] ✗ Error: {e}")
@@ -673,70 +1123,42 @@ def clientTask():
                 print("\n[Node] DESCARGAR ARCHIVO DE LA RED")
                 
                 try:
-                    response = requests.get("http://192.168.1.68:5000/allFiles", timeout=5)
+                    desiredFile = browse_files(choose=True)
+                    if desiredFile is None:
+                        continue
+                    
+                    # Verificar si ya está en descarga
+                    if desiredFile in active_downloads:
+                        print(f"[Node] Este archivo ya se está descargando")
+                        continue
+                    
+                    # Solicitar descarga
+                    download_request = {
+                        "fileName": desiredFile,
+                        "IP": deviceIp,
+                        "numwant": NUMWANT
+                    }
+                    
+                    print(f"[Node] Solicitando descarga de: {desiredFile}")
+                    response = tracker_request("POST", "/downloadFile", desiredFile,
+                                               json=download_request, timeout=10)
                     
                     if response.status_code == 200:
-                        available_files = response.json().get('Files', [])
+                        info = tracker_payload(response)
                         
-                        if not available_files:
-                            print("[Node] ✗ No hay archivos disponibles en la red")
-                            continue
-                        
-                        print("\n[Node] Archivos disponibles en la red:")
-                        for i, file in enumerate(available_files, 1):
-                            print(f"  {i}) {file}")
+                        if info.get('mode') == 'resume':
+                            print(f"[Node] Reanudando descarga existente...")
+                            success = download_missing_segments(desiredFile, info.get('information', {}))
+                        else:
+                            print(f"[Node] Iniciando nueva descarga...")
+                            success = download_file_normal(desiredFile, info.get('information', {}))
                         
-                        try:
-                            eleccion = input("\nSeleccione archivo por número: ").strip()
-                            
-                            if not eleccion.isdigit():
-                                print("[Node] ✗ Debe ingresar un número")
-                                continue
-                            
-                            opcion = int(eleccion)
-                            if 1 <= opcion <= len(available_files):
-                                desiredFile = available_files[opcion - 1]
-                            else:
-                                print("[Node] ✗ Número inválido")
-                                continue
-                            
-                            # Verificar si ya está en descarga
-                            if desiredFile in active_downloads:
-                                print(f"[Node] Este archivo ya se está descargando")
-                                continue
-                            
-                            # Solicitar descarga
-                            download_request = {
-                                "fileName": desiredFile,
-                                "IP": deviceIp
-                            }
-                            
-                            print(f"[Node] Solicitando descarga de: {desiredFile}")
-                            response = requests.post("http://192.168.1.68:5000/downloadFile", 
-                                                   json=download_request, timeout=10)
-                            
-                            if response.status_code == 200:
-                                info = response.json()
-                                
-                                if info.get('mode') == 'resume':
-                                    print(f"[Node] Reanudando descarga existente...")
-                                    success = download_missing_segments(desiredFile, info.get('information', {}))
-                                else:
-                                    print(f"[Node] Iniciando nueva descarga...")
-                                    success = download_file_normal(desiredFile, info.get('information', {}))
-                                
-                                if success:
-                                    print(f"[Node] ✓ Descarga completada: {desiredFile}")
-                                else:
-                                    print(f"[Node] ✗ La descarga no se completó")
-                            else:
-                                print(f"[Node] ✗ Error en solicitud: {response.status_code}")
-                                
-                        except Exception as e:
-                            print(f"[Node] ✗ Error: {e}")
-                            
+                        if success:
+                            print(f"[Node] ✓ Descarga completada: {desiredFile}")
+                        else:
+                            print(f"[Node] ✗ La descarga no se completó")
                     else:
-                        print(f"[Node] ✗ Error del tracker: {response.status_code}")
+                        print(f"[Node] ✗ Error en solicitud: {response.status_code}")
                         
                 except Exception as e:
                     print(f"[Node] ✗ Error en descarga: {e}")
@@ -747,17 +1169,7 @@ def clientTask():
             elif select == "4":
                 print("\n[Node] CONSULTANDO ARCHIVOS DISPONIBLES EN LA RED")
                 try:
-                    response = requests.get("http://192.168.1.68:5000/allFiles", timeout=5)
-                    if response.status_code == 200:
-                        files = response.json().get('Files', [])
-                        if files:
-                            print("\n[Node] Archivos disponibles en la red P2P:")
-                            for i, file in enumerate(files, 1):
-                                print(f"  {i}) {file}")
-                        else:
-                            print("[Node] ✗ No hay archivos en la red")
-                    else:
-                        print(f"[Node] ✗ Error: {response.status_code}")
+                    browse_files()
                 except Exception as e:
                     print(f"[Node] ✗ Error: {e}")
                     
@@ -769,10 +1181,9 @@ def clientTask():
                 print("\n[Node] ESTADO DE DESCARGAS ACTIVAS")
                 if active_downloads:
                     for filename, info in active_downloads.items():
-                        segment_dir = filename + "Segment"
-                        if os.path.exists(segment_dir):
-                            fragments = [f for f in os.listdir(segment_dir) if f.startswith('fragment_')]
-                            print(f"  • {filename}: {len(fragments)} fragmentos descargados")
+                        store = open_store(filename)
+                        if store is not None:
+                            print(f"  • {filename}: {len(store.bitfield)}/{store.numPieces} fragmentos descargados")
                 else:
                     print("  [Node] No hay descargas activas")
                     
@@ -797,13 +1208,13 @@ if __name__ == "__main__":
     print("INICIANDO NODO P2P - UBUNTU")
     print("Con reanudación mejorada y sincronización")
     print(f"IP: 192.168.1.64")
-    print(f"Puerto: 5001")
+    print(f"Puerto: {PEER_PORT}")
     print("="*50)
     
     # Iniciar servidor en segundo plano
     server_thread = threading.Thread(
         target=app.run,
-        kwargs={'host': '192.168.1.64', 'port': 5001, 'debug': False, 'threaded': True},
+        kwargs={'host': '192.168.1.64', 'port': PEER_PORT, 'debug': False, 'threaded': True},
         daemon=True
     )
     server_thread.start()
@@ -0,0 +1,261 @@
+import os
+import struct
+import threading
+from contextlib import contextmanager
+
+from Bitfield import Bitfield
+
+# Encabezado del archivo auxiliar: tamaño del archivo (0 = desconocido),
+# tamaño de pieza y número de piezas; le sigue el bitfield crudo
+HEADER = struct.Struct(">QIQ")
+
+
+# Donde no hay pread/pwrite (Windows) se hace lseek y luego read/write, que
+# comparten la posición del descriptor: `lock` (el ioLock del almacén) evita
+# que otro hilo la mueva entre los dos pasos
+
+def _pread(fd, length, offset, lock):
+    if hasattr(os, "pread"):
+        return os.pread(fd, length, offset)
+    with lock:
+        os.lseek(fd, offset, os.SEEK_SET)
+        return os.read(fd, length)
+
+
+def _pwrite(fd, data, offset, lock):
+    if hasattr(os, "pwrite"):
+        return os.pwrite(fd, data, offset)
+    with lock:
+        os.lseek(fd, offset, os.SEEK_SET)
+        return os.write(fd, data)
+
+
+class PieceStore:
+    """Piezas de un archivo guardadas en un único archivo de datos.
+
+    La pieza i ocupa los bytes [i * pieceSize, (i + 1) * pieceSize) del archivo
+    de datos, que se reserva completo al crearlo: su contenido queda igual al
+    del archivo final y al terminar basta con renombrarlo (ver `finish`). Un
+    archivo auxiliar pequeño (`path + ".bitfield"`) guarda qué piezas están
+    escritas, así que una descarga interrumpida se retoma sin recorrer el disco.
+
+    Las lecturas y escrituras van por posición (pread/pwrite): varios hilos
+    pueden leer y escribir piezas distintas a la vez sobre el mismo descriptor.
+    `close` y `finish` esperan a que terminen las que están en curso; después
+    cualquier lectura o escritura lanza ValueError.
+
+    Con `inPlace` el archivo de datos es el propio archivo completo que se
+    comparte (ver `seed`): se abre sólo para lectura y no hay archivo auxiliar.
+    """
+
+    def __init__(self, path, numPieces, pieceSize, fileSize=None, bitfield=None, inPlace=False):
+        self.path = path
+        self.numPieces = numPieces
+        self.pieceSize = pieceSize
+        self.fileSize = fileSize or None
+        self.bitfield = bitfield if bitfield is not None else Bitfield(numPieces)
+        self.inPlace = inPlace
+        self.lock = threading.Lock()
+        self.ioLock = threading.Lock()
+        # Lecturas y escrituras en curso: el descriptor no se cierra debajo de ellas
+        self.users = 0
+        self.idle = threading.Condition(self.lock)
+        if inPlace:
+            self.sidecar = self.sidecarFd = None
+            self.fd = os.open(path, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+        else:
+            self.sidecar = path + ".bitfield"
+            self.fd = os.open(path, os.O_RDWR | os.O_CREAT | getattr(os, "O_BINARY", 0), 0o644)
+            self.sidecarFd = os.open(self.sidecar, os.O_RDWR | os.O_CREAT | getattr(os, "O_BINARY", 0), 0o644)
+
+    @classmethod
+    def create(cls, path, numPieces, pieceSize, fileSize=None):
+        """Archivo de datos nuevo (vacío) del tamaño del archivo completo"""
+        store = cls(path, numPieces, pieceSize, fileSize)
+        os.ftruncate(store.fd, 0)
+        if store.fileSize:
+            store.reserve()
+        os.ftruncate(store.sidecarFd, 0)
+        _pwrite(store.sidecarFd, HEADER.pack(store.fileSize or 0, pieceSize, numPieces) + store.bitfield.toBytes(), 0,
+                store.ioLock)
+        return store
+
+    @classmethod
+    def open(cls, path):
+        """Vuelve a abrir un almacén existente con las piezas que ya tenía"""
+        with open(path + ".bitfield", "rb") as f:
+            raw = f.read()
+        fileSize, pieceSize, numPieces = HEADER.unpack_from(raw)
+        bitfield = Bitfield(numPieces, raw[HEADER.size:])
+        return cls(path, numPieces, pieceSize, fileSize, bitfield)
+
+    @classmethod
+    def seed(cls, path, pieceSize):
+        """Almacén de sólo lectura sobre un archivo completo, sin copiarlo: cada
+        pieza es un rango de bytes del original. Sólo cuesta un stat y un open"""
+        fileSize = os.path.getsize(path)
+        numPieces = (fileSize + pieceSize - 1) // pieceSize
+        bitfield = Bitfield(numPieces, b"\xff" * ((numPieces + 7) >> 3))
+        return cls(path, numPieces, pieceSize, fileSize, bitfield, inPlace=True)
+
+    def reserve(self):
+        """Reserva en disco el tamaño completo del archivo de datos.
+
+        posix_fallocate asigna los bloques de una vez: la descarga no se queda
+        sin espacio a la mitad y el archivo no se fragmenta. Donde no existe (o
+        el sistema de archivos no lo soporta) queda un archivo disperso del
+        tamaño final, que sólo ocupa lo que se va escribiendo.
+        """
+        os.ftruncate(self.fd, self.fileSize)
+        if hasattr(os, "posix_fallocate"):
+            try:
+                os.posix_fallocate(self.fd, 0, self.fileSize)
+            except OSError:
+                pass
+
+    @staticmethod
+    def exists(path):
+        return os.path.exists(path) and os.path.exists(path + ".bitfield")
+
+    def offset(self, index):
+        return index * self.pieceSize
+
+    def pieceLength(self, index):
+        """Bytes de la pieza (la última puede ser más corta)"""
+        if self.fileSize is None:
+            return self.pieceSize
+        return max(0, min(self.pieceSize, self.fileSize - self.offset(index)))
+
+    def has(self, index):
+        return index in self.bitfield
+
+    def read(self, index, start=0, length=None):
+        """Contenido de una pieza presente, o None si no está. Con `start` y
+        `length` sólo ese bloque de la pieza"""
+        if not self.has(index):
+            return None
+        available = max(0, self.pieceLength(index) - start)
+        length = available if length is None else min(length, available)
+        with self.using() as fd:
+            return _pread(fd, length, self.offset(index) + start, self.ioLock)
+
+    def write(self, index, data):
+        """Escribe una pieza completa en su posición y la marca como presente"""
+        self.writeBlock(index, 0, data)
+        return self.mark(index)
+
+    def writeBlock(self, index, start, data):
+        """Escribe un bloque de una pieza, sin marcarla (ver `mark`)"""
+        if self.inPlace:
+            raise ValueError(f"{self.path} se comparte en su lugar y es de sólo lectura")
+        if index < 0 or index >= self.numPieces:
+            raise IndexError(f"Pieza fuera de rango: {index}")
+        with self.using() as fd:
+            _pwrite(fd, data, self.offset(index) + start, self.ioLock)
+
+    def mark(self, index):
+        """Marca una pieza como presente. Devuelve True si no lo estaba.
+
+        Se marca después de escribir todos sus datos: si el proceso muere en
+        medio, la pieza simplemente se vuelve a descargar.
+        """
+        with self.lock:
+            self.checkOpen()
+            # Copia antes de marcar: quien recorra el bitfield no lo ve cambiar
+            bitfield = self.bitfield.copy()
+            if not bitfield.set(index):
+                return False
+            self.bitfield = bitfield
+            byte = index >> 3
+            _pwrite(self.sidecarFd, bitfield.bits[byte:byte + 1], HEADER.size + byte, self.ioLock)
+        return True
+
+    def present(self):
+        return self.bitfield.present()
+
+    def missing(self):
+        return self.bitfield.missing(self.numPieces)
+
+    def isComplete(self):
+        return self.bitfield.isComplete(self.numPieces)
+
+    def size(self):
+        """Bytes de datos que ocupan las piezas presentes"""
+        if self.isComplete() and self.fileSize is not None:
+            return self.fileSize
+        return sum(self.pieceLength(index) for index in self.present())
+
+    def finish(self, target):
+        """Convierte una descarga completa en el archivo `target` sin copiar nada:
+        sincroniza los datos, renombra el archivo de datos (atómico) y borra el
+        auxiliar. Devuelve un almacén en su lugar sobre `target` para seguir
+        compartiéndolo"""
+        if self.inPlace:
+            return self
+        if not self.isComplete():
+            raise ValueError(f"{self.path} está incompleto: faltan {len(self.missing())} piezas")
+        # Nadie lee ni escribe mientras se cierra y se renombra
+        with self.lock:
+            self.checkOpen()
+            self.idle.wait_for(lambda: not self.users)
+            os.fsync(self.fd)
+            self.release()
+            os.replace(self.path, target)
+        try:
+            os.remove(self.sidecar)
+        except FileNotFoundError:
+            pass
+        return PieceStore.seed(target, self.pieceSize)
+
+    @property
+    def closed(self):
+        return self.fd is None
+
+    def checkOpen(self):
+        if self.fd is None:
+            raise ValueError(f"{self.path} está cerrado")
+
+    @contextmanager
+    def using(self):
+        """Descriptor del archivo de datos, abierto mientras dure el bloque"""
+        with self.lock:
+            self.checkOpen()
+            self.users += 1
+            fd = self.fd
+        try:
+            yield fd
+        finally:
+            with self.lock:
+                self.users -= 1
+                if not self.users:
+                    self.idle.notify_all()
+
+    def close(self):
+        """Cierra los descriptores cuando terminan las lecturas y escrituras en
+        curso. Cerrar dos veces no hace nada"""
+        with self.lock:
+            self.idle.wait_for(lambda: not self.users)
+            self.release()
+
+    def release(self):
+        """Cierra los descriptores. Requiere self.lock"""
+        for fd in (self.fd, self.sidecarFd):
+            if fd is None:
+                continue
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+        self.fd = self.sidecarFd = None
+
+    def remove(self):
+        """Cierra y borra el archivo de datos y el auxiliar. Un archivo compartido
+        en su lugar sólo se cierra: es el original del usuario"""
+        self.close()
+        if self.inPlace:
+            return
+        for path in (self.path, self.sidecar):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
@@ -1,182 +1,1751 @@
+import base64
+import bisect
+import functools
+import itertools
 import json
-from collections import Counter
+import multiprocessing
+import os
+import socket
+import threading
+from collections import OrderedDict, deque
+from contextlib import contextmanager
 from flask import Flask, jsonify, request
 import time
+import math
+import random
+from Bitfield import Bitfield
+from HashRing import HashRing
+from TrackerStore import TrackerStore
+import TrackerAsync
+import Wire
+import requests
 
 app = Flask(__name__)
 
-# Arreglo que guarda todos los nodos pertenecientes a la red
-peers = []
+# Dirección en la que escucha este tracker
+HOST = os.environ.get("TRACKER_HOST", "192.168.1.68")
+PORT = int(os.environ.get("TRACKER_PORT", 5000))
 
-# Solicitudes pendientes de descargas
-pendingRequests = []
+# Cluster de trackers: TRACKER_SHARDS lista los "host:puerto" de todos y cada
+# uno es dueño de los archivos que el anillo de hashing consistente le asigna.
+# El registro de peers lo tienen todos (los nodos se anuncian en cada uno)
+SELF = os.environ.get("TRACKER_SELF", f"{HOST}:{PORT}")
+ring = HashRing([shard for shard in os.environ.get("TRACKER_SHARDS", "").split(",") if shard] or [SELF])
 
-# Registro de progreso de descargas por IP y archivo
-download_progress = {}
+# Conexiones keep-alive hacia los otros trackers (traspasos y /rebalance)
+clusterSession = requests.Session()
 
-print("=== INICIANDO TRACKER EN IP: 192.168.1.68:5000 ===")
+# Registro de los nodos pertenecientes a la red, indexado por IP
+peers = {}
+
+# Solicitudes pendientes de descargas, indexadas por (IP, archivo) y en orden
+# de llegada: un nuevo plan para la misma descarga reemplaza al anterior
+pendingRequests = OrderedDict()
+
+# Tiempos de vida (segundos), configurables por variables de entorno.
+# Un peer sin heartbeat durante PEER_TTL se expulsa de la red; los planes y
+# progresos sin actividad durante PENDING_TTL / PROGRESS_TTL se descartan
+PEER_TTL = float(os.environ.get("TRACKER_PEER_TTL", 120))
+PENDING_TTL = float(os.environ.get("TRACKER_PENDING_TTL", 600))
+PROGRESS_TTL = float(os.environ.get("TRACKER_PROGRESS_TTL", 6 * 3600))
+SWEEP_INTERVAL = float(os.environ.get("TRACKER_SWEEP_INTERVAL", 30))
+
+# Persistencia en disco (log + instantánea en SQLite). Ruta vacía = desactivada
+STATE_DB = os.environ.get("TRACKER_STATE_DB", "tracker_state.db")
+COMPACT_INTERVAL = float(os.environ.get("TRACKER_COMPACT_INTERVAL", 60))
+store = None
+
+# Servidor HTTP: "werkzeug" (un hilo por conexión) o "asyncio" (un event loop
+# para todas las conexiones y un pool de TRACKER_WORKERS hilos para las vistas)
+SERVER = os.environ.get("TRACKER_SERVER", "werkzeug")
+WORKERS = int(os.environ.get("TRACKER_WORKERS", 16))
+
+# Puerto en el que los nodos sirven sus segmentos (va en las entradas compactas de peers)
+NODE_PORT = int(os.environ.get("TRACKER_NODE_PORT", 5001))
+
+# Modo prefork: TRACKER_PROCESSES procesos atienden peticiones sobre el mismo
+# socket y comparten el estado a través del log de STATE_DB (ver catchUp)
+PROCESSES = int(os.environ.get("TRACKER_PROCESSES", 1))
+SYNC_INTERVAL = float(os.environ.get("TRACKER_SYNC_INTERVAL", 1))
+shared = False
+
+# Última vez que se supo de cada peer (heartbeat o cualquier anuncio)
+peerLastSeen = {}
+
+class ProgressTable(dict):
+    """Diccionario de progresos que admite entradas recuperadas sin construir.
+
+    Al arrancar se recuperan cientos de miles de progresos y casi ninguno se
+    consulta enseguida: cada uno queda guardado crudo, como la tupla (total de
+    segmentos, última actualización, bytes del bitfield), y se convierte en su
+    registro la primera vez que alguien lo lee.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.lock = threading.Lock()
+
+    def putRaw(self, key, total_segments, last_update, data):
+        dict.__setitem__(self, key, (total_segments, last_update, data))
+
+    @staticmethod
+    def _entry(key, raw):
+        total_segments, last_update, data = raw
+        return {
+            "ip": key[0],
+            "filename": key[1],
+            "total_segments": total_segments,
+            "downloaded_segments": Bitfield(total_segments, data),
+            "last_update": last_update
+        }
+
+    def _build(self, key):
+        with self.lock:
+            value = dict.get(self, key)
+            if type(value) is tuple:
+                value = self._entry(key, value)
+                dict.__setitem__(self, key, value)
+            return value
+
+    def __getitem__(self, key):
+        value = dict.__getitem__(self, key)
+        return self._build(key) if type(value) is tuple else value
+
+    def get(self, key, default=None):
+        value = dict.get(self, key, default)
+        return self._build(key) if type(value) is tuple else value
+
+    def pop(self, key, *default):
+        value = dict.pop(self, key, *default)
+        return self._entry(key, value) if type(value) is tuple else value
+
+    def items(self):
+        return [(key, self[key]) for key in list(self)]
+
+    def lastUpdates(self):
+        """[(clave, última actualización)] sin construir las entradas crudas"""
+        return [(key, value[1] if type(value) is tuple else value["last_update"])
+                for key, value in list(dict.items(self))]
+
+# Registro de progreso de descargas, indexado por la tupla (IP, archivo).
+# Los segmentos descargados se guardan como Bitfield (un bit por segmento)
+download_progress = ProgressTable()
+
+# Índice secundario: IP -> nombres de archivo con progreso registrado
+progress_by_ip = {}
+
+# Índice invertido: nombre de archivo -> {IP: {"IP": IP, "file": información del archivo
+# en ese peer, "bitfield": segmentos que el peer tiene realmente}}
+fileIndex = {}
+
+# Disponibilidad por archivo: cuántos peers tienen cada segmento.
+# Se mantiene de forma incremental cada vez que cambia el bitfield de un peer
+availability = {}
+
+# Versión de cada archivo: cambia cada vez que cambian sus peers o bitfields.
+# Sale de un contador global (ver nextVersion) para que un archivo que
+# desaparece y vuelve no repita una versión anterior
+fileVersions = {}
+fileVersionCounter = itertools.count(1)
+
+# Peers de cada archivo en un SampleSet, para tomar muestras sin recorrer el
+# enjambre: todos los que lo tienen y los que lo tienen completo (seeders).
+# Se mantienen junto con fileIndex
+holderSample = {}
+seederSample = {}
+
+# --- Concurrencia ---------------------------------------------------------
+# Flask atiende cada petición en su propio hilo, así que el estado se protege
+# con locks repartidos por clave en lugar de un único lock global:
+#   - progressLocks(IP, archivo): el progreso de una descarga
+#   - fileLocks(archivo): los peers que tienen el archivo, sus bitfields y la
+#     disponibilidad del archivo
+#   - peerLocks(IP): el rendimiento medido de un peer
+#   - registryLock: la estructura de `peers`, sus listas "Files",
+#     `progress_by_ip` y `pendingRequests` (sólo se retiene un instante)
+# Cuando hace falta más de uno se toman siempre en ese orden (progreso,
+# archivo, registro) para no caer en un interbloqueo. loadLock (la carga de
+# las fuentes) va siempre último y no se toma ningún otro con él.
+#
+# Los lectores no toman locks: los bitfields de los peers y las listas "Files"
+# se reemplazan por una copia modificada en lugar de cambiarse en el lugar, así
+# que quien planifica una descarga trabaja sobre una foto consistente.
+
+class LockStripes:
+    """Conjunto fijo de locks en el que cada clave usa siempre el mismo.
+
+    Claves distintas casi nunca comparten lock y no hay que crear ni limpiar
+    un lock por cada archivo o peer.
+    """
+
+    def __init__(self, stripes=64):
+        self.locks = [threading.RLock() for _ in range(stripes)]
+
+    def __call__(self, key):
+        return self.locks[hash(key) % len(self.locks)]
+
+progressLocks = LockStripes()
+fileLocks = LockStripes()
+peerLocks = LockStripes()
+registryLock = threading.RLock()
+
+# --- Versiones del catálogo -------------------------------------------------
+# /peers y /allFiles llevan una versión que cambia con cada modificación del
+# catálogo. Con ella el cliente puede pedir sólo lo que cambió (?since=) o
+# recibir un 304 si no cambió nada (If-None-Match)
+
+CATALOG_LOG_SIZE = int(os.environ.get("TRACKER_CATALOG_LOG_SIZE", 50000))
+
+class ChangeLog:
+    """Versión de un catálogo y registro de las últimas claves que cambiaron.
+
+    Cada cambio incrementa la versión y anota la clave, así quien ya tiene la
+    versión N sólo necesita las claves anotadas después. La versión se
+    publica como "época-N": la época es aleatoria por proceso, de modo que un
+    token de otro proceso o de antes de un reinicio obliga a enviar todo.
+
+    En modo prefork (ver `share`) todos los procesos usan la época de STATE_DB
+    y la versión es la posición del log (`clock`), que es la misma en todos
+    para el mismo estado: un token sirve en cualquier proceso.
+    """
+
+    def __init__(self, size=CATALOG_LOG_SIZE):
+        self.lock = threading.Lock()
+        self.log = deque(maxlen=size)
+        self.clock = None
+        self.epoch = os.urandom(4).hex()
+        self.reset()
+
+    def share(self, epoch, clock):
+        with self.lock:
+            self.epoch = epoch
+            self.clock = clock
+        self.reset()
+
+    def reset(self):
+        """Olvida los cambios anotados: cualquier token anterior recibe todo"""
+        with self.lock:
+            if self.clock is None:
+                self.epoch = os.urandom(4).hex()
+                self.version = 0
+            else:
+                self.version = self.clock()
+            # Los cambios posteriores a `floor` están todos en el registro
+            self.floor = self.version
+            self.log.clear()
+
+    def changed(self, key):
+        """Anota un cambio. Se llama después de modificar el estado, nunca antes"""
+        with self.lock:
+            # Con el log compartido el cambio queda en la posición siguiente a
+            # la actual; las versiones anotadas nunca retroceden
+            version = self.version + 1 if self.clock is None else max(self.version, self.clock() + 1)
+            self.version = version
+            if len(self.log) == self.log.maxlen:
+                self.floor = self.log[0][0]
+            self.log.append((version, key))
+
+    def current(self):
+        # Requiere self.lock
+        return self.version if self.clock is None else self.clock()
+
+    def token(self):
+        with self.lock:
+            return f"{self.epoch}-{self.current()}"
+
+    def changesSince(self, token):
+        """Claves que cambiaron después de `token`, o None si hay que enviar todo"""
+        epoch, _, version = (token or "").partition("-")
+        with self.lock:
+            if epoch != self.epoch or not version.isdigit() or int(version) > self.current():
+                return None
+            version = int(version)
+            # El registro es acotado: los cambios más viejos ya se descartaron
+            if version < self.floor:
+                return None
+            keys = set()
+            for changeVersion, key in reversed(self.log):
+                if changeVersion <= version:
+                    break
+                keys.add(key)
+            return keys
+
+# Peers (IP) cuyo registro o lista de archivos cambió, y archivos (nombre)
+# que aparecieron o desaparecieron de la red
+peerCatalog = ChangeLog()
+fileCatalog = ChangeLog()
+
+class NameIndex:
+    """Nombres de archivo en orden, para buscar por prefijo y paginar con cursor.
+
+    Las altas y bajas sólo se anotan y se aplican en la siguiente lectura: las
+    altas se ordenan aparte y se mezclan con la lista (dos tramos ordenados),
+    así cargar miles de archivos al recuperar el estado no cuesta un insort
+    por cada uno.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.names = []
+        self.members = set()
+        self.added = set()
+        self.removed = set()
+
+    def add(self, name):
+        with self.lock:
+            if name in self.members:
+                return
+            self.members.add(name)
+            if name in self.removed:
+                self.removed.discard(name)
+            else:
+                self.added.add(name)
+
+    def discard(self, name):
+        with self.lock:
+            if name not in self.members:
+                return
+            self.members.discard(name)
+            if name in self.added:
+                self.added.discard(name)
+            else:
+                self.removed.add(name)
+
+    def __len__(self):
+        with self.lock:
+            return len(self.members)
+
+    def clear(self):
+        with self.lock:
+            self.names = []
+            for pending in (self.members, self.added, self.removed):
+                pending.clear()
+
+    def _settle(self):
+        # Requiere self.lock
+        if self.removed:
+            self.names = [name for name in self.names if name not in self.removed]
+            self.removed.clear()
+        if self.added:
+            self.names.extend(sorted(self.added))
+            self.names.sort()
+            self.added.clear()
+
+    def all(self):
+        with self.lock:
+            self._settle()
+            return list(self.names)
+
+    def page(self, prefix="", contains=None, after=None, limit=100, chunk=1024):
+        """Hasta `limit` nombres que empiezan con `prefix` (y contienen `contains`,
+        sin distinguir mayúsculas) posteriores a `after`.
+
+        Devuelve (nombres, quedan más). La lista se recorre en tramos y el lock
+        se suelta entre uno y otro, así una búsqueda por subcadena que recorre
+        todo el catálogo no frena a quien agrega archivos.
+        """
+        needle = contains.casefold() if contains else None
+        result = []
+        position = after
+        while True:
+            with self.lock:
+                self._settle()
+                start = bisect.bisect_left(self.names, prefix)
+                if position is not None:
+                    start = max(start, bisect.bisect_right(self.names, position))
+                names = self.names[start:start + chunk]
+            if not names:
+                return result, False
+            for name in names:
+                if not name.startswith(prefix):
+                    return result, False
+                if needle is None or needle in name.casefold():
+                    if len(result) >= limit:
+                        return result, True
+                    result.append(name)
+            position = names[-1]
+
+catalogIndex = NameIndex()
+
+class SampleSet:
+    """Conjunto del que se toman k elementos al azar en O(k).
+
+    Los elementos viven en una lista y cada uno recuerda su posición: al quitar
+    uno, el último pasa a ocupar su lugar. Se modifica con fileLocks(archivo);
+    quien lee sin locks puede no ver un elemento que se está moviendo, igual
+    que con el resto del índice.
+    """
+
+    def __init__(self):
+        self.items = []
+        self.slots = {}
+
+    def __len__(self):
+        return len(self.items)
+
+    def add(self, item):
+        if item not in self.slots:
+            self.slots[item] = len(self.items)
+            self.items.append(item)
+
+    def discard(self, item):
+        slot = self.slots.pop(item, None)
+        if slot is None:
+            return
+        last = self.items.pop()
+        if slot < len(self.items):
+            self.items[slot] = last
+            self.slots[last] = slot
+
+    def sample(self, k, rng):
+        items = self.items
+        count = len(items)
+        if count <= k:
+            return list(items)
+        result = []
+        for slot in rng.sample(range(count), k):
+            try:
+                result.append(items[slot])
+            except IndexError:
+                pass
+        return result
+
+    def scan(self):
+        """Recorre los elementos sin copiar la lista"""
+        items = self.items
+        for slot in range(len(items)):
+            try:
+                yield items[slot]
+            except IndexError:
+                return
+
+def fullBitfield(numSegments):
+    """Bitfield de un peer que tiene el archivo completo"""
+    return Bitfield(numSegments, b"\xff" * ((numSegments + 7) // 8))
+
+# Máximo de segmentos de un archivo que se acepta en una petición: un total
+# mayor haría reservar un bitfield enorme
+MAX_SEGMENTS = int(os.environ.get("TRACKER_MAX_SEGMENTS", 1 << 20))
+
+def segmentCount(fileName, claimed):
+    """Segmentos del archivo: los que ya conoce el índice o, si es nuevo, los
+    que dice el peer. None si el total no es válido"""
+    with fileLocks(fileName):
+        holder = next(iter(holdersOf(fileName).values()), None)
+    if holder is not None:
+        return holder["file"]["numSegments"]
+    if type(claimed) is int and 0 < claimed <= MAX_SEGMENTS:
+        return claimed
+    return None
+
+def checkedSegments(numSegments, segments=(), ranges=()):
+    """Segmentos sueltos y rangos [inicio, fin) de una petición, validados.
+
+    Un segmento fuera de [0, numSegments) invalida la petición; los rangos se
+    recortan a ese intervalo y entre todos no pueden cubrir más de
+    numSegments segmentos. Devuelve la lista de segmentos, o None si algo no
+    es válido.
+    """
+    result = []
+    for segment in segments:
+        if type(segment) is not int or not 0 <= segment < numSegments:
+            return None
+        result.append(segment)
+    budget = numSegments
+    for entry in ranges:
+        try:
+            start, end = entry
+            start, end = max(int(start), 0), min(int(end), numSegments)
+        except (TypeError, ValueError):
+            return None
+        if end <= start:
+            continue
+        budget -= end - start
+        if budget < 0:
+            return None
+        result.extend(range(start, end))
+    return result
+
+def announcedBitfield(numSegments, encoded):
+    """Bitfield anunciado por un peer, recortado a sus numSegments segmentos:
+    los bits de más no agrandan el campo ni cuentan como segmentos"""
+    if isinstance(encoded, str):
+        encoded = base64.b64decode(encoded) if encoded else b""
+    return Bitfield.decode(numSegments, bytes(encoded or b"")[:(numSegments + 7) // 8])
+
+def invalidSegments():
+    return reply({'error': 'Segmentos fuera del archivo o total de segmentos inválido'}, 400)
+
+def countAvailability(fileName, segments, delta):
+    """Suma (o resta) una copia a la disponibilidad de los segmentos dados.
+    Requiere fileLocks(fileName)."""
+    fileVersions[fileName] = nextVersion()
+    counts = availability.setdefault(fileName, [])
+    for segment in segments:
+        if segment >= len(counts):
+            counts.extend([0] * (segment + 1 - len(counts)))
+        counts[segment] += delta
+
+def replaceBitfield(fileName, holder, bitfield):
+    """Sustituye el bitfield completo de un peer para un archivo"""
+    countAvailability(fileName, holder["bitfield"].present(), -1)
+    countAvailability(fileName, bitfield.present(), 1)
+    holder["bitfield"] = bitfield
+    holder["file"]["currentSegments"] = len(bitfield)
+    trackHolder(fileName, holder)
+
+def addHaves(fileName, holder, segments):
+    """Marca segmentos nuevos en el bitfield de un peer. Devuelve cuántos eran nuevos.
+
+    El bitfield se copia antes de modificarlo para no cambiarlo bajo los pies
+    de quien esté planificando con la versión anterior.
+    """
+    bitfield = holder["bitfield"].copy()
+    added = [segment for segment in segments if bitfield.set(segment)]
+    if added:
+        countAvailability(fileName, added, 1)
+        holder["bitfield"] = bitfield
+        holder["file"]["currentSegments"] = len(bitfield)
+        trackHolder(fileName, holder)
+    return len(added)
+
+def trackHolder(fileName, holder):
+    """Pone al peer en las muestras del archivo (y entre sus seeders si lo
+    tiene completo). Requiere fileLocks(fileName)."""
+    holderSample.setdefault(fileName, SampleSet()).add(holder["IP"])
+    seeders = seederSample.setdefault(fileName, SampleSet())
+    if holder["bitfield"].isComplete(holder["file"]["numSegments"]):
+        seeders.add(holder["IP"])
+    else:
+        seeders.discard(holder["IP"])
+
+def attachFile(ip, file):
+    """Pone el archivo en la lista "Files" del peer, reemplazando el del mismo nombre"""
+    with registryLock:
+        peer = peers.get(ip)
+        if peer is None:
+            return False
+        files = list(peer.get("Files", []))
+        for position, current in enumerate(files):
+            if current["fileName"] == file["fileName"]:
+                files[position] = file
+                break
+        else:
+            files.append(file)
+        peer["Files"] = files
+        return True
+
+def indexFile(ip, file):
+    """Registra (o reemplaza) el archivo de un peer en el índice invertido y
+    en su lista de archivos. Requiere fileLocks(file["fileName"]).
+
+    Si el peer anuncia un "bitfield" (base64) se usa tal cual; si no, sólo se
+    asume que tiene todos los segmentos cuando reporta el archivo completo.
+    Devuelve None si el peer ya no está en la red.
+    """
+    numSegments = file["numSegments"]
+    encoded = file.pop("bitfield", None)
+    if not attachFile(ip, file):
+        return None
+    if encoded is not None:
+        bitfield = announcedBitfield(numSegments, encoded)
+        file["currentSegments"] = len(bitfield)
+    elif file.get("currentSegments", 0) >= numSegments:
+        bitfield = fullBitfield(numSegments)
+    else:
+        bitfield = Bitfield(numSegments)
+    holders = fileIndex.get(file["fileName"])
+    isNew = holders is None
+    if isNew:
+        holders = fileIndex[file["fileName"]] = {}
+    previous = holders.get(ip)
+    if previous is not None:
+        countAvailability(file["fileName"], previous["bitfield"].present(), -1)
+    countAvailability(file["fileName"], bitfield.present(), 1)
+    holder = {"IP": ip, "file": file, "bitfield": bitfield}
+    holders[ip] = holder
+    trackHolder(file["fileName"], holder)
+    peerCatalog.changed(ip)
+    if isNew:
+        catalogIndex.add(file["fileName"])
+        fileCatalog.changed(file["fileName"])
+    return holder
+
+def holdersOf(fileName):
+    """Devuelve los peers que tienen el archivo, sin recorrer toda la red"""
+    return fileIndex.get(fileName, {})
+
+def removeHolder(ip, fileName, file=None):
+    """Quita el archivo de un peer del índice y de su lista de archivos.
+    Requiere fileLocks(fileName).
+
+    Con `file` sólo se quita si el registro sigue siendo ese mismo archivo, y
+    no uno que el peer volvió a anunciar mientras tanto.
+    """
+    holders = fileIndex.get(fileName)
+    holder = holders.get(ip) if holders is not None else None
+    if holder is None or (file is not None and holder["file"] is not file):
+        return None
+    del holders[ip]
+    countAvailability(fileName, holder["bitfield"].present(), -1)
+    for sample in (holderSample, seederSample):
+        if fileName in sample:
+            sample[fileName].discard(ip)
+    if not holders:
+        del fileIndex[fileName]
+        holderSample.pop(fileName, None)
+        seederSample.pop(fileName, None)
+        availability.pop(fileName, None)
+        fileVersions.pop(fileName, None)
+        catalogIndex.discard(fileName)
+        fileCatalog.changed(fileName)
+    with registryLock:
+        peer = peers.get(ip)
+        if peer is not None:
+            peer["Files"] = [current for current in peer.get("Files", []) if current is not holder["file"]]
+    peerCatalog.changed(ip)
+    return holder
+
+def holderFor(ip, fileName, numSegments):
+    """Obtiene el registro del archivo en un peer, creándolo si hace falta.
+    Requiere fileLocks(fileName)."""
+    holder = holdersOf(fileName).get(ip)
+    if holder is None:
+        if not numSegments:
+            return None
+        holder = indexFile(ip, {"fileName": fileName, "numSegments": numSegments, "currentSegments": 0})
+    return holder
+
+def announceSegments(ip, fileName, numSegments, segments):
+    """Marca segmentos que un peer acaba de obtener (equivale a un mensaje 'have')"""
+    with fileLocks(fileName):
+        holder = holderFor(ip, fileName, numSegments)
+        if holder is not None:
+            if addHaves(fileName, holder, segments):
+                peerCatalog.changed(ip)
+            persistHolder(ip, fileName)
+
+# Rendimiento medido de cada peer como fuente (bytes/s), reportado por los
+# nodos que le descargan. Es un promedio exponencial con ventana temporal:
+# una medición de hace THROUGHPUT_WINDOW segundos pesa 1/e de una nueva
+THROUGHPUT_WINDOW = 60.0
+peerThroughput = {}
+
+def recordThroughput(ip, nbytes, seconds, now=None):
+    """Incorpora una medición de bytes servidos por un peer en cierto tiempo"""
+    if seconds <= 0 or nbytes <= 0:
+        return
+    now = time.time() if now is None else now
+    sample = nbytes / seconds
+    with peerLocks(ip):
+        entry = peerThroughput.get(ip)
+        if entry is None:
+            peerThroughput[ip] = {"rate": sample, "updated": now}
+            persistThroughput(ip)
+            return
+        alpha = 1 - math.exp(-max(now - entry["updated"], 0) / THROUGHPUT_WINDOW)
+        # Varias mediciones en el mismo instante también deben mover el promedio
+        alpha = max(alpha, 0.2)
+        entry["rate"] += alpha * (sample - entry["rate"])
+        entry["updated"] = now
+        persistThroughput(ip)
+
+def throughputWeights(ips):
+    """Peso relativo de cada peer según su rendimiento reciente.
+
+    Los peers sin mediciones reciben el promedio de los conocidos, así que sin
+    datos todos pesan lo mismo y el reparto vuelve a ser equitativo.
+    """
+    entries = {ip: peerThroughput.get(ip) for ip in ips}
+    known = [entry["rate"] for entry in entries.values() if entry is not None]
+    default = sum(known) / len(known) if known else 1.0
+    return {ip: entry["rate"] if entry is not None else default for ip, entry in entries.items()}
+
+# --- Carga de las fuentes --------------------------------------------------
+# Cada plan de pendingRequests le asigna segmentos a ciertos peers. seederLoad
+# lleva por peer a cuántos descargadores les debe todavía algún segmento: un
+# plan cuenta para una fuente desde que se guarda hasta que el descargador
+# reporta todos los segmentos que se le asignaron a ella, o hasta que el plan
+# se reemplaza, termina o vence. Un nodo pide a cada fuente de a un segmento
+# por vez, así que el rendimiento de una fuente se reparte entre esos
+# descargadores; el planificador lo tiene en cuenta y un seeder popular no
+# recibe a todos los descargadores mientras otros peers esperan sin trabajo.
+
+# (IP, archivo) -> {IP de la fuente: Bitfield de segmentos aún no entregados}
+planLoad = {}
+# IP de la fuente -> descargadores con segmentos suyos aún no entregados
+seederLoad = {}
+loadLock = threading.Lock()
+
+def unload(ip):
+    """Requiere loadLock"""
+    remaining = seederLoad.get(ip, 0) - 1
+    if remaining > 0:
+        seederLoad[ip] = remaining
+    else:
+        seederLoad.pop(ip, None)
+
+def setPending(key, value):
+    """Guarda (o borra, con None) el plan de una descarga y actualiza la carga
+    de sus fuentes. Requiere registryLock."""
+    pendingRequests.pop(key, None)
+    if value is not None:
+        pendingRequests[key] = value
+    with loadLock:
+        for ip in planLoad.pop(key, {}):
+            unload(ip)
+        if value is None:
+            return
+        plan = {}
+        for peer in value.get("peersAndLeechers", []):
+            segments = peer.get("segments_to_download") or []
+            if segments:
+                bitfield = Bitfield(max(segments) + 1)
+                bitfield.update(segments)
+                plan[peer["IP"]] = bitfield
+                seederLoad[peer["IP"]] = seederLoad.get(peer["IP"], 0) + 1
+        if plan:
+            planLoad[key] = plan
+
+def releaseDelivered(key, downloaded):
+    """Descuenta de la carga de cada fuente los segmentos del plan que el
+    descargador ya tiene según su bitfield `downloaded`"""
+    if key not in planLoad:
+        return
+    with loadLock:
+        plan = planLoad.get(key)
+        if plan is None:
+            return
+        for ip, bitfield in list(plan.items()):
+            length = len(bitfield.bits)
+            pending = segmentMask(bitfield, length)
+            delivered = pending & segmentMask(downloaded, length)
+            if not delivered:
+                continue
+            pending &= ~delivered
+            if pending:
+                plan[ip] = Bitfield(bitfield.size, pending.to_bytes(length, "big"))
+            else:
+                del plan[ip]
+                unload(ip)
+        if not plan:
+            del planLoad[key]
+
+# --- Persistencia ---------------------------------------------------------
+# Cada cambio de estado se escribe como la versión completa del registro
+# afectado: ("peer", IP, ""), ("holder", IP, archivo), ("progress", IP, archivo),
+# ("pending", IP, archivo) o ("throughput", IP, ""). Un valor None indica que
+# el registro se borró.
+
+# Último lastSeen escrito a disco por peer
+peerSeenPersisted = {}
+
+def persist(kind, ip, name, value, data=None):
+    global logPosition
+    if store is not None:
+        seq = store.put(kind, ip, name, value, data)
+        if shared:
+            logPosition = max(logPosition, seq)
+
+def persistPeer(ip):
+    with registryLock:
+        peer = peers.get(ip)
+        value = None
+        if peer is not None:
+            lastSeen = peerLastSeen.get(ip, time.time())
+            peerSeenPersisted[ip] = lastSeen
+            value = {"peer": {key: val for key, val in peer.items() if key != "Files"}, "lastSeen": lastSeen}
+        else:
+            peerSeenPersisted.pop(ip, None)
+        persist("peer", ip, "", value)
+
+# Los registros se escriben con el lock de su clave tomado, así dos versiones
+# del mismo registro no pueden llegar al log en desorden
+
+def persistHolder(ip, fileName):
+    """Requiere fileLocks(fileName)"""
+    holder = holdersOf(fileName).get(ip)
+    if holder is None:
+        persist("holder", ip, fileName, None)
+    else:
+        persist("holder", ip, fileName, {"file": holder["file"]}, holder["bitfield"].toBytes())
+
+def persistProgress(progress_key):
+    """Requiere progressLocks(progress_key)"""
+    progress = download_progress.get(progress_key)
+    if progress is None:
+        persist("progress", progress_key[0], progress_key[1], None)
+    else:
+        value = {"total_segments": progress["total_segments"], "last_update": progress["last_update"]}
+        persist("progress", progress_key[0], progress_key[1], value, progress["downloaded_segments"].toBytes())
+
+def persistPending(key):
+    with registryLock:
+        persist("pending", key[0], key[1], pendingRequests.get(key))
+
+def persistThroughput(ip):
+    """Requiere peerLocks(ip)"""
+    entry = peerThroughput.get(ip)
+    persist("throughput", ip, "", dict(entry) if entry is not None else None)
+
+def applyPeerRecord(ip, name, value, data=None):
+    if value is None:
+        removePeer(ip)
+        return
+    with registryLock:
+        peer = peers.setdefault(ip, {"IP": ip, "Files": []})
+        peer.update(value["peer"])
+        peerLastSeen[ip] = value.get("lastSeen") or time.time()
+        peerSeenPersisted[ip] = peerLastSeen[ip]
+    peerCatalog.changed(ip)
+
+def applyHolderRecord(ip, name, value, data=None):
+    with fileLocks(name):
+        if value is None:
+            removeHolder(ip, name)
+            return
+        file = value["file"]
+        bitfield = Bitfield(file["numSegments"], data)
+        holder = holdersOf(name).get(ip)
+        if holder is None:
+            holder = indexFile(ip, file)
+            if holder is None:
+                return
+        else:
+            holder["file"].update(file)
+        replaceBitfield(name, holder, bitfield)
+        peerCatalog.changed(ip)
+
+def applyProgressRecord(ip, name, value, data=None):
+    progress_key = (ip, name)
+    with progressLocks(progress_key):
+        if value is None:
+            dropProgress(progress_key)
+            return
+        download_progress[progress_key] = {
+            "ip": ip,
+            "filename": name,
+            "total_segments": value["total_segments"],
+            "downloaded_segments": Bitfield(value["total_segments"], data),
+            "last_update": value["last_update"]
+        }
+        with registryLock:
+            progress_by_ip.setdefault(ip, set()).add(name)
+        releaseDelivered(progress_key, download_progress[progress_key]["downloaded_segments"])
+
+def applyPendingRecord(ip, name, value, data=None):
+    with registryLock:
+        setPending((ip, name), value)
+
+def applyThroughputRecord(ip, name, value, data=None):
+    with peerLocks(ip):
+        if value is None:
+            peerThroughput.pop(ip, None)
+        elif ip in peers:
+            peerThroughput[ip] = value
+
+# Cómo aplicar cada tipo de registro leído del disco al estado en memoria.
+# `data` trae los bytes crudos del bitfield en los registros que lo tienen
+recordAppliers = {
+    "peer": applyPeerRecord,
+    "holder": applyHolderRecord,
+    "progress": applyProgressRecord,
+    "pending": applyPendingRecord,
+    "throughput": applyThroughputRecord,
+}
+
+def applyRecord(kind, ip, name, value, data=None):
+    """Aplica al estado en memoria una versión de registro leída del disco"""
+    recordAppliers[kind](ip, name, value, data)
+
+def loadRecords(records):
+    """Aplica registros completos (sin orden de log) al estado en memoria"""
+    byKind = {}
+    for record in records:
+        byKind.setdefault(record[0], []).append(record)
+    # Primero los peers, para que sus archivos tengan dónde colgarse
+    for kind, ip, name, value, data in byKind.pop("peer", ()):
+        applyPeerRecord(ip, name, value, data)
+    # Los progresos son la gran mayoría de los registros: se cargan de una vez
+    # en lugar de tomar dos locks por cada uno, y crudos (ver ProgressTable)
+    putRaw = download_progress.putRaw
+    with registryLock:
+        for kind, ip, name, value, data in byKind.pop("progress", ()):
+            putRaw((ip, name), value["total_segments"], value["last_update"], data)
+            progress_by_ip.setdefault(ip, set()).add(name)
+    # Los planes pendientes, en el orden en que se pidieron
+    pending = sorted(byKind.pop("pending", ()), key=lambda record: record[3].get("requestedAt", 0))
+    for kind, records in byKind.items():
+        for _, ip, name, value, data in records:
+            recordAppliers[kind](ip, name, value, data)
+    for _, ip, name, value, data in pending:
+        applyPendingRecord(ip, name, value, data)
+        progress = download_progress.get((ip, name))
+        if progress is not None:
+            releaseDelivered((ip, name), progress["downloaded_segments"])
+
+def loadSnapshot():
+    """Carga el estado completo del disco sobre un estado vacío"""
+    global appliedSeq, logPosition
+    records, seq = store.load()
+    # Lo cargado es el estado en la posición `seq` del log (ver nextVersion)
+    logPosition = seq - 1
+    loadRecords(records)
+    appliedSeq = logPosition = seq
+    # Ningún token anterior puede recibir sólo lo que cambió
+    peerCatalog.reset()
+    fileCatalog.reset()
+
+def recoverState():
+    """Reconstruye el estado del tracker desde el disco al arrancar"""
+    started = time.time()
+    loadSnapshot()
+    # Los peers recuperados tienen un TTL completo para volver a dar señales
+    # de vida, así un reinicio no obliga a toda la red a reconectarse
+    now = time.time()
+    for ip in peers:
+        peerLastSeen[ip] = now
+    print(f"[Tracker] Estado recuperado en {time.time() - started:.3f}s: {len(peers)} peers, "
+          f"{len(fileIndex)} archivos, {len(download_progress)} progresos, {len(pendingRequests)} solicitudes")
+
+# --- Estado compartido entre procesos ---------------------------------------
+# En modo prefork cada proceso tiene su copia del estado en memoria y la
+# mantiene al día aplicando el log de STATE_DB a partir de `appliedSeq`: antes
+# de cada petición y cada SYNC_INTERVAL segundos. Las escrituras se hacen
+# dentro de sharedWrite(), que bloquea el log para los demás procesos y
+# primero aplica lo que ellos escribieron, así una actualización nunca parte
+# de un estado viejo y no se pierden cambios de otro proceso.
+
+# Última entrada del log aplicada al estado en memoria
+appliedSeq = 0
+syncLock = threading.Lock()
+
+# Posición del log que refleja el estado en memoria: la última entrada
+# aplicada o escrita por este proceso. Mientras se aplica una entrada vale la
+# anterior a ella
+logPosition = 0
+
+def nextVersion():
+    """Versión para un cambio que se está haciendo ahora.
+
+    En modo prefork es la posición del log del cambio (la siguiente a
+    `logPosition`): cada proceso que lo aplica le da la misma versión y un
+    ETag o un token vale en cualquiera de ellos. Si no, un contador local.
+    """
+    if shared:
+        return logPosition + 1
+    return next(fileVersionCounter)
+
+def shareVersions():
+    """Modo prefork: los catálogos toman su época de STATE_DB y su versión del log"""
+    epoch = f"{store.epoch():08x}"
+    peerCatalog.share(epoch, lambda: logPosition)
+    fileCatalog.share(epoch, lambda: logPosition)
+
+def resetState():
+    with registryLock:
+        for table in (peers, peerLastSeen, peerSeenPersisted, download_progress, progress_by_ip,
+                      fileIndex, holderSample, seederSample, availability, fileVersions,
+                      peerThroughput, pendingRequests):
+            table.clear()
+        with loadLock:
+            planLoad.clear()
+            seederLoad.clear()
+    catalogIndex.clear()
+    peerCatalog.reset()
+    fileCatalog.reset()
+
+def catchUp():
+    """Aplica al estado en memoria lo que otros procesos escribieron en el log"""
+    global appliedSeq, logPosition
+    records = store.tail(appliedSeq)
+    with syncLock:
+        if records is None:
+            # La compactación ya borró entradas que no se aplicaron (este proceso
+            # estuvo más de READER_TIMEOUT sin anotar su avance): se recarga todo
+            resetState()
+            loadSnapshot()
+            return
+        for seq, kind, ip, name, value, data in records:
+            # Otro hilo puede haber aplicado ya estas entradas
+            if seq > appliedSeq:
+                logPosition = seq - 1
+                applyRecord(kind, ip, name, value, data)
+                appliedSeq = seq
+                logPosition = max(logPosition, seq)
+
+@contextmanager
+def sharedWrite():
+    """Sección de escritura del modo prefork; fuera de él no hace nada.
+
+    Se debe abrir antes de tomar cualquier lock de estado, porque adentro se
+    aplican entradas del log que los toman.
+    """
+    if not shared:
+        yield
+        return
+    with store.transaction():
+        if store.depth == 1:
+            catchUp()
+        yield
+
+def writesState(view):
+    """Ejecuta una vista que modifica el estado dentro de sharedWrite()"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        with sharedWrite():
+            return view(*args, **kwargs)
+    return wrapper
+
+def markApplied():
+    """Anota en STATE_DB hasta dónde aplicó el log este proceso, para que la
+    compactación no le borre entradas que todavía no leyó"""
+    store.markApplied(f"pid-{os.getpid()}", appliedSeq)
+
+def syncLoop():
+    while True:
+        time.sleep(SYNC_INTERVAL)
+        try:
+            catchUp()
+            markApplied()
+        except Exception as e:
+            print(f"[Tracker] Error al sincronizar el estado: {e}")
+
+def touchPeer(ip):
+    """Registra actividad de un peer conocido"""
+    if ip in peers:
+        now = time.time()
+        peerLastSeen[ip] = now
+        # No hace falta escribir cada heartbeat: basta con que el valor en
+        # disco no se atrase más de una fracción del TTL
+        if store is not None and now - peerSeenPersisted.get(ip, 0) > PEER_TTL / 8:
+            with sharedWrite():
+                persistPeer(ip)
+
+def isAlive(ip, now=None):
+    now = time.time() if now is None else now
+    return now - peerLastSeen.get(ip, now) <= PEER_TTL
+
+def removePeer(ip, persistChanges=False, staleBefore=None):
+    """Saca a un peer de la red junto con sus archivos en el índice.
+
+    Con `staleBefore` no lo saca si dio señales de vida después de ese momento.
+    """
+    with registryLock:
+        if staleBefore is not None and peerLastSeen.get(ip, 0) > staleBefore:
+            return None
+        peerLastSeen.pop(ip, None)
+        peer = peers.pop(ip, None)
+        if persistChanges and peer is not None:
+            persistPeer(ip)
+    if peer is not None:
+        peerCatalog.changed(ip)
+    with peerLocks(ip):
+        if peerThroughput.pop(ip, None) is not None and persistChanges:
+            persistThroughput(ip)
+    if peer is None:
+        return None
+    for file in peer.get("Files", []):
+        with fileLocks(file["fileName"]):
+            if removeHolder(ip, file["fileName"], file) is not None and persistChanges:
+                persistHolder(ip, file["fileName"])
+    return peer
+
+def sweepStale(now=None):
+    """Expulsa peers sin heartbeat y descarta planes y progresos abandonados"""
+    now = time.time() if now is None else now
+    
+    stalePeers = [ip for ip, lastSeen in list(peerLastSeen.items()) if now - lastSeen > PEER_TTL]
+    stalePeers = [ip for ip in stalePeers
+                  if removePeer(ip, persistChanges=True, staleBefore=now - PEER_TTL) is not None]
+    
+    expiredRequests = 0
+    with registryLock:
+        while pendingRequests:
+            key, oldest = next(iter(pendingRequests.items()))
+            if now - oldest.get("requestedAt", now) <= PENDING_TTL:
+                break
+            setPending(key, None)
+            persistPending(key)
+            expiredRequests += 1
+    
+    staleProgress = []
+    for key, lastUpdate in download_progress.lastUpdates():
+        if now - lastUpdate <= PROGRESS_TTL:
+            continue
+        with progressLocks(key):
+            # Puede haberse actualizado mientras se recorría la lista
+            progress = download_progress.get(key)
+            if progress is not None and now - progress["last_update"] > PROGRESS_TTL:
+                dropProgress(key)
+                persistProgress(key)
+                staleProgress.append(key)
+    
+    if stalePeers or expiredRequests or staleProgress:
+        print(f"[Tracker] Limpieza: {len(stalePeers)} peers, {expiredRequests} solicitudes, "
+              f"{len(staleProgress)} progresos eliminados")
+    return len(stalePeers), expiredRequests, len(staleProgress)
+
+def sweeperLoop():
+    while True:
+        time.sleep(SWEEP_INTERVAL)
+        try:
+            with sharedWrite():
+                sweepStale()
+        except Exception as e:
+            print(f"[Tracker] Error en limpieza: {e}")
+
+def rarestFirst(fileName, segments, rng):
+    """Ordena los segmentos del menos al más replicado.
+
+    Los empates se rompen al azar con el generador de cada solicitud, para que
+    descargadores simultáneos no pidan los mismos segmentos en el mismo orden.
+    """
+    counts = availability.get(fileName, [])
+    return sorted(segments, key=lambda segment: (counts[segment] if segment < len(counts) else 0, rng.random()))
+
+# Cuántos peers entran como máximo en un plan de descarga (numwant), salvo
+# que el nodo pida otra cantidad
+DEFAULT_NUMWANT = int(os.environ.get("TRACKER_NUMWANT", 50))
+MAX_NUMWANT = 200
+# En enjambres grandes sólo se evalúan SAMPLE_POOL × numwant peers tomados al
+# azar, más algunos seeders y los dueños de los segmentos que la muestra no
+# cubre (ver candidatePool)
+SAMPLE_POOL = 4
+
+def requestedNumwant(data):
+    try:
+        numwant = int(data.get("numwant", DEFAULT_NUMWANT))
+    except (TypeError, ValueError):
+        numwant = DEFAULT_NUMWANT
+    return max(1, min(numwant, MAX_NUMWANT))
+
+def segmentMask(bitfield, length):
+    """Bits del bitfield como entero de `length` bytes"""
+    bits = bitfield.bits[:length]
+    return int.from_bytes(bits, "big") << (8 * (length - len(bits)))
+
+def samplePeers(holders, segments, numwant, rng, shares):
+    """Elige hasta `numwant` de los candidatos [(IP, bitfield)].
+
+    El orden es aleatorio pero sesgado hacia los peers con más segmentos y
+    más rendimiento disponible para un descargador más (`shares`, por IP)
+    (muestreo ponderado sin reemplazo: cada peer
+    recibe la clave u^(1/peso) y se ordena por ella). En ese orden se toman
+    primero los peers que aportan algún segmento pedido que ninguno de los ya
+    elegidos tiene, para no dejar sin fuente a los segmentos raros, y los
+    lugares que quedan se llenan con el resto.
+    """
+    if len(holders) <= numwant:
+        return holders
+    
+    def key(candidate):
+        ip, bitfield = candidate
+        weight = len(bitfield) / max(bitfield.size, 1) * shares[ip]
+        return rng.random() ** (1.0 / weight) if weight > 0 else 0.0
+    
+    wanted = Bitfield()
+    wanted.update(segments)
+    length = len(wanted.bits)
+    uncovered = int.from_bytes(wanted.bits, "big")
+    chosen = []
+    rest = []
+    for candidate in sorted(holders, key=key, reverse=True):
+        if uncovered and len(chosen) < numwant:
+            mask = segmentMask(candidate[1], length)
+            if mask & uncovered:
+                uncovered &= ~mask
+                chosen.append(candidate)
+                continue
+        rest.append(candidate)
+    return chosen + rest[:numwant - len(chosen)]
+
+def candidatePool(fileName, segments, numwant, rng, exclude=None, now=None):
+    """IPs a evaluar para un plan en un enjambre grande.
+
+    Son SAMPLE_POOL × numwant peers al azar y hasta numwant seeders al azar.
+    Si aun así algún segmento pedido que alguien tiene no lo tiene nadie de la
+    muestra, se buscan sus dueños en el enjambre hasta cubrirlos a todos: un
+    segmento raro lo tienen pocos peers, así que no hay otra forma de
+    encontrarlos. Sólo ese caso recorre el enjambre, y sin copiarlo.
+    """
+    holders = holdersOf(fileName)
+    everyone = holderSample.get(fileName)
+    if everyone is None:
+        return []
+    pool = set(everyone.sample(SAMPLE_POOL * numwant, rng))
+    seeders = seederSample.get(fileName)
+    if seeders is not None:
+        pool.update(seeders.sample(numwant, rng))
+    
+    counts = availability.get(fileName, [])
+    wanted = Bitfield()
+    wanted.update(segment for segment in segments if segment < len(counts) and counts[segment] > 0)
+    length = len(wanted.bits)
+    uncovered = int.from_bytes(wanted.bits, "big")
+    
+    def contributes(ip):
+        holder = holders.get(ip)
+        if holder is None or ip == exclude or not isAlive(ip, now):
+            return 0
+        return segmentMask(holder["bitfield"], length) & uncovered
+    
+    for ip in pool:
+        if not uncovered:
+            break
+        uncovered &= ~contributes(ip)
+    if uncovered:
+        for ip in everyone.scan():
+            if ip in pool:
+                continue
+            mask = contributes(ip)
+            if mask:
+                pool.add(ip)
+                uncovered &= ~mask
+                if not uncovered:
+                    break
+    return list(pool)
+
+def assignSegments(fileName, segments, exclude=None, rng=None, numwant=None):
+    """Reparte los segmentos entre los peers que realmente los tienen.
+
+    Los segmentos se recorren en orden rarest-first y cada uno va al peer que
+    terminaría antes su parte entre los que lo tienen: segmentos asignados /
+    la parte de su rendimiento medido que le tocaría a este descargador
+    (repartido entre los que ya le están descargando, ver seederLoad). Así un
+    enlace lento o una fuente ocupada reciben menos trabajo. Cada lista
+    asignada queda en ese mismo orden, que es en el que el nodo debe pedirlos.
+
+    Con `numwant` el plan usa como mucho esa cantidad de peers (ver
+    samplePeers), elegidos de candidatePool; sin él, todos los que tienen el
+    archivo.
+
+    No toma locks: trabaja con los bitfields vigentes al empezar, que nadie
+    modifica en el lugar.
+
+    Devuelve ({IP: [segmentos]}, [segmentos sin ningún peer que los tenga]).
+    """
+    rng = rng or random.Random()
+    now = time.time()
+    index = holdersOf(fileName)
+    if numwant is not None and len(index) > SAMPLE_POOL * numwant:
+        pool = candidatePool(fileName, segments, numwant, rng, exclude, now)
+    else:
+        pool = list(index)
+    entries = [(ip, index.get(ip)) for ip in pool]
+    holders = [(ip, holder["bitfield"]) for ip, holder in entries
+               if holder is not None and ip != exclude and len(holder["bitfield"]) and isAlive(ip, now)]
+    # El plan anterior de este mismo descargador se va a reemplazar: no cuenta
+    previous = planLoad.get((exclude, fileName), {})
+    rates = throughputWeights([ip for ip, _ in holders])
+    shares = {ip: rates[ip] / (1 + max(seederLoad.get(ip, 0) - (ip in previous), 0)) for ip, _ in holders}
+    if numwant is not None:
+        holders = samplePeers(holders, segments, numwant, rng, shares)
+    rng.shuffle(holders)
+    assigned = {ip: [] for ip, _ in holders}
+    unavailable = []
+    for segment in rarestFirst(fileName, segments, rng):
+        candidates = [ip for ip, bitfield in holders if segment in bitfield]
+        if not candidates:
+            unavailable.append(segment)
+            continue
+        ip = min(candidates, key=lambda candidate: (len(assigned[candidate]) + 1) / shares[candidate])
+        assigned[ip].append(segment)
+    return assigned, unavailable
+
+def progressEntry(progress_key, ip, filename, total_segments):
+    """Obtiene (o crea) el registro de progreso de una descarga.
+    Requiere progressLocks(progress_key)."""
+    progress = download_progress.get(progress_key)
+    if progress is None:
+        progress = download_progress[progress_key] = {
+            "ip": ip,
+            "filename": filename,
+            "total_segments": total_segments,
+            "downloaded_segments": Bitfield(total_segments),
+            "last_update": time.time()
+        }
+        with registryLock:
+            progress_by_ip.setdefault(ip, set()).add(filename)
+    return progress
+
+def progressSnapshot(progress_key):
+    """Copia del progreso de una descarga (o None) para leerla sin locks"""
+    with progressLocks(progress_key):
+        progress = download_progress.get(progress_key)
+        if progress is None:
+            return None
+        return dict(progress, downloaded_segments=progress["downloaded_segments"].copy())
+
+def dropProgress(progress_key):
+    """Elimina el progreso de una descarga y su entrada en el índice por IP.
+    Requiere progressLocks(progress_key)."""
+    progress = download_progress.pop(progress_key, None)
+    if progress is None:
+        return None
+    ip, filename = progress_key
+    with registryLock:
+        files = progress_by_ip.get(ip)
+        if files is not None:
+            files.discard(filename)
+            if not files:
+                del progress_by_ip[ip]
+    return progress
+
+def peerList():
+    """Copia de los peers registrados para serializarla sin locks"""
+    with registryLock:
+        return [dict(peer) for peer in peers.values()]
+
+def fileSummary(fileName):
+    """Metadatos de un archivo sin recorrer la red: tamaño, peers que lo tienen
+    y resumen de la disponibilidad por segmento. None si nadie lo tiene."""
+    with fileLocks(fileName):
+        holders = holdersOf(fileName)
+        if not holders:
+            return None
+        files = [holder["file"] for holder in holders.values()]
+        complete = sum(1 for holder in holders.values()
+                       if len(holder["bitfield"]) >= holder["file"]["numSegments"])
+        counts = list(availability.get(fileName, ()))
+        version = fileVersions.get(fileName, 0)
+    
+    numSegments = files[0]["numSegments"]
+    counts = (counts + [0] * numSegments)[:numSegments]
+    fileSize = next((file["fileSize"] for file in files if file.get("fileSize") is not None), None)
+    segmentSize = next((file["segmentSize"] for file in files if file.get("segmentSize") is not None), None)
+    return {
+        "fileName": fileName,
+        "numSegments": numSegments,
+        "fileSize": fileSize,
+        "segmentSize": segmentSize,
+        "holders": len(files),
+        "seeders": complete,
+        "availability": {
+            "min": min(counts, default=0),
+            "max": max(counts, default=0),
+            "mean": sum(counts) / numSegments if numSegments else 0,
+            "unavailable": counts.count(0),
+        },
+        "version": f"{fileCatalog.epoch}-{version}",
+    }
+
+# --- Codificación de las peticiones y respuestas ------------------------
+# Los nodos que piden "Accept: application/x-msgpack" reciben las respuestas
+# en MessagePack (ver Wire) y pueden enviar sus cuerpos igual. En ese modo las
+# IPs de los peers van en 6 bytes y los bitfields en bytes crudos, no en base64
+
+def wantsCompact():
+    return request.accept_mimetypes.best_match([Wire.JSON_TYPE, Wire.CONTENT_TYPE]) == Wire.CONTENT_TYPE
+
+def readPayload():
+    """Cuerpo de la petición, en JSON o en la codificación compacta"""
+    if request.mimetype == Wire.CONTENT_TYPE:
+        return Wire.unpackb(request.get_data())
+    return request.get_json()
+
+def reply(payload, status=200):
+    """Respuesta en la codificación que pidió el cliente"""
+    if wantsCompact():
+        return app.response_class(Wire.packb(payload), status=status, mimetype=Wire.CONTENT_TYPE)
+    return jsonify(payload), status
+
+def compactPeers(entries):
+    """Entradas de peers para la respuesta: con la codificación compacta la IP va en 6 bytes"""
+    if not wantsCompact():
+        return entries
+    return [dict(entry, IP=Wire.packPeer(entry["IP"], NODE_PORT)) for entry in entries]
+
+def catalogResponse(catalog, full, delta):
+    """Respuesta condicional de un catálogo versionado.
+
+    - 304 si el cliente ya tiene la versión actual (If-None-Match o ?since=)
+    - con ?since=<versión>, `delta(claves, versión)` con sólo lo que cambió
+      (claves None: el cliente está demasiado atrasado y se envía todo)
+    - sin parámetros, `full()` completo, como siempre
+
+    La versión se toma antes de leer el estado: lo que cambie mientras se arma
+    la respuesta se vuelve a enviar en la siguiente, nunca se pierde.
+    """
+    token = catalog.token()
+    since = request.args.get("since")
+    if since == token or request.if_none_match.contains(token):
+        response = app.response_class(status=304)
+    elif since is not None:
+        response = jsonify(delta(catalog.changesSince(since), token))
+    else:
+        response = jsonify(full())
+    response.set_etag(token)
+    return response
+
+# --- Cluster de trackers -------------------------------------------------
+
+def ownsFile(fileName):
+    # Sin cluster (sólo este tracker, o ninguno) todo es nuestro; un anillo de
+    # un solo tracker que no es este no nos deja nada
+    if not len(ring) or (len(ring) == 1 and SELF in ring):
+        return True
+    return ring.owner(fileName) == SELF
+
+def misdirected(fileName):
+    """Respuesta 421 si el archivo le pertenece a otro tracker (None si es nuestro)"""
+    if ownsFile(fileName):
+        return None
+    return reply({'error': 'El archivo pertenece a otro tracker',
+                  'owner': ring.owner(fileName), 'shards': list(ring)}, 421)
+
+def setShards(shards):
+    global ring
+    ring = HashRing(shards or [SELF])
+
+def applyRingRecord(ip, name, value, data=None):
+    if value is not None:
+        setShards(value["shards"])
+
+recordAppliers["ring"] = applyRingRecord
+
+def filesHeld():
+    """Nombres de archivo de los que este tracker guarda algún estado"""
+    names = set(fileIndex)
+    names.update(name for _, name in list(download_progress))
+    with registryLock:
+        names.update(name for _, name in pendingRequests)
+    return names
+
+def exportFiles(fileNames):
+    """Estado de estos archivos (peers que los tienen, progresos y planes) para
+    entregarlo a otro tracker, en el formato que recibe /importFiles"""
+    wanted = set(fileNames)
+    progress = [progressSnapshot(key) for key in list(download_progress) if key[1] in wanted]
+    with registryLock:
+        pending = [value for key, value in pendingRequests.items() if key[1] in wanted]
+    files = []
+    for fileName in fileNames:
+        with fileLocks(fileName):
+            holders = [{"IP": ip, "file": dict(holder["file"]), "bitfield": holder["bitfield"].encode()}
+                       for ip, holder in holdersOf(fileName).items()]
+        files.append({"fileName": fileName, "holders": holders})
+    ips = {holder["IP"] for file in files for holder in file["holders"]}
+    ips.update(entry["ip"] for entry in progress if entry is not None)
+    ips.update(value["IP"] for value in pending)
+    with registryLock:
+        peerInfo = [{key: val for key, val in peers[ip].items() if key != "Files"} for ip in ips if ip in peers]
+    return {
+        "peers": peerInfo,
+        "files": files,
+        "progress": [{"IP": entry["ip"], "fileName": entry["filename"], "total_segments": entry["total_segments"],
+                      "downloaded_segments": entry["downloaded_segments"].encode(),
+                      "last_update": entry["last_update"]}
+                     for entry in progress if entry is not None],
+        "pending": pending,
+    }
+
+def dropFile(fileName):
+    """Olvida todo el estado de un archivo que ahora pertenece a otro tracker"""
+    with sharedWrite():
+        for key in [key for key in list(download_progress) if key[1] == fileName]:
+            with progressLocks(key):
+                if dropProgress(key) is not None:
+                    persistProgress(key)
+        with fileLocks(fileName):
+            for ip in list(holdersOf(fileName)):
+                removeHolder(ip, fileName)
+                persistHolder(ip, fileName)
+        with registryLock:
+            for key in [key for key in pendingRequests if key[1] == fileName]:
+                setPending(key, None)
+                persistPending(key)
+
+def handOff(batch=200):
+    """Entrega a su nuevo dueño cada archivo que este tracker ya no posee.
+
+    Sólo se mueven los archivos cuyo dueño cambió. Si un envío falla, el
+    estado se conserva aquí para reintentar con otro /rebalance.
+    """
+    moved = {}
+    for fileName in sorted(filesHeld()):
+        if not ownsFile(fileName):
+            moved.setdefault(ring.owner(fileName), []).append(fileName)
+    handed = 0
+    errors = []
+    for owner, fileNames in moved.items():
+        for start in range(0, len(fileNames), batch):
+            chunk = fileNames[start:start + batch]
+            try:
+                response = clusterSession.post(f"http://{owner}/importFiles", json=exportFiles(chunk), timeout=30)
+                response.raise_for_status()
+            except Exception as e:
+                errors.append(f"{owner}: {e}")
+                continue
+            for fileName in chunk:
+                dropFile(fileName)
+            handed += len(chunk)
+    return handed, errors
+
+print(f"=== INICIANDO TRACKER EN IP: {HOST}:{PORT} ===")
+
+# En modo prefork, cada petición ve lo que escribieron los otros procesos
+@app.before_request
+def syncBeforeRequest():
+    if shared:
+        catchUp()
 
 # Servicio para que un nodo entre a la red
 @app.route('/enterNetwork', methods=['POST'])
+@writesState
 def enterNetwork():
     try:
-        potencialPeer = request.get_json()
+        potencialPeer = readPayload()
         print(f"\n[Tracker] Solicitud de entrada a la red desde IP: {potencialPeer.get('IP')}")
         
-        registredIP = [peer["IP"] for peer in peers]
-        
-        if potencialPeer['IP'] in registredIP:
-            print(f"[Tracker] IP {potencialPeer['IP']} ya existe en la red")
-            return jsonify({'location': 'Nodo ya perteneciente a la red bitTorrent'}), 200
-        
-        # Si no es así, agregalo al arreglo de peers
-        peers.append(potencialPeer)
+        files = potencialPeer.get("Files", [])
+        with registryLock:
+            known = potencialPeer['IP'] in peers
+            if known:
+                print(f"[Tracker] IP {potencialPeer['IP']} ya existe en la red")
+            else:
+                # Si no es así, agregalo al registro de peers
+                peers[potencialPeer["IP"]] = dict(potencialPeer, Files=[])
+                persistPeer(potencialPeer["IP"])
+            touchPeer(potencialPeer["IP"])
+        if not known:
+            peerCatalog.changed(potencialPeer["IP"])
+        # Cada tracker del cluster sólo indexa los archivos que le pertenecen.
+        # Un peer ya conocido que vuelve a entrar (p. ej. tras reiniciarse)
+        # reemplaza lo que tenía anunciado de esos archivos
+        for file in files:
+            if not ownsFile(file["fileName"]):
+                continue
+            with fileLocks(file["fileName"]):
+                indexFile(potencialPeer["IP"], file)
+                persistHolder(potencialPeer["IP"], file["fileName"])
+        if known:
+            return reply({'location': 'Nodo ya perteneciente a la red bitTorrent', 'shards': list(ring)}, 200)
         print(f"[Tracker] Peer {potencialPeer['IP']} agregado exitosamente")
         print(f"[Tracker] Archivos que reporta: {potencialPeer.get('Files', [])}")
         print(f"[Tracker] Total de peers en red: {len(peers)}")
 
-        return jsonify({'location': 'Se ha agregado su nodo a la red.'}), 201
+        return reply({'location': 'Se ha agregado su nodo a la red.', 'shards': list(ring)}, 201)
     except Exception as e:
         print(f"[Tracker] Error en enterNetwork: {e}")
-        return jsonify({'error': str(e)}), 500
+        return reply({'error': str(e)}, 500)
+
+# Servicio de heartbeat: el peer avisa que sigue vivo.
+# Si el tracker ya lo expulsó responde 404 para que vuelva a unirse
+@app.route('/heartbeat', methods=['POST'])
+def heartbeat():
+    try:
+        ip = readPayload().get("IP")
+        if ip not in peers:
+            return reply({'status': 'unknown_peer'}, 404)
+        touchPeer(ip)
+        return reply({'status': 'alive', 'interval': PEER_TTL / 4, 'shards': list(ring)}, 200)
+    except Exception as e:
+        print(f"[Tracker] Error en heartbeat: {e}")
+        return reply({'error': str(e)}, 500)
 
 # Servicio para verificar y reanudar descargas pendientes
 @app.route('/resumeDownload', methods=['POST'])
 def resumeDownload():
     try:
-        data = request.get_json()
+        data = readPayload()
         ip = data.get("IP")
         filename = data.get("fileName")
         
         print(f"\n[Tracker] Solicitud de reanudación para {ip} - Archivo: {filename}")
+        wrongShard = misdirected(filename)
+        if wrongShard is not None:
+            return wrongShard
+        touchPeer(ip)
         
         # Buscar si hay progreso guardado para esta descarga
-        progress_key = f"{ip}_{filename}"
+        progress_key = (ip, filename)
+        progress = progressSnapshot(progress_key)
         
-        if progress_key in download_progress:
-            progress = download_progress[progress_key]
-            downloaded_segments = sorted(progress.get("downloaded_segments", []))
-            total_segments = progress.get("total_segments", 0)
+        if progress is not None:
+            bitfield = progress["downloaded_segments"]
+            total_segments = progress.get("total_segments") or 0
+            downloaded_segments = bitfield.present()
             
-            print(f"[Tracker] Progreso encontrado: {len(downloaded_segments)}/{total_segments} segmentos")
+            print(f"[Tracker] Progreso encontrado: {len(bitfield)}/{total_segments} segmentos")
             
-            # Verificar qué segmentos faltan
-            all_segments = set(range(total_segments))
-            downloaded_set = set(downloaded_segments)
-            missing_segments = sorted(list(all_segments - downloaded_set))
+            # Verificar qué segmentos faltan directamente desde el bitfield
+            missing_segments = bitfield.missing(total_segments)
             
             print(f"[Tracker] Segmentos faltantes: {missing_segments}")
             
-            # Buscar peers que tengan el archivo
-            availablePeers = []
-            for peer in peers:
-                for file in peer.get("Files", []):
-                    if file["fileName"] == filename and file["currentSegments"] / file["numSegments"] >= 0.2:
-                        availablePeers.append({
-                            "IP": peer["IP"],
-                            "currentSegments": file["currentSegments"],
-                            "numSegments": file["numSegments"]
-                        })
-            
-            if availablePeers and missing_segments:
-                # Ordenar peers por segmentos disponibles
-                availablePeers = sorted(availablePeers, key=lambda x: x["currentSegments"])
-                
-                # Distribuir segmentos faltantes entre los peers disponibles
-                # Primero, agrupar segmentos faltantes por rango
-                segments_to_download = missing_segments
-                
-                # Asignar segmentos a peers
-                assigned_segments = {}
-                for i, peer in enumerate(availablePeers):
-                    assigned_segments[peer["IP"]] = []
-                
-                # Distribuir segmentos equitativamente
-                for idx, segment in enumerate(segments_to_download):
-                    peer_idx = idx % len(availablePeers)
-                    peer_ip = availablePeers[peer_idx]["IP"]
-                    assigned_segments[peer_ip].append(segment)
+            # Asignar cada segmento faltante a un peer que realmente lo tenga
+            if missing_segments:
+                holders = holdersOf(filename)
+                assigned_segments, unavailable = assignSegments(filename, missing_segments, exclude=ip,
+                                                                numwant=requestedNumwant(data))
+                if unavailable:
+                    print(f"[Tracker] Segmentos sin fuente disponible: {len(unavailable)}")
                 
                 # Crear lista de peers con sus segmentos asignados
                 peers_with_assignments = []
-                for peer in availablePeers:
-                    if assigned_segments[peer["IP"]]:
-                        segments = sorted(assigned_segments[peer["IP"]])
+                for holderIP, segments in assigned_segments.items():
+                    holder = holders.get(holderIP)
+                    if segments and holder is not None:
+                        file = holder["file"]
                         peers_with_assignments.append({
-                            "IP": peer["IP"],
-                            "numSegments": peer["numSegments"],
+                            "IP": holderIP,
+                            "numSegments": file["numSegments"],
+                            "segmentSize": file.get("segmentSize"),
+                            "fileSize": file.get("fileSize"),
                             "segments_to_download": segments,
                             "total_assigned": len(segments)
                         })
                 
                 if peers_with_assignments:
-                    return jsonify({
+                    with sharedWrite(), registryLock:
+                        setPending(progress_key, {
+                            "IP": ip,
+                            "File2Download": filename,
+                            "peersAndLeechers": peers_with_assignments,
+                            "requestedAt": time.time()
+                        })
+                        persistPending(progress_key)
+                    return reply({
                         'status': 'resume_available',
                         'filename': filename,
                         'downloaded_segments': downloaded_segments,
                         'missing_segments': missing_segments,
                         'total_segments': total_segments,
-                        'peers': peers_with_assignments
-                    }), 200
+                        'unavailable_segments': unavailable,
+                        'peers': compactPeers(peers_with_assignments)
+                    }, 200)
         
-        return jsonify({'status': 'no_resume_data'}), 200
+        return reply({'status': 'no_resume_data'}, 200)
         
     except Exception as e:
         print(f"[Tracker] Error en resumeDownload: {e}")
-        return jsonify({'error': str(e)}), 500
+        return reply({'error': str(e)}, 500)
 
 # Servicio que actualiza el progreso de descarga
 @app.route('/updateDownloadProgress', methods=['POST'])
+@writesState
 def updateDownloadProgress():
     try:
-        data = request.get_json()
+        data = readPayload()
         ip = data.get("IP")
         filename = data.get("fileName")
         segment = data.get("segment")
-        total_segments = data.get("total_segments")
-        
-        progress_key = f"{ip}_{filename}"
+        wrongShard = misdirected(filename)
+        if wrongShard is not None:
+            return wrongShard
+        total_segments = segmentCount(filename, data.get("total_segments"))
+        if total_segments is None or checkedSegments(total_segments, [segment]) is None:
+            return invalidSegments()
+        touchPeer(ip)
         
-        if progress_key not in download_progress:
-            download_progress[progress_key] = {
-                "ip": ip,
-                "filename": filename,
-                "total_segments": total_segments,
-                "downloaded_segments": [],
-                "last_update": time.time()
-            }
+        progress_key = (ip, filename)
         
-        # Agregar segmento a la lista si no existe
-        if segment not in download_progress[progress_key]["downloaded_segments"]:
-            download_progress[progress_key]["downloaded_segments"].append(segment)
-            download_progress[progress_key]["last_update"] = time.time()
-            print(f"[Tracker] Progreso actualizado para {progress_key}: Segmento {segment}")
+        with progressLocks(progress_key):
+            progress = progressEntry(progress_key, ip, filename, total_segments)
+            
+            # Marcar el segmento en el bitfield si no estaba
+            if progress["downloaded_segments"].set(segment):
+                progress["last_update"] = time.time()
+                announceSegments(ip, filename, total_segments, [segment])
+                releaseDelivered(progress_key, progress["downloaded_segments"])
+                persistProgress(progress_key)
+                print(f"[Tracker] Progreso actualizado para {progress_key}: Segmento {segment}")
         
-        return jsonify({'status': 'progress_updated'}), 200
+        return reply({'status': 'progress_updated'}, 200)
         
     except Exception as e:
         print(f"[Tracker] Error en updateDownloadProgress: {e}")
-        return jsonify({'error': str(e)}), 500
+        return reply({'error': str(e)}, 500)
+
+# Servicio que actualiza el progreso de descarga en lote.
+# Acepta una lista de segmentos y/o rangos [inicio, fin) en una sola petición
+@app.route('/updateDownloadProgressBatch', methods=['POST'])
+@writesState
+def updateDownloadProgressBatch():
+    try:
+        data = readPayload()
+        ip = data.get("IP")
+        filename = data.get("fileName")
+        wrongShard = misdirected(filename)
+        if wrongShard is not None:
+            return wrongShard
+        total_segments = segmentCount(filename, data.get("total_segments"))
+        received = None
+        if total_segments is not None:
+            received = checkedSegments(total_segments, data.get("segments", []), data.get("ranges", []))
+        if received is None:
+            return invalidSegments()
+        touchPeer(ip)
+        
+        progress_key = (ip, filename)
+        
+        with progressLocks(progress_key):
+            progress = progressEntry(progress_key, ip, filename, total_segments)
+            bitfield = progress["downloaded_segments"]
+            added = bitfield.update(received)
+            if added:
+                progress["last_update"] = time.time()
+                # Lo descargado ya puede servirse a otros peers
+                announceSegments(ip, filename, total_segments, received)
+                releaseDelivered(progress_key, bitfield)
+                persistProgress(progress_key)
+                print(f"[Tracker] Progreso actualizado para {progress_key}: {added} segmentos nuevos ({len(bitfield)}/{total_segments})")
+        
+        return reply({'status': 'progress_updated', 'added': added}, 200)
+        
+    except Exception as e:
+        print(f"[Tracker] Error en updateDownloadProgressBatch: {e}")
+        return reply({'error': str(e)}, 500)
+
+# Servicio que recibe el rendimiento medido por un nodo al descargar de otros peers
+@app.route('/reportThroughput', methods=['POST'])
+@writesState
+def reportThroughput():
+    try:
+        data = readPayload()
+        measurements = data.get("measurements", [])
+        
+        for measurement in measurements:
+            recordThroughput(measurement["IP"], measurement.get("bytes", 0), measurement.get("seconds", 0))
+        
+        print(f"[Tracker] Rendimiento reportado por {data.get('IP')}: {len(measurements)} mediciones")
+        
+        return reply({'status': 'throughput_recorded'}, 200)
+        
+    except Exception as e:
+        print(f"[Tracker] Error en reportThroughput: {e}")
+        return reply({'error': str(e)}, 500)
 
 # Servicio que elimina progreso de descarga completada
 @app.route('/completeDownload', methods=['POST'])
+@writesState
 def completeDownload():
     try:
-        data = request.get_json()
+        data = readPayload()
         ip = data.get("IP")
         filename = data.get("fileName")
+        wrongShard = misdirected(filename)
+        if wrongShard is not None:
+            return wrongShard
         
-        progress_key = f"{ip}_{filename}"
+        progress_key = (ip, filename)
         
-        if progress_key in download_progress:
-            del download_progress[progress_key]
-            print(f"[Tracker] Progreso eliminado para {progress_key}")
+        with progressLocks(progress_key):
+            if dropProgress(progress_key) is not None:
+                persistProgress(progress_key)
+                print(f"[Tracker] Progreso eliminado para {progress_key}")
+        # El plan terminó: sus fuentes quedan libres
+        with registryLock:
+            if progress_key in pendingRequests:
+                setPending(progress_key, None)
+                persistPending(progress_key)
         
-        return jsonify({'status': 'download_completed'}), 200
+        return reply({'status': 'download_completed'}, 200)
         
     except Exception as e:
         print(f"[Tracker] Error en completeDownload: {e}")
-        return jsonify({'error': str(e)}), 500
+        return reply({'error': str(e)}, 500)
 
 # Servicio que verifica descargas pendientes
 @app.route('/verifyPendingDownloads', methods=["POST"])
@@ -188,11 +1757,14 @@ def verifyPendingDownloads():
         print(f"\n[Tracker] Verificando descargas pendientes para IP: {ip}")
         
         # Buscar progresos guardados
-        progress_keys = [key for key in download_progress.keys() if key.startswith(f"{ip}_")]
         progress_list = []
         
-        for key in progress_keys:
-            progress = download_progress[key]
+        with registryLock:
+            filenames = list(progress_by_ip.get(ip, ()))
+        for filename in filenames:
+            progress = download_progress.get((ip, filename))
+            if progress is None:
+                continue
             downloaded = len(progress["downloaded_segments"])
             total = progress["total_segments"]
             progress_percent = (downloaded / total * 100) if total > 0 else 0
@@ -221,268 +1793,488 @@ def verifyPendingDownloads():
 
 # Servicio que agrega un archivo a la red
 @app.route('/addFile/<ip>', methods=['PUT'])
+@writesState
 def addFile(ip: str):
     try:
         print(f"\n[Tracker] Solicitud de agregar archivo desde IP: {ip}")
         
-        # Busca al peer dentro del arreglo de peers
-        peer = next((p for p in peers if p['IP'] == ip), None)
+        # Busca al peer dentro del registro de peers
+        peer = peers.get(ip)
         if peer is None:
             print(f"[Tracker] ERROR: Peer {ip} no encontrado")
-            return jsonify({'error': 'No se identificó el peer.'}), 404
+            return reply({'error': 'No se identificó el peer.'}, 404)
+        touchPeer(ip)
 
-        updatedFiles = request.get_json()
+        updatedFiles = readPayload()
         print(f"[Tracker] Archivos recibidos: {updatedFiles}")
+        for file in updatedFiles.get("addedFiles", []):
+            wrongShard = misdirected(file["fileName"])
+            if wrongShard is not None:
+                return wrongShard
 
-        # Segmento que ayuda a la actualización del peer
-        auxDic = {file["fileName"]: file for file in peer.get("Files", [])}
-        
+        # indexFile reemplaza en la lista del peer el archivo del mismo nombre
         for file in updatedFiles.get("addedFiles", []):
-            auxDic[file["fileName"]] = file
+            with fileLocks(file["fileName"]):
+                indexFile(ip, file)
+                persistHolder(ip, file["fileName"])
             print(f"[Tracker] Archivo agregado/actualizado: {file['fileName']} con {file['numSegments']} segmentos")
         
-        peer["Files"] = list(auxDic.values())
-        
         print(f"[Tracker] Archivos actualizados del peer {ip}: {peer['Files']}")
-        print(f"[Tracker] Total de archivos en la red ahora: {sum(len(p.get('Files', [])) for p in peers)}")
+        print(f"[Tracker] Total de archivos en la red ahora: {len(fileIndex)}")
 
-        return jsonify({'message': 'Archivos actualizados exitosamente', 'peers': peers}), 200
+        if wantsCompact():
+            # Sólo las direcciones: el nodo no necesita los archivos de cada peer
+            return reply({'message': 'Archivos actualizados exitosamente',
+                          'peers': [Wire.packPeer(peerIP, NODE_PORT) for peerIP in list(peers)]}, 200)
+        return reply({'message': 'Archivos actualizados exitosamente', 'peers': peerList()}, 200)
     except Exception as e:
         print(f"[Tracker] Error en addFile: {e}")
-        return jsonify({'error': str(e)}), 500
+        return reply({'error': str(e)}, 500)
 
-# Servicio que devuelve todos los archivos de la red
+MAX_PAGE_SIZE = 1000
+
+# Servicio que devuelve los archivos de la red, en orden alfabético.
+# Acepta If-None-Match y ?since=<versión> (ver catalogResponse), o una
+# búsqueda paginada con ?prefix=, ?q= (subcadena), ?limit= y ?cursor= (el
+# "next" de la página anterior)
 @app.route('/allFiles', methods=['GET'])
 def showFiles():
     try:
-        allFiles = set()
-        for peer in peers:
-            for file in peer.get("Files", []):
-                allFiles.add(file["fileName"])
+        if any(arg in request.args for arg in ("prefix", "q", "cursor", "limit")):
+            token = fileCatalog.token()
+            if request.if_none_match.contains(token):
+                response = app.response_class(status=304)
+            else:
+                limit = max(1, min(request.args.get("limit", 100, type=int), MAX_PAGE_SIZE))
+                names, more = catalogIndex.page(request.args.get("prefix", ""), request.args.get("q"),
+                                                request.args.get("cursor"), limit)
+                response = jsonify({'Files': names, 'next': names[-1] if more else None,
+                                    'total': len(catalogIndex), 'version': token})
+            response.set_etag(token)
+            return response
         
-        listAllFiles = list(allFiles)
+        def delta(changed, version):
+            if changed is None:
+                return {'version': version, 'full': True, 'Files': catalogIndex.all(), 'removed': []}
+            return {'version': version, 'full': False,
+                    'Files': [name for name in changed if name in fileIndex],
+                    'removed': [name for name in changed if name not in fileIndex]}
         
-        print(f"\n[Tracker] Consulta de archivos disponibles. Total: {len(listAllFiles)}")
+        print(f"\n[Tracker] Consulta de archivos disponibles. Total: {len(fileIndex)}")
         
-        return jsonify({'Files': listAllFiles}), 200
+        return catalogResponse(fileCatalog, lambda: {'Files': catalogIndex.all()}, delta)
     except Exception as e:
         print(f"[Tracker] Error en showFiles: {e}")
         return jsonify({'error': str(e)}), 500
 
+# Servicio que describe un archivo: segmentos, tamaño, cuántos peers lo tienen
+# y cuántas copias hay de cada segmento. Acepta If-None-Match con su versión
+@app.route('/file/<path:fileName>', methods=['GET'])
+def fileInfo(fileName):
+    try:
+        wrongShard = misdirected(fileName)
+        if wrongShard is not None:
+            return wrongShard
+        summary = fileSummary(fileName)
+        if summary is None:
+            return jsonify({'error': 'No se encontraron peers con el archivo solicitado'}), 404
+        if request.if_none_match.contains(summary["version"]):
+            response = app.response_class(status=304)
+        else:
+            response = jsonify(summary)
+        response.set_etag(summary["version"])
+        return response
+    except Exception as e:
+        print(f"[Tracker] Error en fileInfo: {e}")
+        return jsonify({'error': str(e)}), 500
+
 # Servicio que gestiona la descarga de un archivo
 @app.route("/downloadFile", methods=["POST"])
 def downloadFile():
     try:
-        informationForDownload = request.get_json()
+        informationForDownload = readPayload()
         fileName = informationForDownload.get("fileName")
         clientIP = informationForDownload.get("IP")
         
         print(f"\n[Tracker] Solicitud de descarga de: {fileName} por IP: {clientIP}")
+        wrongShard = misdirected(fileName)
+        if wrongShard is not None:
+            return wrongShard
+        touchPeer(clientIP)
         
         # Verificar si hay progreso previo
-        progress_key = f"{clientIP}_{fileName}"
+        progress_key = (clientIP, fileName)
         resume_mode = False
-        downloaded_segments = []
+        downloaded = None
         
-        if progress_key in download_progress:
+        progress = progressSnapshot(progress_key)
+        if progress is not None:
             resume_mode = True
-            downloaded_segments = download_progress[progress_key]["downloaded_segments"]
-            print(f"[Tracker] Modo reanudación. Segmentos ya descargados: {downloaded_segments}")
+            downloaded = progress["downloaded_segments"]
+            print(f"[Tracker] Modo reanudación. Segmentos ya descargados: {len(downloaded)}")
         
-        availablePeers = []
+        # Sin copiar el índice: un peer que se va mientras se arma la respuesta
+        # simplemente no aparece en ella
+        holders = holdersOf(fileName)
+        first = next(iter(holders.values()), None)
+        if first is None:
+            print(f"[Tracker] ERROR: No se encontraron peers con el archivo {fileName}")
+            return reply({'error': 'No se encontraron peers con el archivo solicitado'}, 404)
         
-        # Buscar peers que tengan el archivo
-        for peer in peers:
-            for file in peer.get("Files", []):
-                if file["fileName"] == fileName:
-                    # Verificar si tiene al menos 20% del archivo
-                    if file["currentSegments"] / file["numSegments"] >= 0.2:
-                        availablePeers.append({
-                            "IP": peer["IP"],
-                            "currentSegments": file["currentSegments"],
-                            "numSegments": file["numSegments"]
-                        })
+        total_segments = first["file"]["numSegments"]
+        
+        # Si es modo reanudación, asignar solo segmentos faltantes
+        if resume_mode and downloaded:
+            segments = downloaded.missing(total_segments)
+            print(f"[Tracker] Segmentos a descargar en reanudación: {len(segments)}")
+        else:
+            segments = range(total_segments)
+        
+        # Asignar cada segmento sólo a peers que lo tengan según su bitfield
+        assigned_segments, unavailable = assignSegments(fileName, segments, exclude=clientIP,
+                                                        numwant=requestedNumwant(informationForDownload))
+        if unavailable:
+            print(f"[Tracker] Segmentos sin fuente disponible: {len(unavailable)}")
+        
+        availablePeers = []
+        for holderIP, assigned in assigned_segments.items():
+            holder = holders.get(holderIP)
+            if assigned and holder is not None:
+                file = holder["file"]
+                availablePeers.append({
+                    "IP": holderIP,
+                    "currentSegments": file["currentSegments"],
+                    "numSegments": file["numSegments"],
+                    "segmentSize": file.get("segmentSize"),
+                    "fileSize": file.get("fileSize"),
+                    "segments_to_download": assigned
+                })
         
         if not availablePeers:
             print(f"[Tracker] ERROR: No se encontraron peers con el archivo {fileName}")
-            return jsonify({'error': 'No se encontraron peers con el archivo solicitado'}), 404
+            return reply({'error': 'No se encontraron peers con el archivo solicitado'}, 404)
         
         print(f"[Tracker] Peers disponibles para {fileName}: {len(availablePeers)}")
         
-        # Ordenar peers por segmentos disponibles
-        availablePeers = sorted(availablePeers, key=lambda x: x["currentSegments"])
+        # El plan queda registrado (también al reanudar) para contar la carga
+        # que les agrega a sus fuentes
+        downloadingResolution = {
+            "IP": clientIP,
+            "File2Download": fileName,
+            "peersAndLeechers": availablePeers,
+            "requestedAt": time.time()
+        }
         
-        # Si es modo reanudación, asignar solo segmentos faltantes
-        if resume_mode and downloaded_segments:
-            total_segments = availablePeers[0]["numSegments"]
-            all_segments = set(range(total_segments))
-            downloaded_set = set(downloaded_segments)
-            missing_segments = sorted(list(all_segments - downloaded_set))
-            
-            print(f"[Tracker] Segmentos a descargar en reanudación: {missing_segments}")
-            
-            # Distribuir segmentos faltantes entre peers
-            peers_with_assignments = []
-            for i, peer in enumerate(availablePeers):
-                # Asignar segmentos de forma equitativa
-                segments_for_this_peer = []
-                for idx, segment in enumerate(missing_segments):
-                    if idx % len(availablePeers) == i:
-                        segments_for_this_peer.append(segment)
-                
-                if segments_for_this_peer:
-                    peers_with_assignments.append({
-                        "IP": peer["IP"],
-                        "numSegments": peer["numSegments"],
-                        "segments_to_download": segments_for_this_peer
-                    })
-            
-            return jsonify({
+        with sharedWrite(), registryLock:
+            setPending(progress_key, downloadingResolution)
+            persistPending(progress_key)
+        
+        if resume_mode and downloaded:
+            return reply({
                 'Status': 'Reanudación disponible',
                 'mode': 'resume',
                 'information': {
                     "IP": clientIP,
                     "File2Download": fileName,
-                    "peers": peers_with_assignments,
-                    "downloaded_segments": downloaded_segments,
+                    "peers": compactPeers(availablePeers),
+                    "downloaded_segments": downloaded.present(),
+                    "missing_segments": segments,
+                    "unavailable_segments": unavailable,
                     "total_segments": total_segments
                 }
-            }), 200
+            }, 200)
         
         # Modo normal (descarga completa)
-        # Distribuir segmentos entre los peers disponibles
-        count = Counter(peer["numSegments"] for peer in availablePeers)
-        sortedSegments = sorted(count.keys())
-        
-        ranges = []
-        start = -1
-        
-        for num in sortedSegments:
-            occurrences = count[num]
-            rangeSize = num - start
-            
-            if rangeSize < occurrences:
-                print(f"[Tracker] ERROR: Rango insuficiente para dividir")
-                return jsonify({'error': 'Error en distribución de segmentos'}), 500
-            
-            base_size = rangeSize // occurrences
-            extra = rangeSize % occurrences
-            
-            for i in range(occurrences):
-                end = start + base_size + (1 if i < extra else 0)
-                ranges.append((start + 1, end))
-                start = end
-        
-        range_index = 0
-        for num in sortedSegments:
-            for _ in range(count[num]):
-                availablePeers[range_index]["StartingFile"] = ranges[range_index][0]
-                availablePeers[range_index]["LastFile"] = ranges[range_index][1]
-                range_index += 1
-        
-        # Crear copia con información de seguimiento
-        availablePeers2 = availablePeers.copy()
-        for peer in availablePeers2:
-            peer["trackerSegment"] = peer["StartingFile"]
-        
-        downloadingResolution = {
-            "IP": clientIP,
-            "File2Download": fileName,
-            "peersAndLeechers": availablePeers2
-        }
+        print(f"[Tracker] Descarga programada. Peers asignados: {len(availablePeers)}")
         
-        pendingRequests.append(downloadingResolution)
-        print(f"[Tracker] Descarga programada. Peers asignados: {availablePeers}")
-        
-        return jsonify({
+        return reply({
             'Status': 'Se han encontrado peers para proveer el archivo.',
             'mode': 'new',
             'information': {
                 "IP": clientIP,
                 "File2Download": fileName,
-                "peersAndLeechers": availablePeers
+                "peersAndLeechers": compactPeers(availablePeers),
+                "unavailable_segments": unavailable
             }
-        }), 200
+        }, 200)
         
     except Exception as e:
         print(f"[Tracker] Error en downloadFile: {e}")
-        return jsonify({'error': str(e)}), 500
+        return reply({'error': str(e)}, 500)
 
 # Servicio que actualiza la información de los peers
 @app.route('/updatePeers', methods=["POST"])
+@writesState
 def updatePeers():
     try:
-        newPeerInfo = request.get_json()
+        newPeerInfo = readPayload()
+        wrongShard = misdirected(newPeerInfo["fileName"])
+        if wrongShard is not None:
+            return wrongShard
         
         # Buscar el peer
-        peer = next((p for p in peers if newPeerInfo['IP'] == p["IP"]), None)
+        peer = peers.get(newPeerInfo['IP'])
         if peer is None:
-            return jsonify({'error': 'No se identificó el peer.'}), 404
-        
-        # Buscar el archivo en el peer
-        file = next((f for f in peer.get("Files", []) if f["fileName"] == newPeerInfo["fileName"]), None)
+            return reply({'error': 'No se identificó el peer.'}, 404)
+        touchPeer(peer["IP"])
         
-        if file is None:
-            # Si no existe, agregarlo
-            peer.setdefault("Files", []).append({
-                "fileName": newPeerInfo["fileName"],
-                "numSegments": newPeerInfo["numSegments"],
-                "currentSegments": newPeerInfo["currentSegments"]
-            })
-        else:
-            # Si existe, actualizar segmentos
-            file["currentSegments"] = newPeerInfo["currentSegments"]
+        # Buscar el archivo en el peer (si no existe, agregarlo)
+        fileName = newPeerInfo["fileName"]
+        with fileLocks(fileName):
+            numSegments = segmentCount(fileName, newPeerInfo.get("numSegments"))
+            if numSegments is None:
+                return invalidSegments()
+            haves = checkedSegments(numSegments, newPeerInfo.get("have", []), newPeerInfo.get("haveRanges", []))
+            if haves is None:
+                return invalidSegments()
+            holder = holdersOf(fileName).get(peer["IP"])
+            if holder is None:
+                file = {
+                    "fileName": fileName,
+                    "numSegments": numSegments,
+                    "currentSegments": newPeerInfo.get("currentSegments", 0)
+                }
+                if "bitfield" in newPeerInfo:
+                    file["bitfield"] = newPeerInfo["bitfield"]
+                holder = indexFile(peer["IP"], file)
+                if holder is None:
+                    return reply({'error': 'No se identificó el peer.'}, 404)
+            elif "bitfield" in newPeerInfo:
+                # Bitfield completo: reemplaza lo anunciado antes
+                replaceBitfield(fileName, holder, announcedBitfield(holder["file"]["numSegments"], newPeerInfo["bitfield"]))
+            
+            # Anuncios incrementales: segmentos sueltos o rangos [inicio, fin)
+            addHaves(fileName, holder, haves)
+            
+            file = holder["file"]
+            announced = "bitfield" in newPeerInfo or "have" in newPeerInfo or "haveRanges" in newPeerInfo
+            if not announced and "currentSegments" in newPeerInfo:
+                # Peers antiguos sólo reportan la cantidad de segmentos
+                if newPeerInfo["currentSegments"] >= file["numSegments"]:
+                    replaceBitfield(fileName, holder, fullBitfield(file["numSegments"]))
+                file["currentSegments"] = newPeerInfo["currentSegments"]
+            peerCatalog.changed(peer["IP"])
+            persistHolder(peer["IP"], fileName)
         
-        return jsonify({'message': 'Se ha actualizado el estatus del peer.'}), 200
+        return reply({'message': 'Se ha actualizado el estatus del peer.'}, 200)
     except Exception as e:
         print(f"[Tracker] Error en updatePeers: {e}")
-        return jsonify({'error': str(e)}), 500
+        return reply({'error': str(e)}, 500)
 
 @app.route('/pendingDownloads', methods=["GET"])
 def pendingDownloads():
-    return jsonify(pendingRequests)
+    with registryLock:
+        pending = list(pendingRequests.values())
+    return jsonify(pending)
 
+# Acepta If-None-Match y ?since=<versión> (ver catalogResponse)
 @app.route('/peers', methods=['GET'])
 def getPeers():
-    return jsonify(peers)
+    def delta(changed, version):
+        if changed is None:
+            return {'version': version, 'full': True, 'peers': peerList(), 'removed': []}
+        with registryLock:
+            changedPeers = [dict(peers[ip]) for ip in changed if ip in peers]
+            removed = [ip for ip in changed if ip not in peers]
+        return {'version': version, 'full': False, 'peers': changedPeers, 'removed': removed}
+    
+    return catalogResponse(peerCatalog, peerList, delta)
 # Servicio para sincronizar fragmentos locales
 @app.route('/syncFragments', methods=['POST'])
+@writesState
 def syncFragments():
     try:
-        data = request.get_json()
+        data = readPayload()
         ip = data.get("IP")
         filename = data.get("fileName")
-        fragments = data.get("fragments", [])
-        total_segments = data.get("total_segments", 0)
-        
-        progress_key = f"{ip}_{filename}"
-        
-        if progress_key not in download_progress:
-            download_progress[progress_key] = {
-                "ip": ip,
-                "filename": filename,
-                "total_segments": total_segments,
-                "downloaded_segments": fragments,
-                "last_update": time.time()
-            }
-        else:
-            # Combinar listas de fragmentos
-            existing = download_progress[progress_key]["downloaded_segments"]
-            combined = list(set(existing + fragments))
-            download_progress[progress_key]["downloaded_segments"] = sorted(combined)
-            download_progress[progress_key]["last_update"] = time.time()
+        wrongShard = misdirected(filename)
+        if wrongShard is not None:
+            return wrongShard
+        total_segments = segmentCount(filename, data.get("total_segments", 0))
+        fragments = None
+        if total_segments is not None:
+            fragments = checkedSegments(total_segments, data.get("fragments", []))
+        if fragments is None:
+            return invalidSegments()
+        touchPeer(ip)
+        
+        progress_key = (ip, filename)
+        
+        with progressLocks(progress_key):
+            progress = progressEntry(progress_key, ip, filename, total_segments)
+            
+            # Combinar fragmentos marcándolos en el bitfield
+            progress["downloaded_segments"].update(fragments)
+            announceSegments(ip, filename, total_segments, fragments)
+            releaseDelivered(progress_key, progress["downloaded_segments"])
+            progress["last_update"] = time.time()
+            persistProgress(progress_key)
         
         print(f"[Tracker] Fragmentos sincronizados para {progress_key}: {len(fragments)} fragmentos")
         
-        return jsonify({'status': 'synced'}), 200
+        return reply({'status': 'synced'}, 200)
         
     except Exception as e:
         print(f"[Tracker] Error en syncFragments: {e}")
+        return reply({'error': str(e)}, 500)
+
+# Servicio que informa qué trackers forman el cluster
+@app.route('/shards', methods=['GET'])
+def getShards():
+    return jsonify({'self': SELF, 'shards': list(ring)})
+
+# Servicio que cambia los trackers del cluster y entrega a su nuevo dueño los
+# archivos que ya no le tocan a este tracker
+@app.route('/rebalance', methods=['POST'])
+def rebalance():
+    try:
+        data = request.get_json()
+        shards = [shard for shard in data.get("shards", []) if shard]
+        if not shards:
+            return jsonify({'error': 'Se necesita al menos un tracker.'}), 400
+        previous = list(ring)
+        with sharedWrite():
+            setShards(shards)
+            persist("ring", "", "", {"shards": list(ring)})
+        print(f"[Tracker] Cluster actualizado: {previous} -> {list(ring)}")
+        
+        # El primero que recibe el cambio se lo pasa a los demás, también a
+        # los que salen del cluster para que entreguen sus archivos
+        notified = {}
+        if data.get("propagate", True):
+            for shard in sorted(set(previous) | set(ring)):
+                if shard == SELF:
+                    continue
+                try:
+                    response = clusterSession.post(f"http://{shard}/rebalance",
+                                             json={"shards": list(ring), "propagate": False}, timeout=120)
+                    notified[shard] = response.status_code
+                except Exception as e:
+                    notified[shard] = str(e)
+        
+        handed, errors = handOff()
+        print(f"[Tracker] Archivos entregados a otros trackers: {handed}")
+        status = 200 if not errors else 502
+        return jsonify({'shards': list(ring), 'handedOff': handed, 'errors': errors, 'notified': notified}), status
+    except Exception as e:
+        print(f"[Tracker] Error en rebalance: {e}")
+        return jsonify({'error': str(e)}), 500
+
+# Servicio que recibe de otro tracker el estado de los archivos que ahora le pertenecen
+@app.route('/importFiles', methods=['POST'])
+@writesState
+def importFiles():
+    try:
+        data = request.get_json()
+        now = time.time()
+        for info in data.get("peers", []):
+            with registryLock:
+                if info["IP"] in peers:
+                    continue
+                peers[info["IP"]] = dict(info, Files=[])
+                peerLastSeen[info["IP"]] = now
+                persistPeer(info["IP"])
+            peerCatalog.changed(info["IP"])
+        
+        for entry in data.get("files", []):
+            fileName = entry["fileName"]
+            with fileLocks(fileName):
+                for holder in entry["holders"]:
+                    # Lo que el peer anunció aquí directamente es más reciente
+                    if holder["IP"] in holdersOf(fileName):
+                        continue
+                    if indexFile(holder["IP"], dict(holder["file"], bitfield=holder["bitfield"])) is not None:
+                        persistHolder(holder["IP"], fileName)
+        
+        for entry in data.get("progress", []):
+            progress_key = (entry["IP"], entry["fileName"])
+            with progressLocks(progress_key):
+                progress = progressEntry(progress_key, entry["IP"], entry["fileName"], entry["total_segments"])
+                progress["downloaded_segments"].merge(Bitfield.decode(entry["total_segments"], entry["downloaded_segments"]))
+                progress["last_update"] = max(progress["last_update"], entry["last_update"])
+                persistProgress(progress_key)
+        
+        with registryLock:
+            for value in data.get("pending", []):
+                key = (value["IP"], value["File2Download"])
+                if key not in pendingRequests:
+                    setPending(key, value)
+                    persistPending(key)
+        
+        print(f"[Tracker] Archivos recibidos de otro tracker: {len(data.get('files', []))}")
+        return jsonify({'status': 'imported'}), 200
+    except Exception as e:
+        print(f"[Tracker] Error en importFiles: {e}")
         return jsonify({'error': str(e)}), 500
+
+def serveWorker(listener, index, server, workers):
+    """Proceso hijo del modo prefork: atiende peticiones en el socket compartido"""
+    global store, shared
+    store = TrackerStore(STATE_DB)
+    shared = True
+    shareVersions()
+    recoverState()
+    markApplied()
+    threading.Thread(target=syncLoop, daemon=True).start()
+    print(f"[Tracker] Proceso {index} (pid {os.getpid()}) atendiendo peticiones")
+    if server == "asyncio":
+        TrackerAsync.serve(app, sock=listener, workers=workers)
+    else:
+        from werkzeug.serving import make_server
+        host, port = listener.getsockname()[:2]
+        make_server(host, port, app, threaded=True, fd=listener.fileno()).serve_forever()
+
+def runPrefork(host, port, processes, server=None, workers=None):
+    """Modo prefork: `processes` procesos aceptan conexiones del mismo socket y
+    comparten el estado a través de STATE_DB.
+
+    Este proceso no atiende peticiones: sigue el log, lo compacta y expulsa a
+    los peers vencidos, para que esas tareas corran una sola vez.
+    """
+    global store, shared
+    listener = socket.create_server((host, port), backlog=4096)
+    # Los hijos se crean antes de abrir la base de datos y de lanzar hilos
+    children = [multiprocessing.Process(target=serveWorker, daemon=True,
+                                        args=(listener, index, server or SERVER, workers or WORKERS))
+                for index in range(processes)]
+    for child in children:
+        child.start()
+    store = TrackerStore(STATE_DB)
+    shared = True
+    shareVersions()
+    recoverState()
+    store.compactEvery(COMPACT_INTERVAL)
+    threading.Thread(target=syncLoop, daemon=True).start()
+    threading.Thread(target=sweeperLoop, daemon=True).start()
+    print(f"[Tracker] {processes} procesos atendiendo en {host}:{port}")
+    try:
+        for child in children:
+            child.join()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for child in children:
+            child.terminate()
+
 if __name__ == '__main__':
     print("\n" + "="*50)
     print("TRACKER P2P INICIADO CON REANUDACIÓN MEJORADA")
-    print(f"IP: 192.168.1.68")
-    print(f"Puerto: 5000")
+    print(f"IP: {HOST}")
+    print(f"Puerto: {PORT}")
     print("="*50 + "\n")
-    app.run(port=5000, host="192.168.1.68", debug=True, threaded=True)
+    if PROCESSES > 1:
+        if STATE_DB:
+            runPrefork(HOST, PORT, PROCESSES)
+            raise SystemExit
+        print("[Tracker] El modo prefork necesita TRACKER_STATE_DB; se usa un solo proceso")
+    if STATE_DB:
+        store = TrackerStore(STATE_DB)
+        recoverState()
+        store.compactEvery(COMPACT_INTERVAL)
+    threading.Thread(target=sweeperLoop, daemon=True).start()
+    if SERVER == "asyncio":
+        TrackerAsync.serve(app, host=HOST, port=PORT, workers=WORKERS)
+    else:
+        # Sin el recargador de Flask: su proceso padre también recuperaría el
+        # estado y su barredor expulsaría a todos los peers (no le llegan heartbeats)
+        app.run(port=PORT, host=HOST, debug=True, threaded=True, use_reloader=False)
@@ -0,0 +1,218 @@
+import asyncio
+import io
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import formatdate
+from urllib.parse import unquote_to_bytes
+
+# Límites por conexión y tiempo que una conexión keep-alive puede quedar ociosa
+MAX_HEADER_SIZE = 64 * 1024
+MAX_BODY_SIZE = 16 * 1024 * 1024
+KEEPALIVE_TIMEOUT = float(os.environ.get("TRACKER_KEEPALIVE_TIMEOUT", 75))
+
+REASONS = {400: "Bad Request", 413: "Payload Too Large", 431: "Request Header Fields Too Large",
+           501: "Not Implemented"}
+
+
+class AsyncWSGIServer:
+    """Servidor HTTP/1.1 sobre asyncio para una aplicación WSGI (la app Flask del tracker).
+
+    Un único event loop mantiene abiertas todas las conexiones keep-alive, que
+    cuestan unos pocos KB cada una en lugar de un hilo del sistema. Las vistas
+    de Flask son síncronas, así que se ejecutan en un pool de hilos de tamaño
+    fijo; el loop sólo lee peticiones y escribe respuestas.
+    """
+
+    def __init__(self, app, host=None, port=None, workers=None, sock=None):
+        self.app = app
+        self.host = host
+        self.port = port
+        self.sock = sock
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tracker")
+        self.server = None
+        self._date = (0, "")
+
+    def date(self):
+        # El encabezado Date sólo cambia una vez por segundo
+        now = int(time.time())
+        if self._date[0] != now:
+            self._date = (now, formatdate(now, usegmt=True))
+        return self._date[1]
+
+    async def start(self):
+        if self.sock is not None:
+            # Socket ya abierto, por ejemplo compartido entre procesos en modo prefork
+            self.server = await asyncio.start_server(self.handle, sock=self.sock, limit=MAX_HEADER_SIZE)
+        else:
+            self.server = await asyncio.start_server(self.handle, self.host, self.port,
+                                                     limit=MAX_HEADER_SIZE, backlog=4096)
+        self.host, self.port = self.server.sockets[0].getsockname()[:2]
+        return self.server
+
+    async def serveForever(self):
+        await self.start()
+        print(f"[Tracker] Servidor asyncio escuchando en {self.host}:{self.port}")
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def handle(self, reader, writer):
+        loop = asyncio.get_running_loop()
+        peer = writer.get_extra_info("peername") or ("", 0)
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), KEEPALIVE_TIMEOUT)
+                except asyncio.LimitOverrunError:
+                    await self.sendError(writer, 431)
+                    break
+                except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+                    break
+
+                request = parseHead(head)
+                if request is None:
+                    await self.sendError(writer, 400)
+                    break
+                method, target, version, headers = request
+                if "chunked" in headers.get("transfer-encoding", "").lower():
+                    await self.sendError(writer, 501)
+                    break
+                try:
+                    length = int(headers.get("content-length") or 0)
+                except ValueError:
+                    await self.sendError(writer, 400)
+                    break
+                if length < 0 or length > MAX_BODY_SIZE:
+                    await self.sendError(writer, 413)
+                    break
+                if headers.get("expect", "").lower() == "100-continue":
+                    writer.write(b"HTTP/1.1 100 Continue\r\n\r\n")
+                try:
+                    body = await reader.readexactly(length) if length else b""
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+
+                connection = headers.get("connection", "").lower()
+                if version == "HTTP/1.1":
+                    keepAlive = "close" not in connection
+                else:
+                    keepAlive = "keep-alive" in connection
+
+                environ = self.environ(method, target, version, headers, body, peer)
+                status, responseHeaders, payload = await loop.run_in_executor(self.pool, self.callApp, environ)
+                writer.write(self.responseHead(status, responseHeaders, payload, version, keepAlive))
+                if method != "HEAD":
+                    writer.write(payload)
+                await writer.drain()
+                if not keepAlive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    def environ(self, method, target, version, headers, body, peer):
+        path, _, query = target.partition("?")
+        environ = {
+            "REQUEST_METHOD": method,
+            "SCRIPT_NAME": "",
+            "PATH_INFO": unquote_to_bytes(path).decode("latin-1"),
+            "QUERY_STRING": query,
+            "SERVER_NAME": self.host,
+            "SERVER_PORT": str(self.port),
+            "SERVER_PROTOCOL": version,
+            "REMOTE_ADDR": peer[0],
+            "REMOTE_PORT": str(peer[1]),
+            "wsgi.version": (1, 0),
+            "wsgi.url_scheme": "http",
+            "wsgi.input": io.BytesIO(body),
+            "wsgi.errors": sys.stderr,
+            "wsgi.multithread": True,
+            "wsgi.multiprocess": False,
+            "wsgi.run_once": False,
+        }
+        for name, value in headers.items():
+            if name == "content-type":
+                environ["CONTENT_TYPE"] = value
+            elif name == "content-length":
+                environ["CONTENT_LENGTH"] = value
+            else:
+                environ["HTTP_" + name.upper().replace("-", "_")] = value
+        return environ
+
+    def callApp(self, environ):
+        """Ejecuta la app WSGI (en un hilo del pool) y junta la respuesta completa"""
+        started = []
+        chunks = []
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info and started:
+                raise exc_info[1].with_traceback(exc_info[2])
+            started[:] = [status, headers]
+            return chunks.append
+
+        result = self.app(environ, start_response)
+        try:
+            for chunk in result:
+                chunks.append(chunk)
+        finally:
+            if hasattr(result, "close"):
+                result.close()
+        return started[0], started[1], b"".join(chunks)
+
+    def responseHead(self, status, headers, payload, version, keepAlive):
+        lines = [f"HTTP/1.1 {status}"]
+        hasLength = False
+        for name, value in headers:
+            lowered = name.lower()
+            if lowered == "connection":
+                continue
+            hasLength = hasLength or lowered == "content-length"
+            lines.append(f"{name}: {value}")
+        if not hasLength:
+            lines.append(f"Content-Length: {len(payload)}")
+        lines.append(f"Date: {self.date()}")
+        if not keepAlive:
+            lines.append("Connection: close")
+        elif version != "HTTP/1.1":
+            lines.append("Connection: keep-alive")
+        return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+    async def sendError(self, writer, code):
+        message = REASONS[code].encode("latin-1")
+        writer.write(f"HTTP/1.1 {code} {REASONS[code]}\r\nContent-Length: {len(message)}\r\n"
+                     f"Connection: close\r\n\r\n".encode("latin-1") + message)
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+
+
+def parseHead(head):
+    """Separa línea de petición y encabezados. Devuelve None si está mal formada"""
+    lines = head.decode("latin-1").split("\r\n")
+    parts = lines[0].split(" ")
+    if len(parts) != 3 or not parts[2].startswith("HTTP/"):
+        return None
+    method, target, version = parts
+    headers = {}
+    for line in lines[1:]:
+        if not line:
+            continue
+        name, separator, value = line.partition(":")
+        if not separator:
+            return None
+        name = name.strip().lower()
+        value = value.strip()
+        headers[name] = f"{headers[name]}, {value}" if name in headers else value
+    return method, target, version, headers
+
+
+def serve(app, host=None, port=None, workers=None, sock=None):
+    """Sirve la app con asyncio hasta que se interrumpa el proceso"""
+    server = AsyncWSGIServer(app, host, port, workers, sock)
+    try:
+        asyncio.run(server.serveForever())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,203 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+
+class TrackerStore:
+    """Persistencia del estado del tracker en SQLite (modo WAL).
+
+    El estado se guarda como registros (tipo, IP, nombre) -> (valor JSON,
+    bytes opcionales para bitfields). Cada cambio se agrega al final de la
+    tabla `log` con el valor completo del registro, o NULL si se borró.
+    `compact()` vuelca la última versión de cada registro a la tabla `state`,
+    que es la instantánea compactada, y trunca el log. Al arrancar se lee la
+    instantánea y luego se reaplica lo que quede en el log.
+
+    Varios procesos pueden compartir el archivo: cada uno sigue el log con
+    `tail()` a partir del último número de secuencia que aplicó y lo anota con
+    `markApplied()`. La compactación no pasa del menor de esos números, salvo
+    el de un proceso que lleva READER_TIMEOUT segundos sin anotar nada.
+    """
+
+    READER_TIMEOUT = 300
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.RLock()
+        self.depth = 0
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        # En modo WAL, NORMAL sólo sincroniza a disco en los checkpoints
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS state (
+                kind TEXT NOT NULL,
+                ip TEXT NOT NULL,
+                name TEXT NOT NULL,
+                value TEXT,
+                data BLOB,
+                PRIMARY KEY (kind, ip, name)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS log (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                ip TEXT NOT NULL,
+                name TEXT NOT NULL,
+                value TEXT,
+                data BLOB
+            );
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value INTEGER
+            );
+            CREATE TABLE IF NOT EXISTS readers (
+                reader TEXT PRIMARY KEY,
+                seq INTEGER NOT NULL,
+                updated REAL NOT NULL
+            );
+        """)
+
+    def put(self, kind, ip, name, value, data=None):
+        """Agrega la nueva versión de un registro al log (None = borrado)"""
+        encoded = None if value is None else json.dumps(value, separators=(",", ":"))
+        with self.lock:
+            return self.conn.execute(
+                "INSERT INTO log (kind, ip, name, value, data) VALUES (?, ?, ?, ?, ?)",
+                (kind, ip, name, encoded, data)).lastrowid
+
+    @contextmanager
+    def transaction(self):
+        """Transacción de escritura (BEGIN IMMEDIATE): ningún otro proceso escribe
+        en el log hasta que termine. Anidada dentro de otra no hace nada."""
+        with self.lock:
+            if self.depth:
+                self.depth += 1
+                try:
+                    yield
+                finally:
+                    self.depth -= 1
+                return
+            self.conn.execute("BEGIN IMMEDIATE")
+            self.depth = 1
+            try:
+                yield
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            else:
+                self.conn.execute("COMMIT")
+            finally:
+                self.depth = 0
+
+    @contextmanager
+    def _reading(self):
+        # Dentro de una transacción de escritura ya se ve lo último confirmado;
+        # si no, una transacción de lectura da una foto consistente del archivo
+        with self.lock:
+            if self.depth:
+                yield
+                return
+            self.conn.execute("BEGIN")
+            try:
+                yield
+            finally:
+                self.conn.execute("COMMIT")
+
+    def _compactedUpTo(self):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'compacted'").fetchone()
+        return row[0] if row else 0
+
+    def load(self):
+        """Devuelve ([(tipo, IP, nombre, valor, bytes)], secuencia) con el estado más
+        reciente y el número de secuencia hasta el que llega"""
+        with self._reading():
+            # El log (lo escrito desde la última compactación) es chico: su
+            # última versión de cada registro reemplaza a la de la instantánea
+            seq = self._compactedUpTo()
+            latest = {}
+            for logSeq, kind, ip, name, value, data in self.conn.execute(
+                    "SELECT seq, kind, ip, name, value, data FROM log ORDER BY seq"):
+                seq = logSeq
+                latest[(kind, ip, name)] = (kind, ip, name, value, data)
+            rows = self.conn.execute("SELECT kind, ip, name, value, data FROM state").fetchall()
+        if latest:
+            rows = [row for row in rows if row[:3] not in latest]
+            rows.extend(row for row in latest.values() if row[3] is not None)
+        # Un solo json.loads sobre todos los valores es mucho más rápido que
+        # decodificar cien mil documentos pequeños por separado
+        values = json.loads("[" + ",".join([row[3] for row in rows]) + "]")
+        return [(kind, ip, name, value, data)
+                for (kind, ip, name, _, data), value in zip(rows, values)], seq
+
+    def tail(self, afterSeq):
+        """Entradas del log posteriores a `afterSeq`: [(secuencia, tipo, IP, nombre, valor, bytes)].
+
+        Devuelve None si la compactación ya borró entradas que el llamador no
+        aplicó; en ese caso hay que volver a cargar todo con `load()`.
+        """
+        with self._reading():
+            if self._compactedUpTo() > afterSeq:
+                return None
+            rows = self.conn.execute("SELECT seq, kind, ip, name, value, data FROM log WHERE seq > ? ORDER BY seq",
+                                     (afterSeq,)).fetchall()
+        return [(seq, kind, ip, name, None if value is None else json.loads(value), data)
+                for seq, kind, ip, name, value, data in rows]
+
+    def epoch(self):
+        """Número al azar que identifica a esta base de datos, el mismo para
+        todos los procesos que la comparten"""
+        with self.lock:
+            self.conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('epoch', ?)",
+                              (int.from_bytes(os.urandom(4), "big"),))
+            return self.conn.execute("SELECT value FROM meta WHERE key = 'epoch'").fetchone()[0]
+
+    def markApplied(self, reader, seq):
+        """Anota hasta qué entrada del log aplicó el proceso `reader`"""
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO readers (reader, seq, updated) VALUES (?, ?, ?)",
+                              (reader, seq, time.time()))
+
+    def compact(self):
+        """Vuelca el log a la instantánea y lo trunca hasta donde lo aplicaron
+        todos los procesos vivos. Devuelve cuántas entradas compactó"""
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                upTo = self.conn.execute("SELECT MAX(seq) FROM log").fetchone()[0]
+                slowest = self.conn.execute("SELECT MIN(seq) FROM readers WHERE updated >= ?",
+                                            (time.time() - self.READER_TIMEOUT,)).fetchone()[0]
+                if slowest is not None and upTo is not None:
+                    upTo = min(upTo, slowest)
+                if upTo is None or upTo <= self._compactedUpTo():
+                    self.conn.execute("COMMIT")
+                    return 0
+                self.conn.execute("""
+                    INSERT OR REPLACE INTO state (kind, ip, name, value, data)
+                    SELECT kind, ip, name, value, data FROM log
+                    WHERE seq IN (SELECT MAX(seq) FROM log WHERE seq <= ? GROUP BY kind, ip, name)
+                """, (upTo,))
+                self.conn.execute("DELETE FROM state WHERE value IS NULL")
+                compacted = self.conn.execute("DELETE FROM log WHERE seq <= ?", (upTo,)).rowcount
+                self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('compacted', ?)", (upTo,))
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("PRAGMA wal_checkpoint(PASSIVE)")
+        return compacted
+
+    def compactEvery(self, interval):
+        """Lanza un hilo que compacta el log periódicamente"""
+        def loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    compacted = self.compact()
+                    if compacted:
+                        print(f"[TrackerStore] Log compactado: {compacted} entradas")
+                except Exception as e:
+                    print(f"[TrackerStore] Error al compactar: {e}")
+        threading.Thread(target=loop, daemon=True).start()
@@ -0,0 +1,222 @@
+import socket
+import struct
+
+# Codificación binaria compacta para las llamadas entre nodos y trackers.
+# Es MessagePack: si el paquete msgpack está instalado se usa su extensión en
+# C; si no, el subconjunto de abajo (nil, bool, enteros, float, str, bytes,
+# listas y mapas), que produce y entiende los mismos bytes.
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+CONTENT_TYPE = "application/x-msgpack"
+JSON_TYPE = "application/json"
+
+
+def packb(value):
+    """Codifica un valor (dict/list/str/bytes/int/float/bool/None)"""
+    if msgpack is not None:
+        return msgpack.packb(value, use_bin_type=True)
+    out = bytearray()
+    _pack(value, out)
+    return bytes(out)
+
+
+def unpackb(data):
+    if msgpack is not None:
+        return msgpack.unpackb(data, raw=False, strict_map_key=False)
+    value, offset = _unpack(bytes(data), 0)
+    if offset != len(data):
+        raise ValueError("Datos sobrantes después del valor codificado")
+    return value
+
+
+def packPeer(ip, port):
+    """Entrada compacta de un peer, como en los trackers de BitTorrent: 4 bytes
+    de IPv4 y 2 de puerto. Las direcciones que no son IPv4 quedan como texto"""
+    try:
+        return socket.inet_aton(ip) + struct.pack(">H", port) if ip.count(".") == 3 else ip
+    except (OSError, struct.error):
+        return ip
+
+
+def unpackPeer(entry):
+    """(IP, puerto) de una entrada de peer; puerto None si venía como texto"""
+    if isinstance(entry, (bytes, bytearray)) and len(entry) == 6:
+        return socket.inet_ntoa(entry[:4]), struct.unpack(">H", entry[4:])[0]
+    return entry, None
+
+
+def _pack(value, out):
+    kind = type(value)
+    if kind is int:
+        _packInt(value, out)
+    elif kind is str:
+        data = value.encode("utf-8")
+        length = len(data)
+        if length < 32:
+            out.append(0xA0 | length)
+        elif length < 0x100:
+            out += b"\xd9" + bytes((length,))
+        elif length < 0x10000:
+            out += b"\xda" + struct.pack(">H", length)
+        else:
+            out += b"\xdb" + struct.pack(">I", length)
+        out += data
+    elif kind is dict:
+        length = len(value)
+        if length < 16:
+            out.append(0x80 | length)
+        elif length < 0x10000:
+            out += b"\xde" + struct.pack(">H", length)
+        else:
+            out += b"\xdf" + struct.pack(">I", length)
+        for key, item in value.items():
+            _pack(key, out)
+            _pack(item, out)
+    elif kind is list or kind is tuple:
+        length = len(value)
+        if length < 16:
+            out.append(0x90 | length)
+        elif length < 0x10000:
+            out += b"\xdc" + struct.pack(">H", length)
+        else:
+            out += b"\xdd" + struct.pack(">I", length)
+        # Las listas de segmentos son el caso común: los enteros de hasta 16 bits
+        # se escriben aquí mismo, sin pasar por _pack
+        for item in value:
+            if type(item) is int and 0 <= item < 0x10000:
+                if item < 0x80:
+                    out.append(item)
+                elif item < 0x100:
+                    out.append(0xCC)
+                    out.append(item)
+                else:
+                    out += (0xCD0000 | item).to_bytes(3, "big")
+            else:
+                _pack(item, out)
+    elif value is None:
+        out.append(0xC0)
+    elif kind is bool:
+        out.append(0xC3 if value else 0xC2)
+    elif kind is float:
+        out += b"\xcb" + struct.pack(">d", value)
+    elif kind is bytes or kind is bytearray or kind is memoryview:
+        length = len(value)
+        if length < 0x100:
+            out += b"\xc4" + bytes((length,))
+        elif length < 0x10000:
+            out += b"\xc5" + struct.pack(">H", length)
+        else:
+            out += b"\xc6" + struct.pack(">I", length)
+        out += value
+    elif isinstance(value, int):
+        _packInt(int(value), out)
+    elif isinstance(value, (range, set, frozenset)):
+        _pack(list(value), out)
+    else:
+        raise TypeError(f"No se puede codificar un valor de tipo {kind.__name__}")
+
+
+def _packInt(value, out):
+    if 0 <= value < 0x80:
+        out.append(value)
+    elif -32 <= value < 0:
+        out.append(value & 0xFF)
+    elif value >= 0:
+        if value < 0x100:
+            out += b"\xcc" + bytes((value,))
+        elif value < 0x10000:
+            out += b"\xcd" + struct.pack(">H", value)
+        elif value < 0x100000000:
+            out += b"\xce" + struct.pack(">I", value)
+        else:
+            out += b"\xcf" + struct.pack(">Q", value)
+    elif value >= -0x80:
+        out += b"\xd0" + struct.pack(">b", value)
+    elif value >= -0x8000:
+        out += b"\xd1" + struct.pack(">h", value)
+    elif value >= -0x80000000:
+        out += b"\xd2" + struct.pack(">i", value)
+    else:
+        out += b"\xd3" + struct.pack(">q", value)
+
+
+# Formatos de tamaño fijo: byte -> (struct, tamaño)
+_FIXED = {
+    0xCA: (">f", 4), 0xCB: (">d", 8),
+    0xCC: (">B", 1), 0xCD: (">H", 2), 0xCE: (">I", 4), 0xCF: (">Q", 8),
+    0xD0: (">b", 1), 0xD1: (">h", 2), 0xD2: (">i", 4), 0xD3: (">q", 8),
+}
+# Longitudes de str (0xd9-0xdb), bin (0xc4-0xc6), listas (0xdc, 0xdd) y mapas (0xde, 0xdf)
+_LENGTHS = {0xD9: (">B", 1), 0xDA: (">H", 2), 0xDB: (">I", 4),
+            0xC4: (">B", 1), 0xC5: (">H", 2), 0xC6: (">I", 4),
+            0xDC: (">H", 2), 0xDD: (">I", 4), 0xDE: (">H", 2), 0xDF: (">I", 4)}
+
+
+def _unpack(data, offset):
+    code = data[offset]
+    offset += 1
+    if code < 0x80:
+        return code, offset
+    if code >= 0xE0:
+        return code - 0x100, offset
+    if code <= 0x8F:
+        return _unpackMap(data, offset, code & 0x0F)
+    if code <= 0x9F:
+        return _unpackList(data, offset, code & 0x0F)
+    if code <= 0xBF:
+        end = offset + (code & 0x1F)
+        return data[offset:end].decode("utf-8"), end
+    if code == 0xC0:
+        return None, offset
+    if code == 0xC2:
+        return False, offset
+    if code == 0xC3:
+        return True, offset
+    if code in _FIXED:
+        fmt, size = _FIXED[code]
+        return struct.unpack_from(fmt, data, offset)[0], offset + size
+    if code in _LENGTHS:
+        fmt, size = _LENGTHS[code]
+        length = struct.unpack_from(fmt, data, offset)[0]
+        offset += size
+        if code >= 0xDE:
+            return _unpackMap(data, offset, length)
+        if code >= 0xDC:
+            return _unpackList(data, offset, length)
+        end = offset + length
+        if code >= 0xD9:
+            return data[offset:end].decode("utf-8"), end
+        return data[offset:end], end
+    raise ValueError(f"Tipo MessagePack no soportado: 0x{code:02x}")
+
+
+def _unpackList(data, offset, length):
+    items = []
+    append = items.append
+    for _ in range(length):
+        # Enteros de hasta 16 bits (listas de segmentos) sin pasar por _unpack
+        code = data[offset]
+        if code < 0x80:
+            append(code)
+            offset += 1
+        elif code == 0xCD:
+            append(data[offset + 1] << 8 | data[offset + 2])
+            offset += 3
+        elif code == 0xCC:
+            append(data[offset + 1])
+            offset += 2
+        else:
+            item, offset = _unpack(data, offset)
+            append(item)
+    return items, offset
+
+
+def _unpackMap(data, offset, length):
+    result = {}
+    for _ in range(length):
+        key, offset = _unpack(data, offset)
+        result[key], offset = _unpack(data, offset)
+    return result, offset
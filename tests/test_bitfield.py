@@ -0,0 +1,43 @@
+import unittest
+
+from Bitfield import Bitfield
+
+
+class BitfieldTest(unittest.TestCase):
+
+    def test_roundtrip_sizes_not_multiple_of_8(self):
+        for size in (1, 7, 9, 15, 17, 100, 1001):
+            segments = list(range(0, size, 3)) + [size - 1]
+            bitfield = Bitfield(size)
+            bitfield.update(segments)
+            for decoded in (Bitfield.decode(size, bitfield.encode()), Bitfield.decode(size, bitfield.toBytes())):
+                self.assertEqual(decoded.present(), sorted(set(segments)))
+                self.assertEqual(len(decoded), len(set(segments)))
+                self.assertEqual(len(decoded.toBytes()), (size + 7) // 8)
+
+    def test_padding_bits_are_not_segments(self):
+        # 10 segmentos: los 6 bits bajos del segundo byte son relleno
+        bitfield = Bitfield(10, b"\xff\xff")
+        self.assertEqual(len(bitfield), 10)
+        self.assertEqual(bitfield.present(), list(range(10)))
+        self.assertTrue(bitfield.isComplete())
+        self.assertEqual(bitfield.toBytes(), b"\xff\xc0")
+
+    def test_missing_and_complete(self):
+        bitfield = Bitfield(13)
+        bitfield.update(range(12))
+        self.assertEqual(bitfield.missing(), [12])
+        self.assertFalse(bitfield.isComplete())
+        self.assertTrue(bitfield.set(12))
+        self.assertFalse(bitfield.set(12))
+        self.assertTrue(bitfield.isComplete())
+
+    def test_empty(self):
+        bitfield = Bitfield.decode(0, "")
+        self.assertEqual(len(bitfield), 0)
+        self.assertEqual(bitfield.present(), [])
+        self.assertFalse(bitfield.isComplete())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+import threading
+
+from werkzeug.serving import make_server
+
+import Node
+import Tracker
+from HashRing import HashRing
+from tests.test_tracker import TrackerTestCase, announce
+
+
+class CatalogSyncTest(TrackerTestCase):
+    """El catálogo local del nodo contra un tracker real: 304 si no cambió
+    nada y sólo lo que cambió (?since=) si cambió algo"""
+
+    def setUp(self):
+        super().setUp()
+        self.server = make_server("127.0.0.1", 0, Tracker.app, threaded=True)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+        ring, http_request = Node.tracker_ring, Node.http_request
+        self.addCleanup(setattr, Node, "tracker_ring", ring)
+        self.addCleanup(setattr, Node, "http_request", http_request)
+        self.addCleanup(Node.catalog_cache.clear)
+        Node.tracker_ring = HashRing([f"127.0.0.1:{self.server.server_port}"])
+        Node.catalog_cache.clear()
+
+        # Se registran las respuestas del tracker para ver qué envió
+        self.responses = []
+        def recording(method, url, **kwargs):
+            response = http_request(method, url, **kwargs)
+            self.responses.append(response)
+            return response
+        Node.http_request = recording
+
+    def test_unchanged_catalog_is_a_304(self):
+        announce(self.client, "10.0.0.1", "a.bin")
+        self.assertEqual(Node.search_files(), (["a.bin"], None, 1))
+        self.assertEqual(Node.search_files(), (["a.bin"], None, 1))
+        self.assertEqual([response.status_code for response in self.responses], [200, 304])
+
+    def test_changes_arrive_as_a_delta(self):
+        announce(self.client, "10.0.0.1", "a.bin")
+        announce(self.client, "10.0.0.2", "b.bin")
+        self.assertEqual(Node.search_files()[0], ["a.bin", "b.bin"])
+        Tracker.removePeer("10.0.0.1")
+        announce(self.client, "10.0.0.3", "c.bin")
+        self.assertEqual(Node.search_files(limit=1), (["b.bin"], "b.bin", 2))
+        self.assertEqual(Node.search_files(cursor="b.bin", limit=1), (["c.bin"], None, 2))
+        delta = self.responses[1].json()
+        self.assertFalse(delta["full"])
+        self.assertEqual(delta["Files"], ["c.bin"])
+        self.assertEqual(delta["removed"], ["a.bin"])
+        self.assertEqual(self.responses[2].status_code, 304)
+
+        peers = Node.sync_catalog(Node.tracker_url(), "peers")
+        self.assertEqual(set(peers), {"10.0.0.2", "10.0.0.3"})
@@ -0,0 +1,41 @@
+import unittest
+
+from HashRing import HashRing
+
+
+class HashRingTest(unittest.TestCase):
+
+    def test_adding_a_node_only_moves_keys_to_it(self):
+        keys = [f"archivo-{i}.bin" for i in range(2000)]
+        ring = HashRing(["a", "b", "c"])
+        before = {key: ring.owner(key) for key in keys}
+        ring.add("d")
+        moved = [key for key in keys if ring.owner(key) != before[key]]
+        self.assertTrue(all(ring.owner(key) == "d" for key in moved))
+        # Más o menos 1/4 de las claves pasa al nodo nuevo
+        self.assertLess(abs(len(moved) / len(keys) - 0.25), 0.1)
+
+    def test_removing_a_node_only_moves_its_keys(self):
+        keys = [f"archivo-{i}.bin" for i in range(2000)]
+        ring = HashRing(["a", "b", "c"])
+        before = {key: ring.owner(key) for key in keys}
+        ring.remove("b")
+        for key in keys:
+            if before[key] != "b":
+                self.assertEqual(ring.owner(key), before[key])
+            else:
+                self.assertIn(ring.owner(key), ("a", "c"))
+
+    def test_owner_is_independent_of_insertion_order(self):
+        first = HashRing(["a", "b", "c"])
+        second = HashRing(["c", "a", "b"])
+        self.assertTrue(all(first.owner(f"k{i}") == second.owner(f"k{i}") for i in range(500)))
+
+    def test_empty_ring(self):
+        ring = HashRing()
+        self.assertIsNone(ring.owner("x"))
+        self.assertEqual(len(ring), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
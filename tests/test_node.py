@@ -0,0 +1,31 @@
+import os
+import unittest
+
+import Node
+import Wire
+
+
+class ExpandPeersTest(unittest.TestCase):
+
+    def test_only_peer_lists_are_expanded(self):
+        packed = Wire.packPeer("10.0.0.1", 5001)
+        bitfield = b"\xff\x00\xff\x00\xff\x00"
+        response = {
+            "information": {"peersAndLeechers": [{"IP": packed, "segments": [0, 1]}],
+                            "bitfield": bitfield},
+            "peers": [packed, "fe80::1"],
+            "Files": [{"fileName": "a.bin", "bitfield": bitfield}],
+        }
+        expanded = Node.expand_peers(response)
+        self.assertEqual(expanded["information"]["peersAndLeechers"], [{"IP": "10.0.0.1", "segments": [0, 1]}])
+        self.assertEqual(expanded["peers"], ["10.0.0.1", "fe80::1"])
+        self.assertEqual(expanded["information"]["bitfield"], bitfield)
+        self.assertEqual(expanded["Files"][0]["bitfield"], bitfield)
+
+    def test_default_encoding_follows_msgpack(self):
+        if "NODE_TRACKER_ENCODING" not in os.environ:
+            self.assertEqual(Node.TRACKER_ENCODING, "msgpack" if Wire.msgpack is not None else "json")
+
+
+if __name__ == "__main__":
+    unittest.main()
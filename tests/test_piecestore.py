@@ -0,0 +1,148 @@
+import os
+import tempfile
+import threading
+import unittest
+
+from PieceStore import PieceStore
+
+
+class PieceStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = os.path.join(self.directory.name, "archivo.bin.pieces")
+        self.target = os.path.join(self.directory.name, "archivo.bin")
+        # 3 piezas de 4 KB y una última de 1000 bytes
+        self.data = os.urandom(3 * 4096 + 1000)
+
+    def piece(self, index):
+        return self.data[index * 4096:(index + 1) * 4096]
+
+    def test_write_mark_and_read(self):
+        store = PieceStore.create(self.path, 4, 4096, len(self.data))
+        self.addCleanup(store.close)
+        self.assertIsNone(store.read(1))
+        self.assertTrue(store.write(1, self.piece(1)))
+        self.assertFalse(store.write(1, self.piece(1)))
+        self.assertEqual(store.read(1), self.piece(1))
+        self.assertEqual(store.read(1, 100, 50), self.piece(1)[100:150])
+        # Un bloque escrito sin marcar no cuenta como presente
+        store.writeBlock(3, 0, self.piece(3))
+        self.assertIsNone(store.read(3))
+        self.assertTrue(store.mark(3))
+        self.assertEqual(store.read(3), self.piece(3))
+        self.assertEqual(store.missing(), [0, 2])
+        self.assertEqual(store.size(), 4096 + 1000)
+
+    def test_reopen_keeps_marked_pieces(self):
+        store = PieceStore.create(self.path, 4, 4096, len(self.data))
+        store.write(0, self.piece(0))
+        store.write(2, self.piece(2))
+        store.close()
+        self.assertTrue(PieceStore.exists(self.path))
+        reopened = PieceStore.open(self.path)
+        self.addCleanup(reopened.close)
+        self.assertEqual((reopened.numPieces, reopened.pieceSize, reopened.fileSize), (4, 4096, len(self.data)))
+        self.assertEqual(reopened.present(), [0, 2])
+        self.assertEqual(reopened.read(2), self.piece(2))
+
+    def test_finish_renames_into_a_seed(self):
+        store = PieceStore.create(self.path, 4, 4096, len(self.data))
+        with self.assertRaises(ValueError):
+            store.finish(self.target)
+        for index in range(4):
+            store.write(index, self.piece(index))
+        seed = store.finish(self.target)
+        self.addCleanup(seed.close)
+        with open(self.target, "rb") as f:
+            self.assertEqual(f.read(), self.data)
+        self.assertFalse(os.path.exists(self.path))
+        self.assertFalse(os.path.exists(self.path + ".bitfield"))
+        self.assertTrue(seed.inPlace)
+        self.assertTrue(seed.isComplete())
+        self.assertEqual(seed.read(3), self.piece(3))
+        with self.assertRaises(ValueError):
+            seed.write(0, self.piece(0))
+
+    def test_remove_keeps_the_original_of_a_seed(self):
+        with open(self.target, "wb") as f:
+            f.write(self.data)
+        seed = PieceStore.seed(self.target, 4096)
+        self.assertEqual(seed.numPieces, 4)
+        seed.remove()
+        self.assertTrue(os.path.exists(self.target))
+
+    def test_close_is_idempotent(self):
+        store = PieceStore.create(self.path, 4, 4096, len(self.data))
+        store.write(0, self.piece(0))
+        store.close()
+        store.close()
+        self.assertTrue(store.closed)
+        self.assertIsNone(store.fd)
+        self.assertIsNone(store.sidecarFd)
+        with self.assertRaises(ValueError):
+            store.read(0)
+        with self.assertRaises(ValueError):
+            store.write(1, self.piece(1))
+        with self.assertRaises(ValueError):
+            store.finish(self.target)
+
+    def test_finish_waits_for_readers(self):
+        store = PieceStore.create(self.path, 4, 4096, len(self.data))
+        for index in range(4):
+            store.write(index, self.piece(index))
+        finished = []
+        thread = threading.Thread(target=lambda: finished.append(store.finish(self.target)))
+        with store.using():
+            thread.start()
+            thread.join(0.2)
+            # Con una lectura en curso no se cierra ni se renombra
+            self.assertTrue(thread.is_alive())
+            self.assertFalse(os.path.exists(self.target))
+        thread.join()
+        self.addCleanup(finished[0].close)
+        self.assertTrue(store.closed)
+        self.assertEqual(finished[0].read(3), self.piece(3))
+
+    def test_concurrent_io_without_pread(self):
+        # Sin pread/pwrite (como en Windows) se usa lseek + read/write
+        saved = {name: getattr(os, name) for name in ("pread", "pwrite") if hasattr(os, name)}
+        for name in saved:
+            delattr(os, name)
+        self.addCleanup(lambda: [setattr(os, name, function) for name, function in saved.items()])
+        
+        pieces = 64
+        data = os.urandom(pieces * 4096)
+        store = PieceStore.create(self.path, pieces, 4096, len(data))
+        self.addCleanup(store.close)
+        for index in range(0, pieces, 2):
+            store.write(index, data[index * 4096:(index + 1) * 4096])
+        errors = []
+        
+        def writer(indexes):
+            for index in indexes:
+                for start in range(0, 4096, 512):
+                    store.writeBlock(index, start, data[index * 4096 + start:index * 4096 + start + 512])
+                store.mark(index)
+        
+        def reader():
+            for _ in range(20):
+                for index in range(0, pieces, 2):
+                    if store.read(index) != data[index * 4096:(index + 1) * 4096]:
+                        errors.append(index)
+        
+        threads = [threading.Thread(target=writer, args=(range(start, pieces, 8),)) for start in range(1, 8, 2)]
+        threads += [threading.Thread(target=reader) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertTrue(store.isComplete())
+        with open(self.path, "rb") as f:
+            self.assertEqual(f.read(), data)
+
+
+if __name__ == "__main__":
+    unittest.main()
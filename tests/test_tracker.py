@@ -0,0 +1,109 @@
+import unittest
+
+import Tracker
+
+
+def announce(client, ip, fileName, numSegments=8):
+    return client.post("/enterNetwork", json={"IP": ip, "Files": [
+        {"fileName": fileName, "numSegments": numSegments, "currentSegments": numSegments}]})
+
+
+class TrackerTestCase(unittest.TestCase):
+    """Tracker en memoria (sin STATE_DB) atendido con el cliente de prueba de Flask"""
+
+    def setUp(self):
+        Tracker.resetState()
+        Tracker.setShards([Tracker.SELF])
+        self.client = Tracker.app.test_client()
+
+    def tearDown(self):
+        Tracker.resetState()
+        Tracker.setShards([Tracker.SELF])
+
+
+class ShardingTest(TrackerTestCase):
+
+    def test_single_tracker_owns_everything(self):
+        self.assertTrue(all(Tracker.ownsFile(f"f{i}") for i in range(50)))
+
+    def test_ring_without_self_owns_nothing(self):
+        other = "10.9.9.9:5000"
+        announce(self.client, "10.0.0.1", "a.bin")
+        Tracker.setShards([other])
+        self.assertFalse(any(Tracker.ownsFile(f"f{i}") for i in range(50)))
+        response = self.client.post("/downloadFile", json={"fileName": "a.bin", "IP": "10.0.0.2"})
+        self.assertEqual(response.status_code, 421)
+        self.assertEqual(response.get_json()["owner"], other)
+
+    def test_shrinking_the_ring_hands_off_every_file(self):
+        other = "10.9.9.9:5000"
+        Tracker.setShards([Tracker.SELF, other])
+        names = [f"f{i}.bin" for i in range(40)]
+        for name in names:
+            if Tracker.ownsFile(name):
+                announce(self.client, "10.0.0.1", name)
+        held = sorted(Tracker.filesHeld())
+        self.assertTrue(held)
+        
+        sent = []
+        
+        class Response:
+            def raise_for_status(self):
+                pass
+        
+        def post(url, json, timeout):
+            sent.append((url, sorted(entry["fileName"] for entry in json["files"])))
+            return Response()
+        
+        session, Tracker.clusterSession.post = Tracker.clusterSession.post, post
+        try:
+            Tracker.setShards([other])
+            handed, errors = Tracker.handOff()
+        finally:
+            Tracker.clusterSession.post = session
+        self.assertEqual((handed, errors), (len(held), []))
+        self.assertEqual([url for url, _ in sent], [f"http://{other}/importFiles"])
+        self.assertEqual(sent[0][1], held)
+        self.assertEqual(sorted(Tracker.filesHeld()), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
+
+
+class SegmentBoundsTest(TrackerTestCase):
+
+    def test_out_of_range_segment_is_rejected(self):
+        announce(self.client, "10.0.0.1", "a.bin")
+        for segment in (8, -1, "3"):
+            response = self.client.post("/updateDownloadProgress", json={
+                "IP": "10.0.0.2", "fileName": "a.bin", "segment": segment, "total_segments": 8})
+            self.assertEqual(response.status_code, 400)
+
+    def test_ranges_are_clamped_and_capped(self):
+        announce(self.client, "10.0.0.1", "a.bin")
+        response = self.client.post("/updateDownloadProgressBatch", json={
+            "IP": "10.0.0.2", "fileName": "a.bin", "total_segments": 8, "ranges": [[6, 1 << 40]]})
+        self.assertEqual(response.status_code, 200)
+        response = self.client.post("/updateDownloadProgressBatch", json={
+            "IP": "10.0.0.2", "fileName": "a.bin", "total_segments": 8, "ranges": [[0, 8], [0, 8]]})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post("/syncFragments", json={
+            "IP": "10.0.0.3", "fileName": "b.bin", "total_segments": 1 << 40, "fragments": [0]})
+        self.assertEqual(response.status_code, 400)
+
+    def test_extra_bits_do_not_make_a_seeder(self):
+        announce(self.client, "10.0.0.1", "a.bin")
+        self.client.post("/enterNetwork", json={"IP": "10.0.0.2", "Files": []})
+        response = self.client.post("/updatePeers", json={"IP": "10.0.0.2", "fileName": "a.bin",
+                                                          "numSegments": 8, "have": [0, 1]})
+        self.assertEqual(response.status_code, 200)
+        response = self.client.post("/updatePeers", json={"IP": "10.0.0.2", "fileName": "a.bin",
+                                                          "haveRanges": [[8, 100]]})
+        self.assertEqual(response.status_code, 200)
+        response = self.client.post("/updatePeers", json={"IP": "10.0.0.2", "fileName": "a.bin", "have": [9]})
+        self.assertEqual(response.status_code, 400)
+        holder = Tracker.holdersOf("a.bin")["10.0.0.2"]
+        self.assertEqual(len(holder["bitfield"]), 2)
+        self.assertIn("10.0.0.1", Tracker.seederSample["a.bin"].slots)
+        self.assertNotIn("10.0.0.2", Tracker.seederSample["a.bin"].slots)
@@ -0,0 +1,68 @@
+import os
+import tempfile
+import unittest
+
+from TrackerStore import TrackerStore
+
+
+class TrackerStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "state.db")
+        self.stores = []
+
+    def tearDown(self):
+        for store in self.stores:
+            store.conn.close()
+        self.directory.cleanup()
+
+    def open(self):
+        store = TrackerStore(self.path)
+        self.stores.append(store)
+        return store
+
+    def test_load_merges_snapshot_and_log(self):
+        store = self.open()
+        for ip in ("a", "b", "c"):
+            store.put("peer", ip, "", {"v": 1})
+        store.compact()
+        store.put("peer", "a", "", None)
+        store.put("peer", "b", "", {"v": 2})
+        store.put("peer", "d", "", {"v": 1}, b"\x80")
+        records, seq = self.open().load()
+        self.assertEqual(seq, 6)
+        self.assertEqual(sorted((ip, value, data) for _, ip, _, value, data in records),
+                         [("b", {"v": 2}, None), ("c", {"v": 1}, None), ("d", {"v": 1}, b"\x80")])
+
+    def test_compaction_waits_for_a_lagging_reader(self):
+        writer, reader = self.open(), self.open()
+        for i in range(10):
+            writer.put("peer", f"ip{i}", "", {"i": i})
+        writer.markApplied("writer", 10)
+        reader.markApplied("reader", 4)
+        self.assertEqual(writer.compact(), 4)
+        # El lector atrasado todavía puede seguir el log desde donde quedó
+        self.assertEqual([seq for seq, *_ in reader.tail(4)], list(range(5, 11)))
+        reader.markApplied("reader", 10)
+        self.assertEqual(writer.compact(), 6)
+        self.assertEqual(reader.tail(10), [])
+
+    def test_stale_reader_does_not_block_compaction(self):
+        writer, reader = self.open(), self.open()
+        for i in range(5):
+            writer.put("peer", f"ip{i}", "", {"i": i})
+        reader.markApplied("reader", 1)
+        writer.conn.execute("UPDATE readers SET updated = 0")
+        self.assertEqual(writer.compact(), 5)
+        # Quien se quedó atrás más allá de la compactación debe recargar todo
+        self.assertIsNone(reader.tail(1))
+        records, seq = reader.load()
+        self.assertEqual((len(records), seq), (5, 5))
+
+    def test_epoch_is_shared(self):
+        self.assertEqual(self.open().epoch(), self.open().epoch())
+
+
+if __name__ == "__main__":
+    unittest.main()
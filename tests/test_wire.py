@@ -0,0 +1,51 @@
+import unittest
+
+import Wire
+
+
+class WireTest(unittest.TestCase):
+
+    def assertRoundtrip(self, value):
+        self.assertEqual(Wire.unpackb(Wire.packb(value)), value)
+
+    def test_ints_at_format_boundaries(self):
+        for value in (0, 0x7F, 0x80, 0xFF, 0x100, 0xFFFF, 0x10000, 0xFFFFFFFF, 0x100000000, 2 ** 64 - 1,
+                      -1, -32, -33, -128, -129, -0x8000, -0x8001, -0x80000000, -0x80000001, -2 ** 63):
+            self.assertRoundtrip(value)
+            # Dentro de una lista pasan por el camino rápido de enteros chicos
+            self.assertRoundtrip([value, value])
+
+    def test_strs_at_format_boundaries(self):
+        for length in (0, 31, 32, 0xFF, 0x100, 0xFFFF, 0x10000):
+            self.assertRoundtrip("a" * length)
+        self.assertRoundtrip("ñandú ✓")
+
+    def test_bytes_at_format_boundaries(self):
+        for length in (0, 1, 0xFF, 0x100, 0xFFFF, 0x10000):
+            self.assertRoundtrip(bytes(range(256)) * (length // 256) + bytes(length % 256))
+
+    def test_collections_at_format_boundaries(self):
+        for length in (0, 15, 16, 0xFFFF, 0x10000):
+            self.assertRoundtrip(list(range(length)))
+            self.assertRoundtrip({str(i): i for i in range(min(length, 0x10000))})
+
+    def test_nested_maps(self):
+        self.assertRoundtrip({
+            "IP": b"\x0a\x00\x00\x01\x13\x89",
+            "peers": [{"segments_to_download": [0, 200, 70000], "fileSize": 2 ** 40, "ratio": 0.5}],
+            "meta": {"ok": True, "missing": None, "nested": {"deep": [[], {}, ""]}},
+        })
+
+    def test_rejects_trailing_bytes(self):
+        with self.assertRaises(ValueError):
+            Wire.unpackb(Wire.packb(1) + b"\x00")
+
+    def test_compact_peer(self):
+        entry = Wire.packPeer("10.0.0.1", 5001)
+        self.assertEqual(len(entry), 6)
+        self.assertEqual(Wire.unpackPeer(entry), ("10.0.0.1", 5001))
+        self.assertEqual(Wire.unpackPeer(Wire.packPeer("::1", 5001)), ("::1", None))
+
+
+if __name__ == "__main__":
+    unittest.main()